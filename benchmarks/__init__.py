@@ -0,0 +1,7 @@
+'''Benchmarks over synthetic GeoLife-shaped GPS logs.
+
+Run from the root of the repository:
+
+    python -m benchmarks.synthetic -o /tmp/synthetic --points 1000000
+    python -m benchmarks.run --points 100000
+'''
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SYNOPSIS
+
+	python -m benchmarks.run [-h,--help] [-v,--verbose] [-n,--points N]
+	                         [-r,--repeat R] [-t,--tolerance T]
+	                         [--save-baseline]
+
+
+DESCRIPTION
+
+	Time each stage of staypoint extraction over a synthetic GeoLife-shaped
+	dataset and compare the timings against the baseline stored for the
+	same dataset size, exiting with an error if any stage regressed. The
+	staypoints extracted are compared as well, exiting with an error if
+	their number, trajectories, times or locations differ from those
+	recorded in the baseline, so that a speedup cannot change the results.
+
+	reader          iterate over every point of every .plt file
+	trajectories    split each user's points into GPSUser.trajectories
+	staypoints      StaypointBuilder.extract_staypoints() on each trajectory
+	kml             write each trajectory and its staypoints to a .kml file
+
+	Each benchmark is run --repeat times and its fastest run is kept. Even
+	so, the shorter stages vary by up to a third from run to run, hence
+	the default --tolerance of 50%. Baselines are only comparable on the
+	machine that recorded them.
+
+
+ARGUMENTS
+
+	-h, --help          show this help message and exit
+	-v, --verbose       verbose output
+	-n, --points        number of synthetic GPS records
+	-r, --repeat        number of times to run each benchmark
+	-t, --tolerance     fraction slower than the baseline a benchmark may be
+	--save-baseline     store the timings and staypoints as the new baseline
+
+
+AUTHOR
+
+	Doug McGeehan <djmvfb@mst.edu>
+
+
+LICENSE
+
+	Copyright 2017 Doug McGeehan - GNU GPLv3
+
+"""
+from gps2staypoint import config
+
+__appname__ = "gps2staypoint"
+__author__ = "Doug McGeehan"
+__version__ = "0.0pre0"
+__license__ = "GNU GPLv3"
+
+import logging
+# Kept apart from the package's loggers, whose per-file messages would drown
+# out the results
+logger = logging.getLogger('benchmarks')
+
+import argparse
+import collections
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
+
+from gps2staypoint import cli
+from gps2staypoint import discovery
+from gps2staypoint import staypoint
+from benchmarks import synthetic
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'baselines.json')
+# Degrees a staypoint's location may drift from its baseline, about a
+# centimeter, before it counts as a different staypoint
+LOCATION_TOLERANCE = 1e-7
+
+
+def main(args):
+    config.StayPointConfiguration.ENGINE = args.engine
+
+    directory = args.data_directory
+    if directory is None:
+        directory = tempfile.mkdtemp(prefix='synthetic_geolife_')
+    try:
+        if not discovery.find_plt_files(directory):
+            logger.info('Generating {} synthetic points in {}'.format(
+                args.points, directory
+            ))
+            synthetic.write_dataset(directory=directory,
+                                    points=args.points,
+                                    users=args.users,
+                                    seed=args.seed)
+
+        plt_files = discovery.find_plt_files(directory)
+        kml_directory = os.path.join(directory, 'kml')
+        results = collections.OrderedDict()
+        for name, benchmark in BENCHMARKS.items():
+            results[name] = run(benchmark, plt_files, kml_directory,
+                                repeat=args.repeat)
+            logger.info('{: <13} {: >8.3f}s {: >12.0f} points/s'.format(
+                name, results[name]['seconds'],
+                results[name]['points_per_second']
+            ))
+        staypoints = summarize_staypoints(plt_files)
+
+    finally:
+        if args.data_directory is None:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    key = baseline_key(args)
+    baselines = load_baselines(args.baselines)
+    baseline = baselines.get(key, {})
+    regressions = compare(results, baseline.get('results', {}),
+                          tolerance=args.tolerance)
+    differences = compare_staypoints(staypoints, baseline.get('staypoints'))
+
+    if args.save_baseline:
+        baselines[key] = {
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'results': results,
+            'staypoints': staypoints,
+        }
+        save_baselines(baselines, args.baselines)
+        logger.info('Saved baseline {} to {}'.format(key, args.baselines))
+        return 0
+
+    status = 0
+    if regressions:
+        logger.error('{} regressed by more than {:.0%}: {}'.format(
+            len(regressions), args.tolerance, ', '.join(regressions)
+        ))
+        status = 1
+    if differences:
+        for difference in differences:
+            logger.error(difference)
+        logger.error('The staypoints differ from the baseline')
+        status = 1
+    return status
+
+
+def run(benchmark, plt_files, kml_directory, repeat):
+    '''Run a benchmark on freshly discovered users, keeping the fastest of
+    several runs.
+    '''
+    fastest = None
+    for _ in range(repeat):
+        users = discovery.group_by_user(plt_files).values()
+        for user in users:
+            user.show_progress = False
+        seconds, points = benchmark(users, kml_directory)
+        if fastest is None or seconds < fastest:
+            fastest = seconds
+        shutil.rmtree(kml_directory, ignore_errors=True)
+
+    return {
+        'seconds': fastest,
+        'points': points,
+        'points_per_second': points / fastest if fastest else None,
+    }
+
+
+def time_reader(users, kml_directory):
+    points = 0
+    started = time.perf_counter()
+    for user in users:
+        for log in user.gps_logs:
+            for _ in log:
+                points += 1
+    return time.perf_counter() - started, points
+
+
+def time_trajectories(users, kml_directory):
+    points = 0
+    seconds = 0
+    for user in users:
+        started = time.perf_counter()
+        trajectories = list(user.trajectories)
+        seconds += time.perf_counter() - started
+        points += sum(len(t) for t in trajectories)
+    return seconds, points
+
+
+def time_staypoints(users, kml_directory):
+    builder_class = staypoint.STAYPOINT_BUILDERS[
+        config.StayPointConfiguration.ENGINE
+    ]
+    points = 0
+    seconds = 0
+    for user in users:
+        for trajectory in user.iter_trajectories():
+            started = time.perf_counter()
+            builder_class(trajectory=trajectory).extract_staypoints()
+            seconds += time.perf_counter() - started
+            points += len(trajectory)
+    return seconds, points
+
+
+def time_kml(users, kml_directory):
+    points = 0
+    seconds = 0
+    for user in users:
+        for trajectory in user.iter_trajectories():
+            trajectory.staypoints
+            started = time.perf_counter()
+            trajectory.write_to_kml(directory=kml_directory)
+            seconds += time.perf_counter() - started
+            points += len(trajectory)
+    return seconds, points
+
+
+BENCHMARKS = collections.OrderedDict([
+    ('reader', time_reader),
+    ('trajectories', time_trajectories),
+    ('staypoints', time_staypoints),
+    ('kml', time_kml),
+])
+
+
+def summarize_staypoints(plt_files):
+    '''The trajectory, location, arrival, departure and number of points of
+    every staypoint extracted from the dataset, in order.
+    '''
+    users = discovery.group_by_user(plt_files).values()
+    summary = []
+    for user in users:
+        user.show_progress = False
+        for trajectory in user.iter_trajectories():
+            for found in trajectory.staypoints:
+                summary.append([
+                    trajectory.id,
+                    found.average_latitude,
+                    found.average_longitude,
+                    found.arrival_seconds,
+                    found.departure_seconds,
+                    found.point_count,
+                ])
+    return summary
+
+
+def compare(results, baseline, tolerance):
+    '''Log each benchmark's change against its baseline, returning the
+    names of those that slowed down by more than the tolerance.
+    '''
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            logger.info('{: <13} no baseline'.format(name))
+            continue
+
+        ratio = result['seconds'] / baseline[name]['seconds']
+        logger.info('{: <13} {: >6.2f}x the baseline time'.format(name, ratio))
+        if ratio > 1 + tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def compare_staypoints(staypoints, baseline):
+    '''Describe every way the staypoints differ from their baseline, if one
+    was recorded.
+    '''
+    if baseline is None:
+        logger.info('{} staypoints, no baseline'.format(len(staypoints)))
+        return []
+    if len(staypoints) != len(baseline):
+        return ['{} staypoints instead of {}'.format(len(staypoints),
+                                                     len(baseline))]
+
+    differences = []
+    for found, expected in zip(staypoints, baseline):
+        moved = any(abs(coordinate - expected_coordinate) > LOCATION_TOLERANCE
+                    for coordinate, expected_coordinate
+                    in zip(found[1:3], expected[1:3]))
+        if moved or found[0] != expected[0] or found[3:] != expected[3:]:
+            differences.append(
+                'Staypoint {} at {:.7f},{:.7f} from {} to {} ({} points) '
+                'instead of {} at {:.7f},{:.7f} from {} to {} ({} points)'
+                .format(*(found + expected))
+            )
+    if not differences:
+        logger.info('{} staypoints, matching the baseline'.format(
+            len(staypoints)
+        ))
+    return differences
+
+
+def baseline_key(args):
+    return '{0.points}-points-{0.users}-users-seed-{0.seed}-{0.engine}'.format(
+        args
+    )
+
+
+def load_baselines(path):
+    try:
+        with open(path) as baselines_file:
+            return json.load(baselines_file)
+    except IOError:
+        return {}
+
+
+def save_baselines(baselines, path):
+    with open(path, 'w') as baselines_file:
+        json.dump(baselines, baselines_file, indent=2, sort_keys=True)
+        baselines_file.write('\n')
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(
+        description="Benchmark staypoint extraction on synthetic data."
+    )
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        default=False, help='verbose output')
+    parser.add_argument('-n', '--points', type=cli.positive_integer,
+                        help='number of synthetic GPS records '
+                             '(default: %(default)s)',
+                        default=100000)
+    parser.add_argument('-u', '--users', type=cli.positive_integer,
+                        help='number of synthetic users '
+                             '(default: %(default)s)',
+                        default=10)
+    parser.add_argument('--seed', type=int,
+                        help='random seed (default: %(default)s)',
+                        default=0)
+    parser.add_argument('-d', '--data-directory',
+                        help='reuse the synthetic dataset in this directory, '
+                             'generating it first if it is empty '
+                             '(default: a temporary directory)',
+                        default=None)
+    parser.add_argument('-e', '--engine',
+                        choices=sorted(staypoint.STAYPOINT_BUILDERS),
+                        help='staypoint extraction algorithm '
+                             '(default: %(default)s)',
+                        default=config.StayPointConfiguration.ENGINE)
+    parser.add_argument('-r', '--repeat', type=cli.positive_integer,
+                        help='runs of each benchmark (default: %(default)s)',
+                        default=3)
+    parser.add_argument('-t', '--tolerance', type=float,
+                        help='fraction slower than the baseline a benchmark '
+                             'may be before it counts as a regression '
+                             '(default: %(default)s)',
+                        default=0.5)
+    parser.add_argument('-b', '--baselines',
+                        help='JSON file of stored baselines '
+                             '(default: benchmarks/baselines.json)',
+                        default=BASELINES)
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store these timings and staypoints as the '
+                             'baseline for this dataset instead of comparing '
+                             'against it',
+                        default=False)
+
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == '__main__':
+    cli.run(main, get_arguments, logger, log_file=None)
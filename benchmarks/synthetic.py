@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SYNOPSIS
+
+	python -m benchmarks.synthetic [-h,--help] [-v,--verbose]
+	                               [-o,--output-directory DIRECTORY]
+	                               [-n,--points N] [-u,--users U]
+	                               [--points-per-file P] [--seed S]
+
+
+DESCRIPTION
+
+	Generate a tree of synthetic .plt files laid out and formatted like
+	the GeoLife dataset, with the same header, records sampled every 1 to
+	5 seconds, users alternating between dwelling in one place and
+	walking, cycling or driving, and occasional gaps long enough to split
+	a file into several trajectories.
+
+	The same arguments always generate the same files.
+
+
+ARGUMENTS
+
+	-h, --help              show this help message and exit
+	-v, --verbose           verbose output
+	-o, --output-directory  directory to create Data/<user>/Trajectory in
+	-n, --points            total number of GPS records
+	-u, --users             number of users to spread the records over
+	--points-per-file       number of GPS records in each .plt file
+	--seed                  seed of the random number generator
+
+
+AUTHOR
+
+	Doug McGeehan <djmvfb@mst.edu>
+
+
+LICENSE
+
+	Copyright 2017 Doug McGeehan - GNU GPLv3
+
+"""
+__appname__ = "gps2staypoint"
+__author__ = "Doug McGeehan"
+__version__ = "0.0pre0"
+__license__ = "GNU GPLv3"
+
+import logging
+logger = logging.getLogger('benchmarks')
+
+import argparse
+import calendar
+import datetime
+import math
+import os
+
+import numpy
+
+from gps2staypoint import cli
+from gps2staypoint.readers import timestamp
+
+HEADER = '\r\n'.join([
+    'Geolife trajectory',
+    'WGS 84',
+    'Altitude is in Feet',
+    'Reserved 3',
+    '0,2,255,My Track,0,0,2,8421376',
+    '0',
+]) + '\r\n'
+
+# Around the Haidian district of Beijing, where most GeoLife records are
+ORIGIN = (39.98, 116.32)
+SPREAD = 0.1
+START_TIME = datetime.datetime(2008, 10, 23, 2, 53, 4)
+METERS_PER_DEGREE = 111320
+
+# Seconds between consecutive records, and how often each occurs
+SAMPLING_INTERVALS = (1, 2, 5)
+SAMPLING_PROBABILITIES = (0.3, 0.2, 0.5)
+
+# (speed in meters per second, shortest and longest segment in minutes)
+MODES = {
+    'dwell': (0, 3, 60),
+    'walk': (1.4, 2, 30),
+    'bike': (4, 5, 30),
+    'drive': (12, 5, 40),
+}
+# Standard deviation of a dwelling user's GPS fixes, in meters
+DWELL_JITTER = 8
+# Chance of a gap after a segment, and its length in minutes. Gaps longer
+# than GPS_TRAJECTORY_TIME_INTERVAL_THRESHOLD split trajectories.
+GAP_PROBABILITY = 0.1
+GAP_MINUTES = (21, 180)
+# Hours between the end of one file and the start of the next
+FILE_GAP_HOURS = (2, 30)
+
+
+def main(args):
+    paths = write_dataset(directory=args.output_directory,
+                          points=args.points,
+                          users=args.users,
+                          points_per_file=args.points_per_file,
+                          seed=args.seed)
+    logger.info('Wrote {} points into {} files'.format(args.points,
+                                                       len(paths)))
+
+
+def write_dataset(directory, points, users=10, points_per_file=2000, seed=0):
+    '''Write a Data/<user>/Trajectory/<start>.plt tree of this many points,
+    returning the paths of the files written.
+    '''
+    random = numpy.random.RandomState(seed)
+    file_count = max(1, int(math.ceil(points / points_per_file)))
+    users = min(users, file_count)
+
+    paths = []
+    for user in range(users):
+        user_directory = os.path.join(directory, 'Data', '{:0>3}'.format(user),
+                                      'Trajectory')
+        os.makedirs(user_directory, exist_ok=True)
+        start = calendar.timegm(START_TIME.timetuple()) + user * 86400
+        home = (ORIGIN[0] + random.uniform(-SPREAD, SPREAD),
+                ORIGIN[1] + random.uniform(-SPREAD, SPREAD))
+
+        # Files are dealt out to users in turn
+        for file_index in range(user, file_count, users):
+            point_count = points // file_count \
+                          + (1 if file_index < points % file_count else 0)
+            columns = generate_points(random, point_count, start, home)
+            path = os.path.join(user_directory, '{}.plt'.format(
+                datetime.datetime.utcfromtimestamp(start).strftime(
+                    '%Y%m%d%H%M%S'
+                )
+            ))
+            write_plt(path, *columns)
+            paths.append(path)
+            logger.debug('{} points in {}'.format(point_count, path))
+
+            start = int(columns[-1][-1]) + 3600 * random.randint(
+                *FILE_GAP_HOURS
+            )
+
+    return paths
+
+
+def generate_points(random, point_count, start, origin):
+    '''Latitude, longitude, altitude (feet) and epoch second arrays of a
+    user alternating between dwelling and travelling.
+    '''
+    latitudes = numpy.empty(point_count)
+    longitudes = numpy.empty(point_count)
+    timestamps = numpy.empty(point_count, dtype=numpy.int64)
+
+    latitude, longitude = origin
+    time = start
+    mode_names = sorted(MODES)
+    i = 0
+    while i < point_count:
+        mode = mode_names[random.randint(len(mode_names))]
+        speed, shortest, longest = MODES[mode]
+        duration = random.uniform(shortest, longest) * 60
+        intervals = random.choice(SAMPLING_INTERVALS,
+                                  size=int(duration / 3) + 1,
+                                  p=SAMPLING_PROBABILITIES)
+        n = min(len(intervals), point_count - i)
+        intervals = intervals[:n]
+
+        if speed:
+            # Travel along a wandering heading at a noisy speed
+            headings = random.uniform(0, 2 * numpy.pi) \
+                       + numpy.cumsum(random.normal(0, 0.15, n))
+            steps = speed * intervals * random.uniform(0.5, 1.5, n)
+            north = numpy.cumsum(steps * numpy.cos(headings))
+            east = numpy.cumsum(steps * numpy.sin(headings))
+        else:
+            north = random.normal(0, DWELL_JITTER, n)
+            east = random.normal(0, DWELL_JITTER, n)
+
+        segment_latitudes = latitude + north / METERS_PER_DEGREE
+        segment_longitudes = longitude + east / (
+            METERS_PER_DEGREE * math.cos(math.radians(latitude))
+        )
+        latitudes[i:i + n] = segment_latitudes
+        longitudes[i:i + n] = segment_longitudes
+        timestamps[i:i + n] = time + numpy.cumsum(intervals)
+
+        i += n
+        time = int(timestamps[i - 1])
+        if speed:
+            latitude = segment_latitudes[-1]
+            longitude = segment_longitudes[-1]
+        if random.random_sample() < GAP_PROBABILITY:
+            time += 60 * random.randint(*GAP_MINUTES)
+
+    altitudes = random.randint(0, 300, point_count)
+    return latitudes, longitudes, altitudes, timestamps
+
+
+def write_plt(path, latitudes, longitudes, altitudes, timestamps):
+    day_fractions = timestamps / timestamp.SECONDS_PER_DAY \
+                    + timestamp.DAY_FRACTION_EPOCH_OFFSET
+    days, seconds = numpy.divmod(timestamps, timestamp.SECONDS_PER_DAY)
+    dates = {}
+    lines = []
+    for latitude, longitude, altitude, day_fraction, day, second in zip(
+            latitudes.tolist(), longitudes.tolist(), altitudes.tolist(),
+            day_fractions.tolist(), days.tolist(), seconds.tolist()):
+        if day not in dates:
+            dates[day] = datetime.datetime.utcfromtimestamp(
+                day * timestamp.SECONDS_PER_DAY
+            ).strftime('%Y-%m-%d')
+        lines.append('{:.6f},{:.6f},0,{},{:.10f},{},{:0>2}:{:0>2}:{:0>2}'
+                     '\r\n'.format(latitude, longitude, altitude,
+                                   day_fraction, dates[day], second // 3600,
+                                   second // 60 % 60, second % 60))
+
+    with open(path, 'w', newline='') as plt_file:
+        plt_file.write(HEADER)
+        plt_file.writelines(lines)
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(
+        description="Generate synthetic GeoLife-shaped .plt files."
+    )
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        default=False, help='verbose output')
+    parser.add_argument('-o', '--output-directory',
+                        help='directory to create Data/<user>/Trajectory in '
+                             '(default: %(default)s)',
+                        default=os.path.join('/tmp', 'synthetic_geolife'))
+    parser.add_argument('-n', '--points', type=cli.positive_integer,
+                        help='total number of GPS records '
+                             '(default: %(default)s)',
+                        default=100000)
+    parser.add_argument('-u', '--users', type=cli.positive_integer,
+                        help='number of users (default: %(default)s)',
+                        default=10)
+    parser.add_argument('--points-per-file', type=cli.positive_integer,
+                        help='GPS records in each .plt file '
+                             '(default: %(default)s)',
+                        default=2000)
+    parser.add_argument('--seed', type=int,
+                        help='random seed (default: %(default)s)',
+                        default=0)
+
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == '__main__':
+    cli.run(main, get_arguments, logger, log_file=None)
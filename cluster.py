@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SYNOPSIS
+
+	python cluster.py [-h,--help] [-v,--verbose] [-i,--input TABLE]
+	                  [--distances D1,D2,...] [-m,--min-points M]
+	                  [-o,--output NPZ]
+
+
+DESCRIPTION
+
+	Cluster the staypoints of every user, read from a staypoint table
+	written by process.py or extraction.py, into a hierarchy of shared
+	locations: one level of locations per distance, each level grouping
+	the locations of the one below.
+
+	The table is read a chunk at a time, but the coordinates of every
+	staypoint are clustered in memory, about 40 bytes a staypoint.
+
+
+ARGUMENTS
+
+	-h, --help          show this help message and exit
+	-v, --verbose       verbose output
+	-i, --input         .csv or .arrow staypoint table, or .parquet dataset
+	-f, --table-format  format of the staypoint table
+	--distances         comma-separated cluster distances in meters
+	-m, --min-points    staypoints near a staypoint for it to found a location
+	-o, --output        path of the .npz location hierarchy to write
+
+
+AUTHOR
+
+	Doug McGeehan <djmvfb@mst.edu>
+
+
+LICENSE
+
+	Copyright 2017 Doug McGeehan - GNU GPLv3
+
+"""
+from gps2staypoint import config
+
+__appname__ = "gps2staypoint"
+__author__ = "Doug McGeehan"
+__version__ = "0.0pre0"
+__license__ = "GNU GPLv3"
+
+import logging
+logger = logging.getLogger(__appname__)
+
+import argparse
+import os
+
+from gps2staypoint import cli
+from gps2staypoint import clustering
+from gps2staypoint import sweep
+from gps2staypoint.readers import table
+from gps2staypoint.writers.table import TABLE_WRITERS
+
+
+def main(args):
+    logger.info('Reading staypoints from {}'.format(args.input))
+    chunks = table.iter_column_chunks(args.input, format=args.table_format)
+    hierarchy = clustering.LocationHierarchy.from_chunks(
+        chunks,
+        distances=args.distances,
+        min_points=args.min_points
+    )
+
+    directory = os.path.dirname(args.output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    hierarchy.save(args.output)
+    logger.info('Saved {} levels of locations of {} staypoints to {}'.format(
+        len(hierarchy.levels), len(hierarchy), args.output
+    ))
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(
+        description="Cluster the staypoints of every user into a hierarchy "
+                    "of shared locations."
+    )
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        default=False, help='verbose output')
+    parser.add_argument('-i', '--input',
+                        help='staypoint table written by process.py --table '
+                             'or extraction.py (default: %(default)s)',
+                        default=os.path.join('/tmp', 'staypoints.csv'))
+    parser.add_argument('-f', '--table-format',
+                        choices=sorted(TABLE_WRITERS),
+                        help='format of the staypoint table (default: '
+                             'guessed from the path)',
+                        default=None)
+    parser.add_argument('--distances', type=sweep.parse_distances,
+                        help='comma-separated distances in meters, one level '
+                             'of locations each (default: {})'.format(
+                            ','.join(map(str,
+                                         config.LOCATION_CLUSTER_DISTANCES))
+                        ),
+                        default=list(config.LOCATION_CLUSTER_DISTANCES))
+    parser.add_argument('-m', '--min-points', type=cli.positive_integer,
+                        help='staypoints, itself included, within the '
+                             'smallest distance of a staypoint for it to '
+                             'found a location (default: %(default)s)',
+                        default=config.LOCATION_CLUSTER_MIN_POINTS)
+    parser.add_argument('-o', '--output',
+                        help='.npz file to write the location hierarchy to '
+                             '(default: %(default)s)',
+                        default=os.path.join('/tmp', 'locations.npz'))
+
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == '__main__':
+    cli.run(main, get_arguments, logger)
@@ -3,7 +3,7 @@
 """
 SYNOPSIS
 
-	python plt2staypoints.py [-h,--help] [-v,--verbose]
+	python extraction.py [-h,--help] [-v,--verbose] [-o,--output OUTPUT]
 
 
 DESCRIPTION
@@ -15,6 +15,8 @@ ARGUMENTS
 
 	-h, --help          show this help message and exit
 	-v, --verbose       verbose output
+	-o, --output        staypoint table to write (default: /tmp/staypoints.csv)
+	-f, --table-format  csv, arrow or parquet (default: csv)
 
 
 AUTHOR
@@ -55,15 +57,14 @@ import logging
 
 logger = logging.getLogger(__appname__)
 
-import csv
 import argparse
-import sys
 import os
-from datetime import datetime
 
-from gps2staypoint.readers.plt import PLTFileReader
-from gps2staypoint.staypoint import StayPointExtractor
-from gps2staypoint.writers.kml import StaypointKML
+from gps2staypoint import cli
+from gps2staypoint import config
+from gps2staypoint import discovery
+from gps2staypoint import pipeline
+from gps2staypoint.writers import table
 
 DEFAULT_GEOLIFE_DIRECTORY = os.path.join(
     os.path.expanduser('~'),
@@ -76,87 +77,31 @@ DEFAULT_GEOLIFE_DIRECTORY = os.path.join(
 
 def main(args):
     # Find raw GPS trajectory files
-    plt_files = []
-    for directory, subdirectories, filenames in os.walk(args.input_directory):
-        if 'StayPoint' in directory:
-            # Skip any files within the previously created StayPoint directory
-            continue
-
-        # Only consider .plt files
-        plt_files_within_directory = filter(lambda p: p.endswith('.plt'),
-                                            filenames)
-
-        # Prepend a file's directory to each filename
-        plt_file_paths = map(lambda p: os.path.join(directory, p),
-                             plt_files_within_directory)
-
-        plt_files.extend(plt_file_paths)
-
-    # Extract staypoints from each .plt file
-    plt_file_count = len(plt_files)
-    with progressbar.ProgressBar(max_value=plt_file_count) as progress:
-        # Iterate over each plt file
-        for i, plt_file_path in enumerate(plt_files, start=1):
-            logger.info(plt_file_path)
-            plt = PLTFileReader(path=plt_file_path)
-
-            # Extract the staypoints from the GPS trajectory of this file
-            staypoints = StayPointExtractor(trajectory=plt)
-
-            if staypoints:
-
-                # Write out staypoints to a new file
-                staypoint_file_path = plt_file_path.replace('Data', 'StayPoint')
-                os.makedirs(os.path.dirname(staypoint_file_path), exist_ok=True)
-
-                with open(staypoint_file_path, 'w+') as staypoint_file:
-                    staypoint_file_writer = csv.DictWriter(
-                        staypoint_file,
-                        fieldnames=staypoints.keys()
-                    )
-                    staypoint_file_writer.writeheader()
-                    staypoint_file_writer.writerows(staypoints.dict())
-
+    plt_files = discovery.find_plt_files(args.input_directory)
+    users = discovery.group_by_user(plt_files).values()
+
+    # Extract staypoints from each user's trajectories, writing them all to
+    # one table
+    with table.get_table_writer(args.table_format, args.output) as writer:
+        with progressbar.ProgressBar(max_value=len(users)) as progress:
+            for i, user in enumerate(users, start=1):
+                logger.info('User: #{}'.format(user.id))
+                user.show_progress = False
+                rows = []
+                results = pipeline.tabulate(
+                    pipeline.staypoints(user.iter_trajectories()),
+                    rows=rows
+                )
                 if args.kml:
-                    kml_file_path = staypoint_file_path.replace('.plt', '.kml')
-                    kml = StaypointKML(staypoints=staypoints,
-                                       raw_plt_file=plt_file_path)
-                    kml.save_to(path=kml_file_path)
-
-            logger.info('')
-            progress.update(i)
-
-
-def setup_logger(args):
-    logger.setLevel(logging.DEBUG)
-    # create file handler which logs even debug messages
-    # filename, or append to pre-existing log
-    log_file = os.path.join('/tmp', __appname__ + '.log')
-    fh = logging.FileHandler(log_file)
-    fh.setLevel(logging.DEBUG)
-    # create console handler with a higher log level
-    ch = logging.StreamHandler()
-
-    if args.verbose:
-        ch.setLevel(logging.DEBUG)
-    else:
-        ch.setLevel(logging.INFO)
-
-    # create formatter and add it to the handlers
-    line_numbers_and_function_name = logging.Formatter(
-        "%(levelname)s [%(filename)s:%(lineno)s - %(funcName)20s() ]"
-        " %(message)s")
-    fh.setFormatter(line_numbers_and_function_name)
-    ch.setFormatter(line_numbers_and_function_name)
-    # add the handlers to the logger
-    logger.addHandler(fh)
-    logger.addHandler(ch)
-
-
-def existing_directory(path):
-    assert os.path.isdir(path), 'The directory {} does not exist. ' \
-                                'Aborting.'.format(path)
-    return os.path.abspath(path)
+                    results = pipeline.write_kml(results,
+                                                 directory=args.kml_directory)
+
+                for _ in results:
+                    pass
+
+                writer.write(rows)
+                logger.info('')
+                progress.update(i)
 
 
 def get_arguments():
@@ -168,48 +113,30 @@ def get_arguments():
     # calling this with -v
     parser.add_argument('-v', '--verbose', action='store_true',
                         default=True, help='verbose output')
-    parser.add_argument('-i', '--input-directory', type=existing_directory,
+    parser.add_argument('-i', '--input-directory', type=cli.existing_directory,
                         help='directory containing .plt files',
-                        default=existing_directory(DEFAULT_GEOLIFE_DIRECTORY))
+                        default=DEFAULT_GEOLIFE_DIRECTORY)
+    parser.add_argument('-o', '--output',
+                        help='.csv or .arrow file, or .parquet dataset '
+                             'directory, to write staypoints to '
+                             '(default: %(default)s)',
+                        default=os.path.join('/tmp', 'staypoints.csv'))
+    parser.add_argument('-f', '--table-format',
+                        choices=sorted(table.TABLE_WRITERS),
+                        help='format of the staypoint table '
+                             '(default: %(default)s)',
+                        default=config.TABLE_FORMAT)
     parser.add_argument('--kml', action='store_true',
                         help='also create .kml files (default: False)',
-                        default=True)
+                        default=False)
+    parser.add_argument('--kml-directory',
+                        help='directory to save .kml files to '
+                             '(default: %(default)s)',
+                        default=os.path.join('/tmp', 'kmls'))
 
     args = parser.parse_args()
     return args
 
 
 if __name__ == '__main__':
-    try:
-        start_time = datetime.now()
-
-        args = get_arguments()
-        setup_logger(args)
-        logger.debug('Command-line arguments:')
-        for arg in vars(args):
-            value = getattr(args, arg)
-            logger.debug('\t{argument_key}:\t{value}'.format(argument_key=arg,
-                                                             value=value))
-
-        logger.debug(start_time)
-
-        main(args)
-
-        finish_time = datetime.now()
-        logger.debug(finish_time)
-        logger.debug('Execution time: {time}'.format(
-            time=(finish_time - start_time)
-        ))
-        logger.debug("#" * 20 + " END EXECUTION " + "#" * 20)
-
-        sys.exit(0)
-
-    except KeyboardInterrupt as e:  # Ctrl-C
-        raise e
-
-    except SystemExit as e:  # sys.exit()
-        raise e
-
-    except Exception as e:
-        logger.exception("Something happened and I don't know what to do D:")
-        sys.exit(1)
+    cli.run(main, get_arguments, logger)
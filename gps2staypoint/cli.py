@@ -0,0 +1,99 @@
+'''Boilerplate shared by the command-line scripts: argument types, logging
+set up from the --verbose flag, and running a script's main() with its
+execution time logged and its exit status returned to the shell.
+'''
+import argparse
+import datetime
+import logging
+import os
+import sys
+
+# Every script appends its debug log here, unless told not to
+LOG_FILE = os.path.join('/tmp', 'gps2staypoint.log')
+
+
+def setup_logger(logger, verbose, log_file=LOG_FILE):
+    logger.setLevel(logging.DEBUG)
+    line_numbers_and_function_name = logging.Formatter(
+        "%(levelname)s [%(filename)s:%(lineno)s - %(funcName)20s() ]"
+        " %(message)s")
+
+    # create file handler which logs even debug messages
+    # filename, or append to pre-existing log
+    if log_file is not None:
+        fh = logging.FileHandler(log_file)
+        fh.setLevel(logging.DEBUG)
+        fh.setFormatter(line_numbers_and_function_name)
+        logger.addHandler(fh)
+
+    # create console handler with a higher log level
+    ch = logging.StreamHandler()
+    if verbose:
+        ch.setLevel(logging.DEBUG)
+    else:
+        ch.setLevel(logging.INFO)
+    ch.setFormatter(line_numbers_and_function_name)
+    logger.addHandler(ch)
+
+
+def existing_directory(path):
+    assert os.path.isdir(path), 'The directory {} does not exist. ' \
+                                'Aborting.'.format(path)
+    return os.path.abspath(path)
+
+
+def positive_integer(value):
+    value = int(value)
+    if value < 1:
+        raise argparse.ArgumentTypeError(
+            '{} is not a positive integer'.format(value)
+        )
+    return value
+
+
+def non_negative_integer(value):
+    value = int(value)
+    if value < 0:
+        raise argparse.ArgumentTypeError(
+            '{} is not a non-negative integer'.format(value)
+        )
+    return value
+
+
+def run(main, get_arguments, logger, log_file=LOG_FILE):
+    '''Parse the command line, set up logging and call main(args), exiting
+    with the status main() returns, 0 if it returns None, or 1 if it raises.
+    '''
+    try:
+        start_time = datetime.datetime.now()
+
+        args = get_arguments()
+        setup_logger(logger, verbose=args.verbose, log_file=log_file)
+        logger.debug('Command-line arguments:')
+        for arg in vars(args):
+            value = getattr(args, arg)
+            logger.debug('\t{argument_key}:\t{value}'.format(argument_key=arg,
+                                                             value=value))
+
+        logger.debug(start_time)
+
+        status = main(args)
+
+        finish_time = datetime.datetime.now()
+        logger.debug(finish_time)
+        logger.debug('Execution time: {time}'.format(
+            time=(finish_time - start_time)
+        ))
+        logger.debug("#" * 20 + " END EXECUTION " + "#" * 20)
+
+        sys.exit(status)
+
+    except KeyboardInterrupt as e:  # Ctrl-C
+        raise e
+
+    except SystemExit as e:  # sys.exit()
+        raise e
+
+    except Exception as e:
+        logger.exception("Something happened and I don't know what to do D:")
+        sys.exit(1)
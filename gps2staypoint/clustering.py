@@ -0,0 +1,345 @@
+'''Clustering the staypoints of every user into a hierarchy of shared
+locations, as in Li et al.
+
+The first level is a DBSCAN over the staypoints themselves. Each further
+level clusters the centroids of the level below with a larger distance, so
+that every location falls within exactly one location of the next level.
+
+DBSCAN runs on a grid over earth-centred (ECEF) coordinates whose cells are
+eps / sqrt(3) wide, so that any two points sharing a cell are neighbours:
+* every point of a cell holding at least min_points points is a core point,
+  and only the points of sparser cells need their neighbours counted;
+* the core points of a cell all belong to the same cluster, so clusters are
+  the connected components of a graph of cells rather than of points, with
+  an edge between two nearby cells when any of their core points are
+  within eps of each other.
+Dense locations, where naive DBSCAN spends its quadratic time, are the
+cheapest part.
+'''
+import collections
+import itertools
+import logging
+import math
+
+import numpy
+from scipy import sparse
+from scipy import spatial as scipy_spatial
+from scipy.sparse import csgraph
+
+from gps2staypoint import config
+from gps2staypoint.spatial import ecef
+from gps2staypoint.utils.projection import EARTH_RADIUS
+
+logger = logging.getLogger(__name__)
+
+
+NOISE = -1
+# Cells whose core points are compared directly, rather than through a
+# KD-tree, when they hold at most this many pairs
+DIRECT_PAIR_LIMIT = 4096
+# Point pairs compared at once, bounding the memory that takes
+PAIR_BATCH_SIZE = 1 << 20
+# Offsets to every cell that may hold a neighbour of a point in the middle
+# cell (two cells away along an axis is still under eps), only one of each
+# pair of opposite offsets
+NEIGHBOUR_OFFSETS = [offset for offset in itertools.product(range(-2, 3),
+                                                            repeat=3)
+                     if offset > (0, 0, 0)]
+
+
+def grid_dbscan(points, eps, min_points):
+    '''DBSCAN cluster label of each of an (n, 3) array of ECEF coordinates,
+    NOISE for points in no cluster. min_points counts the point itself.
+
+    Border points reachable from several clusters join the cluster of
+    their nearest core point.
+    '''
+    points = numpy.asarray(points, dtype=numpy.float64)
+    labels = numpy.full(len(points), NOISE, dtype=numpy.int64)
+    if not len(points):
+        return labels
+
+    side = eps / math.sqrt(3)
+    grid = numpy.floor(points / side).astype(numpy.int64)
+    # Number the cells in a mixed radix, with room for the neighbour offsets
+    # on either side, so that a cell's neighbours are found by addition
+    grid -= grid.min(axis=0) - 2
+    spans = grid.max(axis=0) + 3
+    if float(spans[0]) * float(spans[1]) * float(spans[2]) >= 2 ** 62:
+        raise ValueError('eps of {} meters is too small for a grid over '
+                         'these points'.format(eps))
+    codes = (grid[:, 0] * spans[1] + grid[:, 1]) * spans[2] + grid[:, 2]
+    cells, cell_of, counts = numpy.unique(codes, return_inverse=True,
+                                          return_counts=True)
+
+    core = counts[cell_of] >= min_points
+    sparse_points = numpy.flatnonzero(~core)
+    if len(sparse_points):
+        tree = scipy_spatial.cKDTree(points)
+        neighbours = tree.query_ball_point(points[sparse_points], r=eps,
+                                           return_length=True)
+        core[sparse_points] = neighbours >= min_points
+
+    core_points = numpy.flatnonzero(core)
+    if not len(core_points):
+        return labels
+
+    # Core points grouped by cell
+    core_points = core_points[numpy.argsort(cell_of[core_points],
+                                            kind='mergesort')]
+    core_cells, first_core = numpy.unique(cell_of[core_points],
+                                          return_index=True)
+    stop_core = numpy.append(first_core[1:], len(core_points))
+
+    edges = _cell_edges(points, cells, core_cells, core_points, first_core,
+                        stop_core, spans, eps)
+    graph = sparse.coo_matrix(
+        (numpy.ones(len(edges[0]), dtype=numpy.int8), edges),
+        shape=(len(core_cells), len(core_cells))
+    )
+    _, components = csgraph.connected_components(graph, directed=False)
+
+    cell_components = numpy.full(len(cells), NOISE, dtype=numpy.int64)
+    cell_components[core_cells] = components
+    labels[core_points] = cell_components[cell_of[core_points]]
+
+    # Border points join the cluster of the nearest core point within reach
+    border = numpy.flatnonzero(~core)
+    if len(border):
+        core_tree = scipy_spatial.cKDTree(points[core_points])
+        distances, nearest = core_tree.query(points[border], k=1,
+                                             distance_upper_bound=eps)
+        reached = numpy.isfinite(distances)
+        labels[border[reached]] = labels[core_points[nearest[reached]]]
+
+    return labels
+
+
+def _cell_edges(points, cells, core_cells, core_points, first_core,
+                stop_core, spans, eps):
+    '''Pairs of positions in core_cells of nearby cells holding core points
+    within eps of each other.
+    '''
+    core_codes = cells[core_cells]
+    sources = []
+    targets = []
+    for dx, dy, dz in NEIGHBOUR_OFFSETS:
+        neighbour_codes = core_codes + (dx * spans[1] + dy) * spans[2] + dz
+        positions = numpy.searchsorted(core_codes, neighbour_codes)
+        positions = numpy.minimum(positions, len(core_codes) - 1)
+        found = numpy.flatnonzero(core_codes[positions] == neighbour_codes)
+        sources.append(found)
+        targets.append(positions[found])
+    sources = numpy.concatenate(sources)
+    targets = numpy.concatenate(targets)
+
+    sizes = stop_core - first_core
+    connected = numpy.zeros(len(sources), dtype=bool)
+
+    # Most pairs of cells hold few core points, and are compared point by
+    # point in bulk, a batch of point pairs at a time
+    pair_counts = sizes[sources] * sizes[targets]
+    small = numpy.flatnonzero(pair_counts <= DIRECT_PAIR_LIMIT)
+    batch_ends = numpy.cumsum(pair_counts[small]) // PAIR_BATCH_SIZE
+    for batch in numpy.split(small, numpy.flatnonzero(numpy.diff(batch_ends))
+                             + 1):
+        connected[batch] = _any_within(points, core_points, first_core,
+                                       sizes, sources[batch], targets[batch],
+                                       eps)
+
+    trees = {}
+    for i in numpy.flatnonzero(pair_counts > DIRECT_PAIR_LIMIT):
+        source = points[core_points[first_core[sources[i]]:
+                                    stop_core[sources[i]]]]
+        if targets[i] not in trees:
+            trees[targets[i]] = scipy_spatial.cKDTree(
+                points[core_points[first_core[targets[i]]:
+                                   stop_core[targets[i]]]]
+            )
+        distances, _ = trees[targets[i]].query(source, k=1,
+                                               distance_upper_bound=eps)
+        connected[i] = numpy.isfinite(distances).any()
+
+    return sources[connected], targets[connected]
+
+
+def _any_within(points, core_points, first_core, sizes, sources, targets,
+                eps):
+    '''Whether any core point of each source cell is within eps of any core
+    point of the matching target cell, comparing every pair of them.
+    '''
+    source_sizes = sizes[sources]
+    target_sizes = sizes[targets]
+    pair_counts = source_sizes * target_sizes
+    if not pair_counts.sum():
+        return numpy.zeros(len(sources), dtype=bool)
+
+    # Number the point pairs of every cell pair, and work out which core
+    # point of each cell every point pair is made of
+    cell_pairs = numpy.repeat(numpy.arange(len(sources)), pair_counts)
+    offsets = numpy.arange(len(cell_pairs)) \
+              - numpy.repeat(numpy.cumsum(pair_counts) - pair_counts,
+                             pair_counts)
+    source_points = core_points[first_core[sources][cell_pairs]
+                                + offsets // target_sizes[cell_pairs]]
+    target_points = core_points[first_core[targets][cell_pairs]
+                                + offsets % target_sizes[cell_pairs]]
+
+    differences = points[source_points] - points[target_points]
+    within = numpy.einsum('ij,ij->i', differences, differences) <= eps * eps
+    return numpy.bincount(cell_pairs, weights=within,
+                          minlength=len(sources)) > 0
+
+
+class LocationHierarchy(object):
+    '''Shared locations at several scales. levels[k] holds the location of
+    every staypoint at the k-th distance, NOISE for staypoints in none.
+    '''
+    VERSION = 1
+
+    def __init__(self, users, arrivals, departures, latitudes, longitudes,
+                 distances, levels):
+        self.users = users
+        self.arrivals = arrivals
+        self.departures = departures
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        self.distances = list(distances)
+        self.levels = list(levels)
+
+    @classmethod
+    def build(cls, users, arrivals, departures, latitudes, longitudes,
+              distances=None, min_points=None):
+        '''Cluster staypoints at each distance in turn, smallest first.'''
+        if distances is None:
+            distances = config.LOCATION_CLUSTER_DISTANCES
+        if min_points is None:
+            min_points = config.LOCATION_CLUSTER_MIN_POINTS
+        distances = sorted(distances)
+
+        coordinates = ecef(latitudes, longitudes).reshape(-1, 3)
+        labels = grid_dbscan(coordinates, distances[0], min_points)
+        levels = [labels]
+        logger.info('{} staypoints in {} locations within {} meters'.format(
+            (labels != NOISE).sum(), _count(labels), distances[0]
+        ))
+
+        for distance in distances[1:]:
+            # Every location of the level below is dense enough on its own
+            centroids = _centroids(coordinates, labels)
+            location_labels = grid_dbscan(centroids, distance, min_points=1)
+            labels = labels.copy()
+            clustered = labels != NOISE
+            labels[clustered] = location_labels[labels[clustered]]
+            levels.append(labels)
+            logger.info('{} locations within {} meters'.format(
+                _count(labels), distance
+            ))
+
+        return cls(users=numpy.asarray(users, dtype=numpy.int64),
+                   arrivals=numpy.asarray(arrivals, dtype=numpy.int64),
+                   departures=numpy.asarray(departures, dtype=numpy.int64),
+                   latitudes=numpy.asarray(latitudes, dtype=numpy.float64),
+                   longitudes=numpy.asarray(longitudes, dtype=numpy.float64),
+                   distances=distances,
+                   levels=levels)
+
+    @classmethod
+    def from_chunks(cls, chunks, distances=None, min_points=None):
+        '''Cluster staypoints read a chunk at a time, as by
+        readers.table.iter_column_chunks(), keeping only the columns needed.
+
+        This is not out-of-core: the chunks only spare holding the table's
+        rows as Python objects. The five needed columns of every staypoint
+        are concatenated and clustered in memory, about 40 bytes a
+        staypoint, plus one label array per level. Only the pairwise
+        comparisons of grid_dbscan() are bounded, by PAIR_BATCH_SIZE.
+        '''
+        columns = collections.defaultdict(list)
+        for chunk in chunks:
+            for field in ('user', 'arrival', 'departure', 'latitude',
+                          'longitude'):
+                columns[field].append(chunk[field])
+        columns = dict((field, numpy.concatenate(parts))
+                       for field, parts in columns.items())
+        if not columns:
+            columns = dict((field, []) for field in ('user', 'arrival',
+                                                     'departure', 'latitude',
+                                                     'longitude'))
+
+        return cls.build(users=columns['user'],
+                         arrivals=columns['arrival'],
+                         departures=columns['departure'],
+                         latitudes=columns['latitude'],
+                         longitudes=columns['longitude'],
+                         distances=distances,
+                         min_points=min_points)
+
+    def centroids(self, level):
+        '''Latitude and longitude of the centre of each location of a level.
+        '''
+        centroids = _centroids(
+            ecef(self.latitudes, self.longitudes).reshape(-1, 3),
+            self.levels[level]
+        )
+        x, y, z = centroids.T
+        return numpy.degrees(numpy.arctan2(z, numpy.hypot(x, y))), \
+               numpy.degrees(numpy.arctan2(y, x))
+
+    def location_count(self, level):
+        return _count(self.levels[level])
+
+    @classmethod
+    def load(cls, path):
+        with numpy.load(path) as saved:
+            if int(saved['version']) != cls.VERSION:
+                raise ValueError('{} was saved by an incompatible version of '
+                                 'LocationHierarchy'.format(path))
+            return cls(users=saved['users'],
+                       arrivals=saved['arrivals'],
+                       departures=saved['departures'],
+                       latitudes=saved['latitudes'],
+                       longitudes=saved['longitudes'],
+                       distances=saved['distances'].tolist(),
+                       levels=list(saved['levels']))
+
+    def save(self, path):
+        with open(path, 'wb') as hierarchy_file:
+            numpy.savez_compressed(
+                hierarchy_file,
+                version=self.VERSION,
+                users=self.users,
+                arrivals=self.arrivals,
+                departures=self.departures,
+                latitudes=self.latitudes,
+                longitudes=self.longitudes,
+                distances=numpy.asarray(self.distances, dtype=numpy.float64),
+                levels=numpy.asarray(self.levels,
+                                     dtype=numpy.int64).reshape(
+                    len(self.levels), len(self.users)
+                )
+            )
+
+    def __len__(self):
+        return len(self.users)
+
+
+def _centroids(coordinates, labels):
+    '''Mean ECEF coordinates of each cluster's members, on the earth's
+    surface.
+    '''
+    clustered = labels != NOISE
+    count = _count(labels)
+    centroids = numpy.stack([
+        numpy.bincount(labels[clustered], weights=coordinates[clustered, axis],
+                       minlength=count)
+        for axis in range(3)
+    ], axis=-1)
+    lengths = numpy.linalg.norm(centroids, axis=1)
+    return EARTH_RADIUS * centroids / lengths[:, numpy.newaxis]
+
+
+def _count(labels):
+    if not len(labels):
+        return 0
+    return int(labels.max()) + 1
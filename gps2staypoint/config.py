@@ -10,12 +10,83 @@ DEFAULT_GEOLIFE_DIRECTORY = os.path.join(
     'Data'
 )
 GPS_TRAJECTORY_TIME_INTERVAL_THRESHOLD = datetime.timedelta(minutes=20)
+# Number of trajectories GPSUser.trajectories keeps parsed per user, or None
+# to keep them all. Trajectories evicted beyond this are re-read on access.
+TRAJECTORY_CACHE_SIZE = None
+
+# Parse each .plt file once into NumPy arrays instead of re-parsing the raw
+# text fields every time a point's coordinates or timestamp are read
+PLT_COLUMNAR_READER = True
+# Directory of parsed .plt files to reuse across runs, or None to disable
+PLT_CACHE_DIRECTORY = None
+# Number of upcoming .plt files to read and parse on background threads
+# while earlier ones are processed, or 0 to read each file when it is needed
+PLT_PREFETCH_DEPTH = 0
+# Bytes of .plt files, by their size on disk, that may be prefetched at once
+PLT_PREFETCH_MEMORY = 256 * 1024 * 1024
+# Threads reading and parsing prefetched files
+PLT_PREFETCH_THREADS = 2
+
+# 'simplekml' builds each KML document in memory, 'stream' writes it out as
+# it goes
+KML_WRITER = 'simplekml'
+# None, 'gzip' or 'kmz'
+KML_COMPRESSION = None
+# Save all trajectories of a user into one KML file, a folder per trajectory
+KML_PER_USER = False
+# Simplify trajectory lines to within this many meters, or None to keep every
+# GPS record
+KML_SIMPLIFY_TOLERANCE = None
+# 'douglas-peucker' or 'visvalingam-whyatt'
+KML_SIMPLIFY_METHOD = 'douglas-peucker'
+
+# 'csv', or 'arrow' and 'parquet' when pyarrow is installed
+TABLE_FORMAT = 'csv'
+# Length of the geohash cells staypoints are bucketed into by
+# spatial.StaypointIndex; 7 characters is about 150 by 150 meters
+STAYPOINT_INDEX_GEOHASH_PRECISION = 7
+
+# Distances in meters at which clustering.LocationHierarchy groups the
+# staypoints of all users into shared locations, one level per distance
+LOCATION_CLUSTER_DISTANCES = (100, 500, 2000)
+# Staypoints, including itself, within the smallest distance of a staypoint
+# for it to be the core of a location
+LOCATION_CLUSTER_MIN_POINTS = 3
+# Largest difference, as a fraction of the longer one, between two users'
+# travel times from one shared location to the next for both trips to count
+# as the same sequence
+SIMILARITY_TRAVEL_TIME_RATIO = 0.2
+# Leave locations visited by more users than this out of the search for
+# pairs of similar users, or None to consider every location. Each location
+# kept yields up to n(n - 1)/2 pairs to compare for its n users
+SIMILARITY_MAX_LOCATION_USERS = 1000
+
+# Users queued per worker process, beyond which no more are discovered until
+# one is finished
+WORKER_QUEUE_DEPTH = 2
+
+# Time each stage of processing, for a --profile-report
+PROFILE_STAGES = False
+# Capture a full profile of this user's processing into PROFILE_USER_PATH,
+# with either 'cprofile' or 'pyinstrument'
+PROFILE_USER = None
+PROFILE_USER_PATH = None
+PROFILER = 'cprofile'
 
 
 class StayPointConfiguration(object):
+    # Settings are class attributes only, so that subclasses such as
+    # StayPoint can stay free of a per-instance __dict__
+    __slots__ = ()
+
     TIME_THRESHOLD = datetime.timedelta(minutes=3)
     #datetime.timedelta(minutes=20)
     DISTANCE_THRESHOLD = 100 #200 # meters
+    # One of 'vincenty', 'haversine' or 'equirectangular'
+    DISTANCE_METRIC = 'vincenty'
+    # 'iterative' walks the trajectory point by point, 'array' works on the
+    # trajectory's coordinate arrays with batched distance computations
+    ENGINE = 'iterative'
 
 
 class Colors(object):
@@ -0,0 +1,138 @@
+import logging
+import os
+
+from gps2staypoint import profiling
+from gps2staypoint.readers.plt import PLTFileReader
+from gps2staypoint.user import GPSUser
+
+logger = logging.getLogger(__name__)
+
+
+def find_plt_files(directory):
+    '''Find raw GPS trajectory files beneath a directory.'''
+    return sorted(iter_plt_files(directory))
+
+
+def iter_plt_files(directory):
+    '''Lazily find raw GPS trajectory files beneath a directory, walking it
+    in sorted order so that each user's files come out together.
+    '''
+    for directory, subdirectories, filenames in os.walk(directory):
+        subdirectories.sort()
+        if 'StayPoint' in directory:
+            # Skip any files within the previously created StayPoint directory
+            continue
+
+        # Only consider .plt files
+        plt_files_within_directory = filter(lambda p: p.endswith('.plt'),
+                                            sorted(filenames))
+
+        # Prepend a file's directory to each filename
+        for plt_file_name in plt_files_within_directory:
+            yield os.path.join(directory, plt_file_name)
+
+
+def group_by_user(plt_files, index=None):
+    '''Partition GPS trajectory files by the user that created them, each
+    user's files sorted by the time each file was created.
+
+    Given an up-to-date PLTIndex, no file needs to be opened. Files whose
+    first record cannot be read are skipped, along with any user left with
+    no files.
+    '''
+    users = {}
+    for plt_file_path in plt_files:
+        logger.debug(plt_file_path)
+        plt = _reader(plt_file_path, index)
+        if plt is None:
+            continue
+        user_id = plt.user
+
+        if user_id not in users:
+            user = GPSUser(id=user_id)
+            users[user_id] = user
+        else:
+            user = users[user_id]
+
+        user.add_plt_file(plt=plt)
+
+    for user_id, user in list(users.items()):
+        if not _sort_user_files(user):
+            del users[user_id]
+
+    return users
+
+
+def iter_users(directory, index=None):
+    '''Lazily discover users one at a time, without first finding every
+    file of every user.
+
+    Relies on each user's files living under the user's own directory, as
+    they do in the GeoLife dataset. Unreadable files are skipped as by
+    group_by_user().
+    '''
+    user = None
+    for plt_file_path in iter_plt_files(directory):
+        logger.debug(plt_file_path)
+        plt = _reader(plt_file_path, index)
+        if plt is None:
+            continue
+
+        if user is None or plt.user != user.id:
+            if user is not None and _sort_user_files(user):
+                yield user
+            user = GPSUser(id=plt.user)
+
+        user.add_plt_file(plt=plt)
+
+    if user is not None and _sort_user_files(user):
+        yield user
+
+
+def _reader(path, index):
+    '''A reader of the file, or None if the index found it unreadable.'''
+    if index is not None and os.path.abspath(path) in index.entries:
+        if not index.is_current(path):
+            # Modified since it was indexed; when streaming, the index is
+            # never brought up to date before discovery
+            logger.debug('Re-probing modified {}'.format(path))
+            index.refresh(path)
+        error = index.error(path)
+        if error is not None:
+            logger.warning('Skipping unreadable {}: {}'.format(path, error))
+            return None
+        return index.reader(path)
+    return PLTFileReader(path=path)
+
+
+def _readable(plt):
+    '''Whether the first record of a file can be read, logging why not, so
+    that one corrupt file does not abort the discovery of every user.
+    '''
+    try:
+        plt.start_time
+    except (StopIteration, ValueError, IndexError, OSError) as e:
+        logger.warning('Skipping unreadable {}: {!r}'.format(plt.path, e))
+        return False
+    return True
+
+
+def _sort_user_files(user):
+    '''Drop the user's unreadable files and sort the rest, returning
+    whether any are left.
+    '''
+    user.gps_logs = [plt for plt in user.gps_logs if _readable(plt)]
+    if not user.gps_logs:
+        logger.warning('Skipping user #{}, who has no readable files'.format(
+            user.id
+        ))
+        return False
+
+    user.sort_trajectories_by_time()
+    profiling.profile.count('discovery', files=len(user.gps_logs))
+
+    logger.debug('User: #{}'.format(user.id))
+    for plt in user.gps_logs:
+        logger.debug('{0.start_time}: {0.path}'.format(plt))
+    logger.debug('')
+    return True
@@ -0,0 +1,48 @@
+import logging
+
+import numpy
+from scipy.spatial import ConvexHull
+
+from gps2staypoint.utils import smallestenclosingcircle
+from gps2staypoint.utils.projection import inverse_local_projection
+from gps2staypoint.utils.projection import local_projection
+
+logger = logging.getLogger(__name__)
+
+
+def enclosing_circle(latitudes, longitudes):
+    '''Smallest circle enclosing a set of GPS points, as the latitude and
+    longitude of its center and its radius in meters.
+
+    The points are projected onto a plane tangent at their centroid, so the
+    radius is in true meters at any latitude. Only the vertices of their
+    convex hull can lie on the circle, so the randomized Welzl algorithm
+    runs on those alone.
+    '''
+    latitudes = numpy.asarray(latitudes, dtype=numpy.float64)
+    longitudes = numpy.asarray(longitudes, dtype=numpy.float64)
+    origin = (latitudes.mean(), longitudes.mean())
+    x, y = local_projection(latitudes, longitudes, origin=origin)
+
+    points = numpy.unique(numpy.column_stack([x, y]), axis=0)
+    if len(points) > 3:
+        try:
+            points = points[ConvexHull(points).vertices]
+        except RuntimeError:
+            # Collinear points have no hull, but still have a circle
+            pass
+
+    center_x, center_y, radius = smallestenclosingcircle.make_circle(
+        points.tolist()
+    )
+    latitude, longitude = inverse_local_projection(center_x, center_y,
+                                                   origin=origin)
+    return float(latitude), float(longitude), radius
+
+
+def centroid_radius(latitudes, longitudes, centroid):
+    '''Distance in meters from a centroid to the furthest of a set of GPS
+    points; a cheap upper bound of the enclosing circle's radius.
+    '''
+    x, y = local_projection(latitudes, longitudes, origin=centroid)
+    return float(numpy.hypot(x, y).max())
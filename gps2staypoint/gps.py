@@ -1,23 +1,198 @@
+import calendar
 import logging
+import math
 import os
+
+import numpy
 from geopy.distance import vincenty
 
 from gps2staypoint import config
-from gps2staypoint.staypoint import StaypointBuilder
-from gps2staypoint.writers.kml import StaypointKML
+from gps2staypoint.staypoint import STAYPOINT_BUILDERS
+from gps2staypoint.writers import kml
 
 logger = logging.getLogger(__name__)
 
 
+class DistanceMetric(object):
+    '''Distance in meters between GPS locations.
+
+    Every metric offers a scalar form between two (latitude, longitude)
+    pairs, and a batch form between one anchor point and arrays of
+    latitudes and longitudes.
+    '''
+    EARTH_RADIUS = 6371009  # meters, as used by geopy
+
+    def distance(self, origin, destination):
+        raise NotImplementedError
+
+    def distances(self, latitude, longitude, latitudes, longitudes):
+        raise NotImplementedError
+
+
+class VincentyDistance(DistanceMetric):
+    '''Iterative geodesic distance on the WGS-84 ellipsoid.'''
+    MAJOR, MINOR, FLATTENING = 6378137.0, 6356752.3142, 1 / 298.257223563
+    ITERATIONS = 20
+
+    def distance(self, origin, destination):
+        return vincenty(origin, destination).meters
+
+    def distances(self, latitude, longitude, latitudes, longitudes):
+        # A vectorized transcription of geopy's vincenty.measure(), iterating
+        # until every pair has converged
+        f = self.FLATTENING
+        latitudes = numpy.asarray(latitudes, dtype=numpy.float64)
+        longitudes = numpy.asarray(longitudes, dtype=numpy.float64)
+
+        delta_lng = numpy.radians(longitudes - longitude)
+        reduced_lat1 = math.atan((1 - f) * math.tan(math.radians(latitude)))
+        reduced_lat2 = numpy.arctan((1 - f) * numpy.tan(
+            numpy.radians(latitudes)
+        ))
+        sin_reduced1, cos_reduced1 = math.sin(reduced_lat1), \
+                                     math.cos(reduced_lat1)
+        sin_reduced2, cos_reduced2 = numpy.sin(reduced_lat2), \
+                                     numpy.cos(reduced_lat2)
+
+        lambda_lng = delta_lng
+        iterating = numpy.ones(delta_lng.shape, dtype=bool)
+        for _ in range(self.ITERATIONS + 1):
+            sin_lambda_lng = numpy.sin(lambda_lng)
+            cos_lambda_lng = numpy.cos(lambda_lng)
+
+            sin_sigma = numpy.sqrt(
+                (cos_reduced2 * sin_lambda_lng) ** 2 +
+                (cos_reduced1 * sin_reduced2 -
+                 sin_reduced1 * cos_reduced2 * cos_lambda_lng) ** 2
+            )
+            cos_sigma = sin_reduced1 * sin_reduced2 \
+                        + cos_reduced1 * cos_reduced2 * cos_lambda_lng
+            sigma = numpy.arctan2(sin_sigma, cos_sigma)
+
+            # Coincident points have no defined azimuth
+            coincident = sin_sigma == 0
+            safe_sin_sigma = numpy.where(coincident, 1.0, sin_sigma)
+            sin_alpha = cos_reduced1 * cos_reduced2 * sin_lambda_lng \
+                        / safe_sin_sigma
+            cos_sq_alpha = 1 - sin_alpha ** 2
+
+            # Equatorial lines have cos_sq_alpha == 0
+            equatorial = cos_sq_alpha == 0
+            cos2_sigma_m = numpy.where(
+                equatorial,
+                0.0,
+                cos_sigma - 2 * sin_reduced1 * sin_reduced2
+                / numpy.where(equatorial, 1.0, cos_sq_alpha)
+            )
+
+            C = f / 16. * cos_sq_alpha * (4 + f * (4 - 3 * cos_sq_alpha))
+            lambda_prime = lambda_lng
+            lambda_lng = numpy.where(iterating, delta_lng + (1 - C) * f
+                * sin_alpha * (sigma + C * sin_sigma * (
+                    cos2_sigma_m + C * cos_sigma * (-1 + 2 * cos2_sigma_m ** 2)
+                )), lambda_prime)
+
+            iterating &= ~coincident \
+                & (numpy.abs(lambda_lng - lambda_prime) > 10e-12)
+            if not iterating.any():
+                break
+
+        else:
+            raise ValueError('Vincenty formula failed to converge!')
+
+        u_sq = cos_sq_alpha * (self.MAJOR ** 2 - self.MINOR ** 2) \
+               / self.MINOR ** 2
+        A = 1 + u_sq / 16384. * (4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq)))
+        B = u_sq / 1024. * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+        delta_sigma = B * sin_sigma * (cos2_sigma_m + B / 4. * (
+            cos_sigma * (-1 + 2 * cos2_sigma_m ** 2) - B / 6. * cos2_sigma_m
+            * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos2_sigma_m ** 2)
+        ))
+        meters = self.MINOR * A * (sigma - delta_sigma)
+        return numpy.where(coincident, 0.0, meters)
+
+
+class HaversineDistance(DistanceMetric):
+    '''Great-circle distance on a spherical earth.'''
+    def distance(self, origin, destination):
+        latitude, longitude = map(math.radians, origin)
+        other_latitude, other_longitude = map(math.radians, destination)
+        a = math.sin((other_latitude - latitude) / 2) ** 2 \
+            + math.cos(latitude) * math.cos(other_latitude) \
+            * math.sin((other_longitude - longitude) / 2) ** 2
+        return 2 * self.EARTH_RADIUS * math.asin(math.sqrt(min(a, 1.0)))
+
+    def distances(self, latitude, longitude, latitudes, longitudes):
+        latitude, longitude = math.radians(latitude), math.radians(longitude)
+        latitudes = numpy.radians(latitudes)
+        longitudes = numpy.radians(longitudes)
+        a = numpy.sin((latitudes - latitude) / 2) ** 2 \
+            + math.cos(latitude) * numpy.cos(latitudes) \
+            * numpy.sin((longitudes - longitude) / 2) ** 2
+        return 2 * self.EARTH_RADIUS * numpy.arcsin(
+            numpy.sqrt(numpy.minimum(a, 1.0))
+        )
+
+
+class EquirectangularDistance(DistanceMetric):
+    '''Flat-earth approximation around the two points, accurate to well
+    under a meter at staypoint scales.
+    '''
+    def distance(self, origin, destination):
+        latitude, longitude = map(math.radians, origin)
+        other_latitude, other_longitude = map(math.radians, destination)
+        delta_longitude = (other_longitude - longitude + math.pi) \
+                          % (2 * math.pi) - math.pi
+        x = delta_longitude * math.cos((latitude + other_latitude) / 2)
+        y = other_latitude - latitude
+        return self.EARTH_RADIUS * math.sqrt(x * x + y * y)
+
+    def distances(self, latitude, longitude, latitudes, longitudes):
+        latitude, longitude = math.radians(latitude), math.radians(longitude)
+        latitudes = numpy.radians(latitudes)
+        longitudes = numpy.radians(longitudes)
+        delta_longitudes = (longitudes - longitude + numpy.pi) \
+                           % (2 * numpy.pi) - numpy.pi
+        x = delta_longitudes * numpy.cos((latitudes + latitude) / 2)
+        y = latitudes - latitude
+        return self.EARTH_RADIUS * numpy.hypot(x, y)
+
+
+DISTANCE_METRICS = {
+    'vincenty': VincentyDistance(),
+    'haversine': HaversineDistance(),
+    'equirectangular': EquirectangularDistance(),
+}
+
+
+def get_distance_metric(name=None):
+    '''Look up a distance metric by name, defaulting to the one configured
+    in StayPointConfiguration.
+    '''
+    if name is None:
+        name = config.StayPointConfiguration.DISTANCE_METRIC
+    return DISTANCE_METRICS[name]
+
+
 class GPSPoint(object):
+    __slots__ = ()
+
+    def distance_to(self, point, metric=None):
+        return get_distance_metric(metric).distance(self.location,
+                                                    point.location)
 
-    def distance_to(self, point):
-        return vincenty(self.location, point.location).meters
+    def distance_from(self, location, metric=None):
+        '''Distance to this point from a (latitude, longitude) pair.'''
+        return get_distance_metric(metric).distance(location, self.location)
 
     @property
     def location(self):
         return (self.latitude, self.longitude)
 
+    @property
+    def epoch_seconds(self):
+        return calendar.timegm(self.timestamp.timetuple())
+
     def __str__(self):
         return '({0.latitude}, {0.longitude}) @{0.timestamp}'.format(self)
 
@@ -28,10 +203,37 @@ class GPSTrajectory(object):
     def __init__(self, user, initial_point=None):
         self.user = user
         self._staypoints = None
+        # (index into the user's GPS logs, first record, stop) of each run
+        # of records the trajectory was made from
+        self.spans = []
 
-        self.points = []
+        # Columns to read the points from, for a trajectory made from a
+        # cached PLTColumns; its points are only built when asked for
+        self._columns = None
+        self._points = []
         if initial_point is not None:
-            self.points.append(initial_point)
+            self._points.append(initial_point)
+
+    @classmethod
+    def from_columns(cls, user, columns, spans):
+        '''The trajectory of the records of a PLTColumns.'''
+        trajectory = cls(user=user)
+        trajectory._columns = columns
+        trajectory._points = None
+        trajectory.spans = list(spans)
+        return trajectory
+
+    @property
+    def points(self):
+        if self._points is None:
+            self._points = [self._columns[i]
+                            for i in range(len(self._columns))]
+        return self._points
+
+    @points.setter
+    def points(self, points):
+        self._columns = None
+        self._points = points
 
     def add_point(self, point):
         if not self.points:
@@ -50,37 +252,84 @@ class GPSTrajectory(object):
 
     @property
     def latest_time(self):
-        return self.points[-1].timestamp
+        return self[-1].timestamp
 
     @property
     def earliest_time(self):
-        return self.points[0].timestamp
+        return self[0].timestamp
+
+    @property
+    def id(self):
+        return '{user:0>3}_{start}-{end}'.format(
+            user=self.user.id,
+            start=self.earliest_time.strftime("%s"),
+            end=self.latest_time.strftime("%s"),
+        )
 
     @property
     def staypoints(self):
         if self._staypoints is None:
-            builder = StaypointBuilder(trajectory=self)
-            self._staypoints = builder.extract_staypoints()
+            builder_class = STAYPOINT_BUILDERS[
+                config.StayPointConfiguration.ENGINE
+            ]
+            builder = builder_class(trajectory=self)
+            staypoints = builder.extract_staypoints()
+            # Measure their extent while the points are around, so that the
+            # staypoints can outlive them
+            for staypoint in staypoints:
+                staypoint.measure(self)
+            self._staypoints = staypoints
         return self._staypoints
 
     def write_to_kml(self, directory):
         if not os.path.exists(directory):
             os.makedirs(directory, exist_ok=True)
 
-        filename = 'User{user:0>3}_{start}-{end}.kml'.format(
-            user=self.user.id,
-            start=self.earliest_time.strftime("%s"),
-            end=self.latest_time.strftime("%s"),
+        filename = 'User{id}{extension}'.format(
+            id=self.id,
+            extension=kml.EXTENSIONS[config.KML_COMPRESSION],
         )
         path = os.path.join(directory, filename)
         # logger.debug('Saving trajectory to {}'.format(path))
 
-        kml = StaypointKML(path=path)
+        writer = kml.KML_WRITERS[config.KML_WRITER](
+            path=path,
+            compression=config.KML_COMPRESSION
+        )
+        self.add_to_kml(writer)
+        writer.save()
+        return path
+
+    def add_to_kml(self, kml):
         kml.add_trajectory(trajectory=self)
         staypoints = self.staypoints
         if staypoints:
             kml.add_staypoints(staypoints=staypoints)
-        kml.save()
+
+    def as_arrays(self):
+        '''Latitudes, longitudes and epoch-second timestamps of every point
+        of the trajectory, as NumPy arrays.
+        '''
+        if self._columns is not None:
+            return (self._columns.latitude, self._columns.longitude,
+                    self._columns.timestamp)
+
+        point_count = len(self.points)
+        latitudes = numpy.fromiter((p.latitude for p in self.points),
+                                   dtype=numpy.float64, count=point_count)
+        longitudes = numpy.fromiter((p.longitude for p in self.points),
+                                    dtype=numpy.float64, count=point_count)
+        timestamps = numpy.fromiter((p.epoch_seconds for p in self.points),
+                                    dtype=numpy.int64, count=point_count)
+        return latitudes, longitudes, timestamps
+
+    def release(self):
+        '''Drop the trajectory's points, keeping its extracted staypoints.'''
+        # Extract and measure the staypoints while the points are still
+        # around
+        staypoints = self.staypoints
+        self.points = []
+        return staypoints
 
     def summarize(self):
         staypoints = self.staypoints
@@ -92,17 +341,30 @@ class GPSTrajectory(object):
             yield p
 
     def __getitem__(self, index):
-        return self.points[index]
+        if self._points is not None:
+            return self._points[index]
+
+        # Only build the points asked for
+        if isinstance(index, slice):
+            return [self._columns[i]
+                    for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('point index out of range')
+        return self._columns[index]
 
     def __len__(self):
-        return len(self.points)
+        if self._points is None:
+            return len(self._columns)
+        return len(self._points)
 
     def __str__(self):
         start = self.earliest_time
         end = self.latest_time
         return '{point_count: >4} points, {start} to {end} ' \
                '({time_difference})'.format(
-            point_count=len(self.points),
+            point_count=len(self),
             start=start,
             end=end,
             time_difference=end-start,
@@ -0,0 +1,383 @@
+import hashlib
+import json
+import logging
+import os
+import socket
+import sqlite3
+import time
+
+from gps2staypoint import config
+
+logger = logging.getLogger(__name__)
+
+
+class ProcessingManifest(object):
+    '''Record of what each user's outputs were produced from, so that a
+    later run only needs to reprocess users whose inputs, thresholds or
+    code have changed since.
+
+    Stored as JSON mapping each user id to the fingerprint of its inputs,
+    the paths of the outputs written for it and its staypoint rows, from
+    which the staypoint table is written out again on every run.
+    '''
+    VERSION = 2
+
+    def __init__(self, path):
+        self.path = path
+        self.users = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as manifest_file:
+                manifest = json.load(manifest_file)
+        except (IOError, ValueError):
+            return
+
+        if manifest.get('version') == self.VERSION:
+            self.users = manifest['users']
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        temporary_path = '{}.{}.tmp'.format(self.path, os.getpid())
+        with open(temporary_path, 'w') as manifest_file:
+            json.dump({'version': self.VERSION, 'users': self.users},
+                      manifest_file, indent=1, sort_keys=True)
+        os.replace(temporary_path, self.path)
+
+    def is_current(self, user, fingerprint):
+        '''Whether the user's recorded outputs were produced from the given
+        fingerprint, and are all still in place.
+        '''
+        entry = self.users.get(str(user))
+        return entry is not None \
+            and entry['fingerprint'] == fingerprint \
+            and all(map(os.path.exists, entry['outputs']))
+
+    def record(self, user, fingerprint, outputs, rows):
+        '''Record a user's new outputs and staypoint rows, deleting any
+        output of a previous run that was not produced again.
+        '''
+        entry = self.users.get(str(user))
+        if entry is not None:
+            _remove(set(entry['outputs']) - set(outputs))
+
+        self.users[str(user)] = {
+            'fingerprint': fingerprint,
+            'outputs': sorted(outputs),
+            'rows': [list(row) for row in rows],
+        }
+
+    def user_ids(self):
+        return sorted(map(int, self.users))
+
+    def rows(self, user):
+        '''The staypoint rows recorded for a user, in the layout of
+        writers.table.STAYPOINT_FIELDS.
+        '''
+        return [tuple(row) for row in self.users[str(user)]['rows']]
+
+    def collect_garbage(self, users):
+        '''Delete the outputs of every user no longer among the given ones,
+        returning the ids of the users removed.
+        '''
+        users = set(map(str, users))
+        removed = sorted(set(self.users) - users)
+        for user in removed:
+            _remove(self.users.pop(user)['outputs'])
+        return removed
+
+
+class ShardManifest(object):
+    '''Checkpoints of one shard of a batch run, so that a run killed part
+    way resumes from the first user it had not finished.
+
+    Stored as an SQLite database of its own per shard, only ever written by
+    the node running that shard, so that nodes sharing a filesystem never
+    contend for a lock. Each user's fingerprint, outputs and staypoint rows
+    are recorded in a single transaction once the user is processed, and
+    the shard is marked finished once all of its users are.
+    '''
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self.connection = sqlite3.connect(path, timeout=60)
+        with self.connection:
+            self.connection.executescript('''
+                CREATE TABLE IF NOT EXISTS properties (
+                    name TEXT PRIMARY KEY,
+                    value
+                );
+                CREATE TABLE IF NOT EXISTS users (
+                    user INTEGER PRIMARY KEY,
+                    fingerprint TEXT,
+                    outputs TEXT,
+                    error TEXT
+                );
+                CREATE TABLE IF NOT EXISTS staypoints (
+                    user INTEGER,
+                    row TEXT
+                );
+                CREATE INDEX IF NOT EXISTS staypoints_by_user
+                    ON staypoints (user);
+            ''')
+        version = self.get('version')
+        if version is None:
+            self.set(version=self.VERSION)
+        elif version != self.VERSION:
+            raise ValueError('{} was written by an incompatible version of '
+                             'ShardManifest'.format(path))
+
+    def get(self, name, default=None):
+        row = self.connection.execute(
+            'SELECT value FROM properties WHERE name = ?', (name,)
+        ).fetchone()
+        return default if row is None else row[0]
+
+    def set(self, **properties):
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO properties VALUES (?, ?)',
+                properties.items()
+            )
+
+    def start(self):
+        '''Note which node is running the shard, with which settings, and
+        that it is running.
+        '''
+        self.set(host=socket.gethostname(), pid=os.getpid(),
+                 started=time.time(), finished=None,
+                 settings=settings_fingerprint())
+
+    def finish(self):
+        self.set(finished=time.time())
+
+    @property
+    def finished(self):
+        return self.get('finished') is not None
+
+    def is_current(self, user, fingerprint):
+        '''Whether the user was processed without error from the given
+        fingerprint, and all of its outputs are still in place.
+        '''
+        row = self.connection.execute(
+            'SELECT fingerprint, outputs FROM users '
+            'WHERE user = ? AND error IS NULL', (user,)
+        ).fetchone()
+        return row is not None and row[0] == fingerprint \
+            and all(map(os.path.exists, json.loads(row[1])))
+
+    def record(self, user, fingerprint, outputs, rows, error=None):
+        '''Record a processed user along with its staypoint rows, replacing
+        anything recorded for it before. A user that failed is recorded with
+        its error, to be tried again on the next run.
+        '''
+        with self.connection:
+            self.connection.execute(
+                'DELETE FROM staypoints WHERE user = ?', (user,)
+            )
+            self.connection.execute(
+                'INSERT OR REPLACE INTO users VALUES (?, ?, ?, ?)',
+                (user, fingerprint, json.dumps(sorted(outputs)), error)
+            )
+            self.connection.executemany(
+                'INSERT INTO staypoints VALUES (?, ?)',
+                ((user, json.dumps(row)) for row in rows)
+            )
+
+    def collect_garbage(self, users):
+        '''Forget, and delete the outputs of, every user no longer among the
+        given ones. Returns the ids of the users removed.
+        '''
+        users = set(users)
+        removed = [user for user in self.users() if user not in users]
+        with self.connection:
+            for user in removed:
+                outputs, = self.connection.execute(
+                    'SELECT outputs FROM users WHERE user = ?', (user,)
+                ).fetchone()
+                _remove(json.loads(outputs))
+                self.connection.execute(
+                    'DELETE FROM users WHERE user = ?', (user,)
+                )
+                self.connection.execute(
+                    'DELETE FROM staypoints WHERE user = ?', (user,)
+                )
+        return removed
+
+    def users(self):
+        return [user for user, in self.connection.execute(
+            'SELECT user FROM users ORDER BY user'
+        )]
+
+    def failed_users(self):
+        return [user for user, in self.connection.execute(
+            'SELECT user FROM users WHERE error IS NOT NULL ORDER BY user'
+        )]
+
+    def rows(self, user):
+        '''The staypoint rows of a user, in the order they were recorded, in
+        the layout of writers.table.STAYPOINT_FIELDS.
+        '''
+        return [tuple(json.loads(row)) for row, in self.connection.execute(
+            'SELECT row FROM staypoints WHERE user = ? ORDER BY rowid',
+            (user,)
+        )]
+
+    def close(self):
+        self.connection.close()
+
+
+def parse_shard(value):
+    '''(index, count) of a shard written as "i/N", with 0 <= i < N.'''
+    try:
+        index, count = map(int, value.split('/'))
+    except ValueError:
+        raise ValueError('{} is not a shard of the form i/N'.format(value))
+    if count < 1 or not 0 <= index < count:
+        raise ValueError('shard {} is not one of 0/{count} to '
+                         '{last}/{count}'.format(value, count=count,
+                                                 last=count - 1))
+    return index, count
+
+
+def in_shard(user, index, count):
+    '''Whether a user belongs to a shard. Users are dealt out by id, so
+    that every node agrees on the shards without sharing any state.
+    '''
+    return user % count == index
+
+
+def shard_manifest_path(directory, index, count):
+    return os.path.join(directory, 'shards',
+                        'shard-{:0>4}-of-{:0>4}.sqlite'.format(index, count))
+
+
+def merge_shards(directory, count):
+    '''The staypoint rows of every user of a batch run split into count
+    shards, in order of user id, along with the ids of the users whose
+    processing failed. Raises ValueError unless every shard is finished,
+    and was run with the same settings and code as the first shard.
+    '''
+    manifests = []
+    unfinished = []
+    for index in range(count):
+        path = shard_manifest_path(directory, index, count)
+        if os.path.exists(path):
+            manifest = ShardManifest(path)
+            manifests.append(manifest)
+            if manifest.finished:
+                continue
+        unfinished.append('{}/{}'.format(index, count))
+    if unfinished:
+        for manifest in manifests:
+            manifest.close()
+        raise ValueError('{} shards are not finished, run them first: '
+                         '{}'.format(len(unfinished), ', '.join(unfinished)))
+
+    settings = manifests[0].get('settings')
+    differing = ['{}/{}'.format(index, count)
+                 for index, manifest in enumerate(manifests)
+                 if manifest.get('settings') != settings]
+    if differing:
+        for manifest in manifests:
+            manifest.close()
+        raise ValueError('{} shards were run with different settings or code '
+                         'than shard 0/{}, run them again: {}'.format(
+                             len(differing), count, ', '.join(differing)
+                         ))
+
+    users = sorted((user, manifest) for manifest in manifests
+                   for user in manifest.users())
+    failed_users = sorted(user for manifest in manifests
+                          for user in manifest.failed_users())
+    return _merged_rows(users, manifests), failed_users
+
+
+def _merged_rows(users, manifests):
+    try:
+        for user, manifest in users:
+            for row in manifest.rows(user):
+                yield row
+    finally:
+        for manifest in manifests:
+            manifest.close()
+
+
+def fingerprint(user):
+    '''Digest of everything a user's outputs depend on: the path, size and
+    modification time of each of their .plt files, and the settings
+    digested by settings_fingerprint().
+    '''
+    stats = []
+    for plt in user.gps_logs:
+        stat = os.stat(plt.path)
+        stats.append([os.path.abspath(plt.path), stat.st_size,
+                      stat.st_mtime_ns])
+
+    digest = hashlib.sha1(json.dumps({
+        'inputs': sorted(stats),
+        'settings': settings_fingerprint(),
+    }, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def settings_fingerprint():
+    '''Digest of everything every user's outputs depend on besides their
+    own .plt files: the staypoint and trajectory thresholds, the KML output
+    settings, and the source code of this package.
+    '''
+    settings = config.StayPointConfiguration
+    digest = hashlib.sha1(json.dumps({
+        'distance_threshold': settings.DISTANCE_THRESHOLD,
+        'time_threshold': settings.TIME_THRESHOLD.total_seconds(),
+        'distance_metric': settings.DISTANCE_METRIC,
+        'trajectory_threshold':
+            config.GPS_TRAJECTORY_TIME_INTERVAL_THRESHOLD.total_seconds(),
+        'kml': [config.KML_WRITER, config.KML_COMPRESSION,
+                config.KML_PER_USER, config.KML_SIMPLIFY_TOLERANCE,
+                config.KML_SIMPLIFY_METHOD],
+        'code': code_version(),
+    }, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+_code_version = None
+
+
+def code_version():
+    '''Digest of the source files of the gps2staypoint package.'''
+    global _code_version
+    if _code_version is None:
+        package_directory = os.path.dirname(os.path.abspath(__file__))
+        sources = []
+        for directory, subdirectories, filenames in os.walk(package_directory):
+            sources.extend(os.path.join(directory, filename)
+                           for filename in filenames
+                           if filename.endswith('.py'))
+
+        digest = hashlib.sha1()
+        for path in sorted(sources):
+            digest.update(os.path.relpath(path, package_directory)
+                          .encode('utf-8'))
+            with open(path, 'rb') as source_file:
+                digest.update(source_file.read())
+        _code_version = digest.hexdigest()
+    return _code_version
+
+
+def _remove(paths):
+    for path in paths:
+        logger.debug('Removing stale output {}'.format(path))
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,114 @@
+'''Streaming staypoint extraction.
+
+Every stage is a generator consuming the previous one, so only one user's
+file listing and one trajectory's points are held in memory at a time:
+
+    discovery.iter_users() -> trajectories() -> staypoints() -> write_kml()
+'''
+import collections
+import logging
+import os
+
+from gps2staypoint import config
+from gps2staypoint import profiling
+from gps2staypoint.writers import kml
+from gps2staypoint.writers import table
+
+logger = logging.getLogger(__name__)
+
+
+def imap_bounded(pool, function, iterable, window):
+    '''Like pool.imap(), results in order, but pulling the next item from
+    the iterable, in this thread, only once fewer than window items are
+    being worked on. Pool.imap() instead hands the whole iterable to a
+    feeder thread that reads it to the end as fast as it can, which would
+    defeat lazy discovery.
+    '''
+    pending = collections.deque()
+    for item in iterable:
+        pending.append(pool.apply_async(function, (item,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+
+    while pending:
+        yield pending.popleft().get()
+
+
+def trajectories(users):
+    '''Split each user's GPS logs into trajectories, one at a time.'''
+    for user in users:
+        logger.debug('User: #{}'.format(user.id))
+        for trajectory in user.iter_trajectories():
+            yield trajectory
+
+
+def staypoints(trajectories):
+    '''Extract the staypoints of each trajectory.'''
+    for trajectory in trajectories:
+        with profiling.profile.stage('extraction'):
+            staypoints = trajectory.staypoints
+        profiling.profile.count('extraction', points=len(trajectory))
+        yield trajectory, staypoints
+
+
+def summarize(results):
+    for trajectory, staypoints in results:
+        trajectory.summarize()
+        yield trajectory, staypoints
+
+
+def tabulate(results, rows):
+    '''Add a row for each staypoint to rows, passing the results through.
+    '''
+    for trajectory, staypoints in results:
+        with profiling.profile.stage('write'):
+            rows.extend(table.staypoint_rows(trajectory, staypoints))
+        yield trajectory, staypoints
+
+
+def write_kml(results, directory):
+    '''Save each trajectory and its staypoints to a KML file, then release
+    the trajectory's points. Yields the path of each KML file along with the
+    staypoints written to it.
+    '''
+    for trajectory, staypoints in results:
+        point_count = len(trajectory)
+        with profiling.profile.stage('write'):
+            path = trajectory.write_to_kml(directory=directory)
+            trajectory.release()
+        profiling.profile.count('write', points=point_count, files=1)
+        yield path, staypoints
+
+
+def write_user_kml(results, path):
+    '''Save every trajectory and its staypoints into a single KML file,
+    one folder per trajectory, releasing each trajectory's points as soon as
+    it is written. Should reading, extracting or writing a trajectory fail,
+    the unfinished file is discarded rather than saved.
+    '''
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    user_kml = kml.StreamingStaypointKML(path=path,
+                                         compression=config.KML_COMPRESSION)
+    failed = False
+    try:
+        for trajectory, staypoints in results:
+            point_count = len(trajectory)
+            with profiling.profile.stage('write'):
+                user_kml.begin_folder(name=trajectory.id)
+                trajectory.add_to_kml(user_kml)
+                user_kml.end_folder()
+                trajectory.release()
+            profiling.profile.count('write', points=point_count)
+            yield path, staypoints
+
+    except Exception:
+        failed = True
+        user_kml.discard()
+        raise
+
+    finally:
+        # Closed early by the consumer, every folder written is complete
+        if not failed:
+            with profiling.profile.stage('write'):
+                user_kml.save()
+            profiling.profile.count('write', files=1)
@@ -0,0 +1,295 @@
+'''Per-stage timers and counters.
+
+Stages nest: time spent in a stage entered from within another one, such as
+parsing a file while segmenting a user's trajectories, only counts towards
+the inner stage. The stages' times therefore add up to the time spent in
+all of them, however lazily the pipeline's generators are interleaved.
+Each thread keeps its own stack of stages, so that files parsed by
+prefetching threads are timed apart from the stages of the main thread,
+and the stages' times may add up to more than the time elapsed.
+
+Each stage's peak resident set size is the highest the process reached
+while the stage was running, found on Linux by resetting the kernel's
+high-water mark whenever a stage is entered or left. This makes each
+transition cost time in proportion to the process's memory, and the peak
+is the process's, not the thread's, so stages running at the same time in
+other threads share it. Where the mark cannot be reset, each stage reports
+the process's peak so far instead, and the report's peak_rss_scope says
+'process' rather than 'stage'.
+
+Instrumented code calls the module-level profile, which does nothing unless
+a Profile has been pushed with push().
+'''
+import cProfile
+import collections
+import contextlib
+import resource
+import sys
+import threading
+import time
+
+try:
+    import pyinstrument
+except ImportError:
+    pyinstrument = None
+
+STAGES = ('discovery', 'probe', 'parse', 'segmentation', 'extraction',
+          'write')
+
+
+def peak_rss():
+    '''Peak resident set size of this process so far, in bytes.'''
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return rss
+    return rss * 1024
+
+
+def reset_peak_rss():
+    '''Restart the peak measured by recent_peak_rss() from the current
+    resident set size, returning whether that is possible here.
+    '''
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+    except OSError:
+        return False
+    return True
+
+
+def recent_peak_rss():
+    '''Peak resident set size of this process since reset_peak_rss() was
+    last called, in bytes, or its peak so far if it cannot be reset.
+    '''
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return peak_rss()
+
+
+class StageStatistics(object):
+    __slots__ = ('seconds', 'calls', 'points', 'files', 'peak_rss')
+
+    def __init__(self, seconds=0.0, calls=0, points=0, files=0, peak_rss=0):
+        self.seconds = seconds
+        self.calls = calls
+        self.points = points
+        self.files = files
+        self.peak_rss = peak_rss
+
+    def merge(self, other):
+        self.seconds += other['seconds']
+        self.calls += other['calls']
+        self.points += other['points']
+        self.files += other['files']
+        self.peak_rss = max(self.peak_rss, other['peak_rss'])
+
+    def as_dict(self):
+        return {
+            'seconds': self.seconds,
+            'calls': self.calls,
+            'points': self.points,
+            'files': self.files,
+            'points_per_second': _rate(self.points, self.seconds),
+            'files_per_second': _rate(self.files, self.seconds),
+            'peak_rss': self.peak_rss,
+        }
+
+
+class Profile(object):
+    def __init__(self):
+        self.stages = collections.OrderedDict(
+            (name, StageStatistics()) for name in STAGES
+        )
+        self.users = []
+        # The stages entered by each thread, and when the innermost one was
+        # last entered or resumed
+        self._threads = threading.local()
+        self._lock = threading.Lock()
+        if reset_peak_rss():
+            self.peak_rss_scope = 'stage'
+        else:
+            self.peak_rss_scope = 'process'
+
+    def enter(self, name):
+        now = time.perf_counter()
+        stack = self._stack()
+        rss = self._recent_peak_rss()
+        with self._lock:
+            if stack:
+                statistics = self.stages[stack[-1]]
+                statistics.seconds += now - self._threads.mark
+                statistics.peak_rss = max(statistics.peak_rss, rss)
+            self.stages[name].calls += 1
+        stack.append(name)
+        self._threads.mark = now
+
+    def exit(self):
+        now = time.perf_counter()
+        name = self._stack().pop()
+        rss = self._recent_peak_rss()
+        with self._lock:
+            statistics = self.stages[name]
+            statistics.seconds += now - self._threads.mark
+            statistics.peak_rss = max(statistics.peak_rss, rss)
+        self._threads.mark = now
+
+    def _recent_peak_rss(self):
+        '''Peak resident set size since the last stage was entered or left,
+        starting the next stage's from here.
+        '''
+        rss = recent_peak_rss()
+        if self.peak_rss_scope == 'stage':
+            reset_peak_rss()
+        return rss
+
+    def _stack(self):
+        try:
+            return self._threads.stack
+        except AttributeError:
+            self._threads.stack = []
+            return self._threads.stack
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        self.enter(name)
+        try:
+            yield
+        finally:
+            self.exit()
+
+    def count(self, name, points=0, files=0):
+        with self._lock:
+            statistics = self.stages[name]
+            statistics.points += points
+            statistics.files += files
+
+    def timed(self, name, iterable):
+        '''Wrap an iterable so that producing each item is timed as a stage.
+        '''
+        iterator = iter(iterable)
+        while True:
+            self.enter(name)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.exit()
+            yield item
+
+    def merge(self, report):
+        '''Add the stages and users of another profile's report.'''
+        for name, statistics in report['stages'].items():
+            self.stages[name].merge(statistics)
+        self.users.extend(report['users'])
+
+    def add_user(self, user_id, seconds, report):
+        '''Note how long a user took, and add the profile of that user.'''
+        self.merge(report)
+        stages = report['stages']
+        self.users.append({
+            'user': user_id,
+            'seconds': seconds,
+            'points': stages['extraction']['points'],
+            'files': stages['parse']['files'],
+            'peak_rss': max(s['peak_rss'] for s in stages.values()),
+            'stages': dict((name, s['seconds'])
+                           for name, s in stages.items()),
+        })
+
+    def report(self):
+        return {
+            'stages': collections.OrderedDict(
+                (name, statistics.as_dict())
+                for name, statistics in self.stages.items()
+            ),
+            'users': self.users,
+            'peak_rss': peak_rss(),
+            'peak_rss_scope': self.peak_rss_scope,
+        }
+
+
+class NullProfile(object):
+    '''Stands in for a Profile when nothing is being measured.'''
+    def enter(self, name):
+        pass
+
+    def exit(self):
+        pass
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        yield
+
+    def count(self, name, points=0, files=0):
+        pass
+
+    def timed(self, name, iterable):
+        return iterable
+
+
+profile = NullProfile()
+_profiles = []
+
+
+def push(new_profile=None):
+    '''Direct instrumentation to a new Profile until pop() is called.'''
+    global profile
+    _profiles.append(profile)
+    profile = new_profile if new_profile is not None else Profile()
+    return profile
+
+
+def pop():
+    '''Go back to the profile in use before the last push(), returning the
+    report of the one it replaces.
+    '''
+    global profile
+    report = profile.report()
+    profile = _profiles.pop()
+    return report
+
+
+# The file extension of each profiler's output
+PROFILERS = {
+    'cprofile': '.prof',
+    'pyinstrument': '.html',
+}
+
+
+@contextlib.contextmanager
+def capture(path, profiler='cprofile'):
+    '''Run the body under cProfile, saving pstats to path, or under
+    pyinstrument if it is installed, saving an HTML report.
+    '''
+    if profiler == 'pyinstrument':
+        if pyinstrument is None:
+            raise RuntimeError('pyinstrument is required to profile with it')
+        capturing = pyinstrument.Profiler()
+        capturing.start()
+        try:
+            yield
+        finally:
+            capturing.stop()
+            with open(path, 'w') as output:
+                output.write(capturing.output_html())
+
+    else:
+        capturing = cProfile.Profile()
+        capturing.enable()
+        try:
+            yield
+        finally:
+            capturing.disable()
+            capturing.dump_stats(path)
+
+
+def _rate(count, seconds):
+    if seconds > 0:
+        return count / seconds
+    return None
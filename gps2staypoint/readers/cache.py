@@ -0,0 +1,87 @@
+import hashlib
+import json
+import logging
+import os
+
+import numpy
+
+from gps2staypoint.readers.plt import PLTColumns
+
+logger = logging.getLogger(__name__)
+
+
+class PLTCache(object):
+    '''Persistent cache of parsed .plt files.
+
+    Each file's PLTColumns are stored as a single structured .npy array,
+    which is memory-mapped on load so a cache hit involves no parsing at
+    all. A JSON sidecar records the path, modification time, size and
+    reader version the array was built from; any mismatch is a miss.
+    '''
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def load(self, path):
+        '''Columns of a .plt file, or None if it is not cached or has
+        changed since it was.
+        '''
+        array_path, metadata_path = self._paths(path)
+        try:
+            with open(metadata_path) as metadata_file:
+                metadata = json.load(metadata_file)
+        except (IOError, ValueError):
+            return None
+
+        if metadata != self._metadata(path):
+            logger.debug('Stale cache entry for {}'.format(path))
+            return None
+
+        try:
+            records = numpy.load(array_path, mmap_mode='r')
+        except (IOError, ValueError):
+            return None
+
+        return PLTColumns(
+            latitude=records['latitude'],
+            longitude=records['longitude'],
+            altitude=records['altitude'],
+            timestamp=records['timestamp'],
+        )
+
+    def store(self, path, columns):
+        array_path, metadata_path = self._paths(path)
+        metadata = self._metadata(path)
+
+        records = numpy.empty(len(columns), dtype=PLTColumns.DTYPE)
+        for field in records.dtype.names:
+            records[field] = getattr(columns, field)
+
+        # Write to temporary files first so that concurrent workers never
+        # see a partially written entry
+        temporary_path = '{}.{}.tmp'.format(array_path, os.getpid())
+        with open(temporary_path, 'wb') as array_file:
+            numpy.save(array_file, records)
+        os.replace(temporary_path, array_path)
+
+        temporary_path = '{}.{}.tmp'.format(metadata_path, os.getpid())
+        with open(temporary_path, 'w') as metadata_file:
+            json.dump(metadata, metadata_file)
+        os.replace(temporary_path, metadata_path)
+
+    def _paths(self, path):
+        key = hashlib.sha1(
+            os.path.abspath(path).encode('utf-8')
+        ).hexdigest()
+        base = os.path.join(self.directory, key)
+        return base + '.npy', base + '.json'
+
+    @staticmethod
+    def _metadata(path):
+        stat = os.stat(path)
+        return {
+            'path': os.path.abspath(path),
+            'mtime': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'version': PLTColumns.VERSION,
+        }
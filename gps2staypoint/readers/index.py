@@ -0,0 +1,143 @@
+import concurrent.futures
+import datetime
+import json
+import logging
+import os
+
+from gps2staypoint.readers import timestamp
+from gps2staypoint.readers.plt import PLTFileReader
+from gps2staypoint.readers.plt import PLTPoint
+
+logger = logging.getLogger(__name__)
+
+
+class PLTIndex(object):
+    '''JSON sidecar describing every known .plt file: its user, first and
+    last timestamps, record count, size and modification time.
+
+    Grouping files by user, sorting them by time and sizing progress bars
+    can then all be done from the index, without opening a single file.
+    Files are only probed again when their size or mtime changes. Files
+    that cannot be parsed are indexed with the error instead, so that they
+    are skipped until they change.
+    '''
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as index_file:
+                index = json.load(index_file)
+        except (IOError, ValueError):
+            return
+
+        if index.get('version') == self.VERSION:
+            self.entries = index['files']
+
+    def save(self):
+        temporary_path = '{}.{}.tmp'.format(self.path, os.getpid())
+        with open(temporary_path, 'w') as index_file:
+            json.dump({'version': self.VERSION, 'files': self.entries},
+                      index_file, indent=1, sort_keys=True)
+        os.replace(temporary_path, self.path)
+
+    def update(self, plt_files, workers=1):
+        '''Probe every new or modified file in parallel and forget files
+        that no longer exist. Returns the number of files probed.
+        '''
+        plt_files = [os.path.abspath(p) for p in plt_files]
+        entries = {}
+        stale = []
+        for path in plt_files:
+            if self.is_current(path):
+                entries[path] = self.entries[path]
+            else:
+                stale.append(path)
+
+        logger.debug('Probing {} of {} .plt files'.format(
+            len(stale), len(plt_files)
+        ))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) \
+                as executor:
+            for path, entry in zip(stale, executor.map(probe, stale)):
+                entries[path] = entry
+
+        self.entries = entries
+        return len(stale)
+
+    def is_current(self, path):
+        '''Whether a file is indexed, and unchanged in size and mtime since
+        it was.
+        '''
+        entry = self.entries.get(os.path.abspath(path))
+        if entry is None:
+            return False
+        stat = os.stat(path)
+        return entry['mtime'] == stat.st_mtime_ns \
+            and entry['size'] == stat.st_size
+
+    def refresh(self, path):
+        '''Probe a file again, replacing its entry.'''
+        path = os.path.abspath(path)
+        self.entries[path] = probe(path)
+
+    def error(self, path):
+        '''Why an indexed file could not be probed, or None if it was.'''
+        return self.entries[os.path.abspath(path)].get('error')
+
+    def reader(self, path, **kwargs):
+        '''A PLTFileReader whose start time and length come from the index.'''
+        entry = self.entries[os.path.abspath(path)]
+        return PLTFileReader(
+            path=path,
+            start_time=timestamp.EPOCH + datetime.timedelta(
+                seconds=entry['start_time']
+            ),
+            length=entry['line_count'],
+            **kwargs
+        )
+
+
+def probe(path):
+    '''Read the metadata of a .plt file, without parsing its records, or
+    note why it could not be read.
+    '''
+    stat = os.stat(path)
+    entry = {
+        'user': int(path.split(os.sep)[PLTFileReader.USER_ID_INDEX]),
+        'size': stat.st_size,
+        'mtime': stat.st_mtime_ns,
+    }
+    try:
+        entry.update(_probe_records(path))
+    except (ValueError, IndexError) as e:
+        logger.warning('Could not probe {}: {!r}'.format(path, e))
+        entry['error'] = repr(e)
+    return entry
+
+
+def _probe_records(path):
+    with open(path, 'rb') as plt_file:
+        data = plt_file.read()
+
+    # Skip over the header to the first record
+    start = 0
+    for _ in range(PLTFileReader.HEADER_LINE_COUNT):
+        start = data.index(b'\n', start) + 1
+
+    records = data[start:]
+    line_count = records.count(b'\n')
+    if records and not records.endswith(b'\n'):
+        line_count += 1
+
+    first_line = records.split(b'\n', 1)[0].decode()
+    last_line = records.rstrip().rsplit(b'\n', 1)[-1].decode()
+    return {
+        'start_time': PLTPoint(line=first_line).epoch_seconds,
+        'end_time': PLTPoint(line=last_line).epoch_seconds,
+        'line_count': line_count,
+    }
@@ -1,80 +1,336 @@
+import datetime
+import io
 import logging
 import os
+import warnings
 
+import numpy
+
+from gps2staypoint import config
+from gps2staypoint import profiling
 from gps2staypoint.gps import GPSPoint
+from gps2staypoint.readers import timestamp
 
 logger = logging.getLogger(__name__)
 
-import dateutil.parser
-
 
 class PLTFileReader(object):
     USER_ID_INDEX = -3
+    HEADER_LINE_COUNT = 6
+    COLUMNAR = config.PLT_COLUMNAR_READER
+    # A PLTCache to load previously parsed files from, if any
+    CACHE = None
+    # A prefetch.PLTPrefetcher parsing upcoming files in the background, if
+    # any
+    PREFETCHER = None
 
-    def __init__(self, path):
+    def __init__(self, path, columnar=None, cache=None, start_time=None,
+                 length=None):
         self.path = path
+        if columnar is not None:
+            self.COLUMNAR = columnar
+        if cache is not None:
+            self.CACHE = cache
 
         # extract useful information from file
         self.user = int(path.split(os.sep)[self.USER_ID_INDEX])
 
-        # get the first timestamp of the first record in the file
-        file = self.open()
-        first_line = next(file)
-        file.close()
+        # The first timestamp and the number of records are only read from
+        # the file when first needed, unless they are already known (e.g.
+        # from a PLTIndex)
+        self._start_time = start_time
+        self._length = length
 
-        self.start_time = PLTPoint(line=first_line).timestamp
+    @property
+    def start_time(self):
+        if self._start_time is None:
+            # get the first timestamp of the first record in the file
+            with profiling.profile.stage('probe'):
+                with self.open() as file:
+                    first_line = next(file)
+                self._start_time = PLTPoint(line=first_line).timestamp
+            profiling.profile.count('probe', files=1)
+        return self._start_time
 
     def open(self):
         '''Open .plt file and skip the first few lines.'''
         gps_log = open(self.path)
-        for _ in range(6):
+        for _ in range(self.HEADER_LINE_COUNT):
             next(gps_log)
         return gps_log
 
+    def read_columns(self):
+        '''Parse every record of the file exactly once into typed arrays.'''
+        with profiling.profile.stage('parse'):
+            columns = None
+            if self.PREFETCHER is not None:
+                columns = self.PREFETCHER.take(self)
+            if columns is None:
+                columns = self._read_columns()
+        profiling.profile.count('parse', points=len(columns), files=1)
+        return columns
+
+    def _read_columns(self):
+        if self.CACHE is not None:
+            columns = self.CACHE.load(self.path)
+            if columns is not None:
+                return columns
+
+        columns = PLTColumns.from_file(
+            path=self.path,
+            header_line_count=self.HEADER_LINE_COUNT
+        )
+
+        if self.CACHE is not None:
+            self.CACHE.store(self.path, columns)
+        return columns
+
     def __iter__(self):
-        log = self.open()
-        for line in log:
-            yield PLTPoint(line=line)
-        log.close()
+        if self.COLUMNAR:
+            columns = self.read_columns()
+            for i in range(len(columns)):
+                yield PLTColumnPoint(columns=columns, index=i)
+
+        else:
+            log = self.open()
+            points = (PLTPoint(line=line) for line in log)
+            point_count = 0
+            for point in profiling.profile.timed('parse', points):
+                point_count += 1
+                yield point
+            log.close()
+            profiling.profile.count('parse', points=point_count, files=1)
+
+    def __len__(self):
+        if self._length is None:
+            with self.open() as log:
+                self._length = sum(1 for _ in log)
+        return self._length
+
+
+class PLTColumns(object):
+    '''Columnar view of a .plt file: one typed array per field.
+
+    Timestamps are stored as int64 seconds since the Unix epoch, in the
+    same (naive, GMT) frame as the date and time fields of the file.
+    '''
+    # Bump whenever parsing changes, to invalidate cached columns
+    VERSION = 2
+    DTYPE = numpy.dtype([
+        ('latitude', numpy.float64),
+        ('longitude', numpy.float64),
+        ('altitude', numpy.float64),
+        ('timestamp', numpy.int64),
+    ])
+
+    def __init__(self, latitude, longitude, altitude, timestamp):
+        self.latitude = latitude
+        self.longitude = longitude
+        self.altitude = altitude
+        self.timestamp = timestamp
+
+    @classmethod
+    def from_file(cls, path, header_line_count):
+        '''Parse the records of a .plt file in bulk.
+
+        The header lines are skipped, and the numeric columns of every
+        record are then converted straight from the open file by a single
+        call to numpy.loadtxt, without first reading the file into memory.
+        Files with malformed records are parsed line by line by
+        from_lines() instead.
+        '''
+        with open(path, 'rb') as records:
+            for _ in range(header_line_count):
+                if not records.readline().endswith(b'\n'):
+                    return cls.from_lines([])
+            start = records.tell()
+
+            try:
+                with warnings.catch_warnings():
+                    # An empty file is not worth a warning
+                    warnings.simplefilter('ignore', UserWarning)
+                    table = numpy.loadtxt(
+                        records,
+                        delimiter=',',
+                        usecols=(PLTPoint.LATITUDE_INDEX,
+                                 PLTPoint.LONGITUDE_INDEX,
+                                 PLTPoint.ALTITUDE_INDEX,
+                                 PLTPoint.DAY_FRACTION_INDEX),
+                        dtype=numpy.float64,
+                        ndmin=2,
+                    )
+
+            except (ValueError, IndexError):
+                logger.debug('Malformed records in {}, parsing them line by '
+                             'line'.format(path))
+                records.seek(start)
+                return cls.from_lines(io.TextIOWrapper(records))
+
+        return cls(
+            latitude=numpy.ascontiguousarray(table[:, 0]),
+            longitude=numpy.ascontiguousarray(table[:, 1]),
+            altitude=numpy.ascontiguousarray(table[:, 2]),
+            timestamp=timestamp.day_fractions_to_epoch(table[:, 3]),
+        )
+
+    @classmethod
+    def from_lines(cls, lines):
+        latitudes = []
+        longitudes = []
+        altitudes = []
+        day_fractions = []
+        malformed = []
+        for i, line in enumerate(lines):
+            fields = line.rstrip().split(',')
+            latitudes.append(float(fields[PLTPoint.LATITUDE_INDEX]))
+            longitudes.append(float(fields[PLTPoint.LONGITUDE_INDEX]))
+            altitudes.append(float(fields[PLTPoint.ALTITUDE_INDEX]))
+            try:
+                day_fractions.append(
+                    float(fields[PLTPoint.DAY_FRACTION_INDEX])
+                )
+            except (ValueError, IndexError):
+                day_fractions.append(numpy.nan)
+                malformed.append((i, fields))
+
+        # Timestamps come from the day-fraction column in a single vectorized
+        # pass, only decoding the date and time fields of malformed lines
+        day_fractions = numpy.array(day_fractions, dtype=numpy.float64)
+        timestamps = timestamp.day_fractions_to_epoch(
+            numpy.nan_to_num(day_fractions)
+        )
+        for i, fields in malformed:
+            timestamps[i] = timestamp.decoder.epoch_seconds(
+                date=fields[PLTPoint.DATE_INDEX],
+                time=fields[PLTPoint.TIME_INDEX]
+            )
+
+        return cls(
+            latitude=numpy.array(latitudes, dtype=numpy.float64),
+            longitude=numpy.array(longitudes, dtype=numpy.float64),
+            altitude=numpy.array(altitudes, dtype=numpy.float64),
+            timestamp=timestamps,
+        )
+
+    @classmethod
+    def from_points(cls, points):
+        '''Gather the fields of a list of GPS points, of any kind, into
+        columns.
+        '''
+        count = len(points)
+        return cls(
+            latitude=numpy.fromiter((p.latitude for p in points),
+                                    dtype=numpy.float64, count=count),
+            longitude=numpy.fromiter((p.longitude for p in points),
+                                     dtype=numpy.float64, count=count),
+            altitude=numpy.fromiter((p.altitude for p in points),
+                                    dtype=numpy.float64, count=count),
+            timestamp=numpy.fromiter((p.epoch_seconds for p in points),
+                                     dtype=numpy.int64, count=count),
+        )
+
+    @classmethod
+    def concatenate(cls, parts):
+        if len(parts) == 1:
+            return parts[0]
+        return cls(
+            latitude=numpy.concatenate([c.latitude for c in parts]),
+            longitude=numpy.concatenate([c.longitude for c in parts]),
+            altitude=numpy.concatenate([c.altitude for c in parts]),
+            timestamp=numpy.concatenate([c.timestamp for c in parts]),
+        )
+
+    def copy(self):
+        '''The same records, in arrays of their own.'''
+        return PLTColumns(
+            latitude=self.latitude.copy(),
+            longitude=self.longitude.copy(),
+            altitude=self.altitude.copy(),
+            timestamp=self.timestamp.copy(),
+        )
+
+    def slice(self, start, stop):
+        '''Records start to stop, as views of the same arrays.'''
+        return PLTColumns(
+            latitude=self.latitude[start:stop],
+            longitude=self.longitude[start:stop],
+            altitude=self.altitude[start:stop],
+            timestamp=self.timestamp[start:stop],
+        )
+
+    def __getitem__(self, index):
+        return PLTColumnPoint(columns=self, index=index)
 
     def __len__(self):
-        log = self.open()
-        return len(list(log))
+        return len(self.timestamp)
 
 
 class PLTPoint(GPSPoint):
     LATITUDE_INDEX = 0
     LONGITUDE_INDEX = 1
+    ALTITUDE_INDEX = 3
+    DAY_FRACTION_INDEX = 4
     DATE_INDEX = -2
     TIME_INDEX = -1
 
+    __slots__ = ('latitude', 'longitude', 'altitude', 'epoch_seconds')
+
     def __init__(self, line):
         # Split the lines into seperate fields
         # '39.890275,116.453691,0,157,39925.4486111111,2009-04-22,10:46:00'
         #       mapped to
         # ['39.890275', '116.453691', '0', '157', '39925.4486111111',
         #  '2009-04-22', '10:46:00']
-        self.line = line.rstrip().split(',')
+        fields = line.rstrip().split(',')
 
-    @property
-    def latitude(self):
-        # Extract only the lat, long, date, and time fields, merging the
-        #   date and time fields, and convert to the appropriate data types
-        # ['39.890275', '116.453691', '0', '157', '39925.4486111111',
-        #  '2009-04-22', '10:46:00']
-        #       mapped to
+        # Extract only the lat, long, altitude, date, and time fields,
+        #   merging the date and time fields, and convert to the appropriate
+        #   data types
         #     * latitude: 39.890275
         #     * longitude: 116.453691
-        #     * timestamp: datetime.datetime(2009, 4, 22, 10, 46)
-        return float(self.line[self.LATITUDE_INDEX])
+        #     * altitude: 157.0
+        #     * epoch_seconds: 1240397160 (i.e. 2009-04-22 10:46:00)
+        self.latitude = float(fields[self.LATITUDE_INDEX])
+        self.longitude = float(fields[self.LONGITUDE_INDEX])
+        self.altitude = float(fields[self.ALTITUDE_INDEX])
+        self.epoch_seconds = timestamp.decoder.epoch_seconds(
+            date=fields[self.DATE_INDEX],
+            time=fields[self.TIME_INDEX]
+        )
+
+    @property
+    def timestamp(self):
+        return timestamp.EPOCH + datetime.timedelta(
+            seconds=self.epoch_seconds
+        )
+
+
+class PLTColumnPoint(GPSPoint):
+    '''A single record of a PLTColumns, read straight from its arrays.'''
+    __slots__ = ('columns', 'index')
+
+    def __init__(self, columns, index):
+        self.columns = columns
+        self.index = index
+
+    @property
+    def latitude(self):
+        return float(self.columns.latitude[self.index])
 
     @property
     def longitude(self):
-        return float(self.line[self.LONGITUDE_INDEX])
+        return float(self.columns.longitude[self.index])
+
+    @property
+    def altitude(self):
+        return float(self.columns.altitude[self.index])
+
+    @property
+    def epoch_seconds(self):
+        return int(self.columns.timestamp[self.index])
 
     @property
     def timestamp(self):
-        return dateutil.parser.parse(' '.join([
-            self.line[self.DATE_INDEX],
-            self.line[self.TIME_INDEX]
-        ]))
+        return timestamp.EPOCH + datetime.timedelta(
+            seconds=self.epoch_seconds
+        )
@@ -0,0 +1,149 @@
+'''Read and parse upcoming .plt files on background threads while the
+current ones are split into trajectories and their staypoints extracted, so
+that waiting on storage overlaps with the work on points already read.
+
+The files queued are parsed in order by a small thread pool, never more than
+a number of files, nor more than a number of bytes of them, ahead of the
+file being processed. Parsing spends most of its time reading the file and
+inside numpy.loadtxt, both of which let the main thread carry on.
+'''
+import collections
+import logging
+import os
+from concurrent import futures
+
+from gps2staypoint import config
+
+logger = logging.getLogger(__name__)
+
+
+class PLTPrefetcher(object):
+    '''Parses the columns of queued PLTFileReaders ahead of their use.
+
+    Installed as PLTFileReader.PREFETCHER, every reader's read_columns()
+    takes its columns from here if they were prefetched, and reads the file
+    itself otherwise. Each file's size on disk stands in for the memory its
+    columns take until they are taken; however large, one file is always
+    allowed in flight.
+    '''
+    def __init__(self, depth=None, memory_limit=None, threads=None):
+        if depth is None:
+            depth = config.PLT_PREFETCH_DEPTH
+        if memory_limit is None:
+            memory_limit = config.PLT_PREFETCH_MEMORY
+        if threads is None:
+            threads = config.PLT_PREFETCH_THREADS
+        self.depth = depth
+        self.memory_limit = memory_limit
+        self.threads = threads
+
+        # Readers queued but not yet submitted, in the order they will be
+        # read, and the (future, size) of those submitted but not yet taken
+        self.waiting = collections.deque()
+        self.pending = {}
+        self.memory = 0
+        # Started on first use, so that forked worker processes never
+        # inherit a running pool
+        self._executor = None
+
+    def add(self, readers):
+        '''Queue readers to be parsed, skipping any already queued.'''
+        queued = set(self.waiting)
+        for reader in readers:
+            if reader not in queued and reader not in self.pending:
+                self.waiting.append(reader)
+                queued.add(reader)
+        self._fill()
+
+    def take(self, reader):
+        '''The columns of a reader if it was queued, waiting for them to be
+        parsed if need be, or None if the reader was never queued.
+        '''
+        if reader not in self.pending:
+            if reader in self.waiting:
+                # Everything queued before it was skipped, and reading it
+                # here is no slower than waiting for a thread to
+                self._discard(list(self.pending))
+                while self.waiting.popleft() is not reader:
+                    pass
+                self._fill()
+            return None
+
+        # Files queued before this one were skipped, e.g. when processing a
+        # user failed part way, and would otherwise be held on to forever
+        queued = list(self.pending)
+        self._discard(queued[:queued.index(reader)])
+        future, size = self.pending.pop(reader)
+        self.memory -= size
+        try:
+            return future.result()
+        finally:
+            self._fill()
+
+    def __len__(self):
+        '''Number of files queued or being parsed.'''
+        return len(self.waiting) + len(self.pending)
+
+    def close(self):
+        '''Forget every queued file and stop the threads.'''
+        self.waiting.clear()
+        for future, _ in self.pending.values():
+            future.cancel()
+        self.pending.clear()
+        self.memory = 0
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _discard(self, readers):
+        for reader in readers:
+            future, size = self.pending.pop(reader)
+            future.cancel()
+            self.memory -= size
+
+    def _fill(self):
+        while self.waiting and len(self.pending) < self.depth:
+            reader = self.waiting[0]
+            size = _file_size(reader.path)
+            if self.pending and self.memory + size > self.memory_limit:
+                break
+
+            self.waiting.popleft()
+            if self._executor is None:
+                self._executor = futures.ThreadPoolExecutor(
+                    max_workers=self.threads
+                )
+            self.pending[reader] = (
+                self._executor.submit(reader._read_columns), size
+            )
+            self.memory += size
+
+
+def prefetch_users(users, prefetcher):
+    '''Pass users through, queueing the files of upcoming users as soon as
+    fewer than the prefetcher's depth of files are left in its queue, so
+    that reading ahead carries on across users.
+    '''
+    users = iter(users)
+    upcoming = collections.deque()
+    exhausted = False
+    while True:
+        while not exhausted \
+                and (not upcoming or len(prefetcher) < prefetcher.depth):
+            user = next(users, None)
+            if user is None:
+                exhausted = True
+            else:
+                prefetcher.add(user.gps_logs)
+                upcoming.append(user)
+
+        if not upcoming:
+            return
+        yield upcoming.popleft()
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
@@ -0,0 +1,96 @@
+'''Read back staypoint tables written by writers.table, a chunk at a time,
+so that no more than one chunk of rows is ever held as Python objects.
+'''
+import csv
+import itertools
+import os
+
+import numpy
+
+from gps2staypoint.writers.table import STAYPOINT_FIELDS
+from gps2staypoint.writers.table import TABLE_WRITERS
+
+try:
+    import pyarrow
+    from pyarrow import dataset
+    from pyarrow import ipc
+except ImportError:
+    pyarrow = None
+
+CHUNK_SIZE = 65536
+
+# NumPy type of each column; users are read back as integers
+FIELD_TYPES = {
+    'user': numpy.int64,
+    'trajectory': str,
+    'latitude': numpy.float64,
+    'longitude': numpy.float64,
+    'arrival': numpy.int64,
+    'departure': numpy.int64,
+    'duration': numpy.int64,
+    'point_count': numpy.int64,
+    'radius': numpy.float64,
+}
+
+
+def guess_format(path):
+    if os.path.isdir(path):
+        return 'parquet'
+    extension = os.path.splitext(path)[1].lstrip('.')
+    if extension in TABLE_WRITERS:
+        return extension
+    return 'csv'
+
+
+def iter_column_chunks(path, format=None, chunk_size=CHUNK_SIZE):
+    '''Yield the table a chunk of rows at a time, each chunk a dict of one
+    NumPy array per field of STAYPOINT_FIELDS.
+    '''
+    if format is None:
+        format = guess_format(path)
+    if format == 'csv':
+        chunks = _iter_csv_chunks(path, chunk_size)
+    elif pyarrow is None:
+        raise ImportError('pyarrow is required to read {} '
+                          'files'.format(format))
+    elif format == 'arrow':
+        chunks = _iter_arrow_chunks(path, chunk_size)
+    else:
+        chunks = _iter_parquet_chunks(path, chunk_size)
+
+    for chunk in chunks:
+        yield dict((field, numpy.asarray(chunk[field],
+                                         dtype=FIELD_TYPES[field]))
+                   for field in STAYPOINT_FIELDS)
+
+
+def _iter_csv_chunks(path, chunk_size):
+    with open(path, newline='') as table_file:
+        reader = csv.reader(table_file)
+        header = next(reader)
+        while True:
+            rows = list(itertools.islice(reader, chunk_size))
+            if not rows:
+                return
+            yield dict(zip(header, zip(*rows)))
+
+
+def _iter_arrow_chunks(path, chunk_size):
+    with pyarrow.OSFile(path, 'rb') as source:
+        reader = ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            for offset in range(0, batch.num_rows, chunk_size):
+                yield _batch_columns(batch.slice(offset, chunk_size))
+
+
+def _iter_parquet_chunks(path, chunk_size):
+    # The user column only lives in the names of the partition directories
+    table = dataset.dataset(path, format='parquet', partitioning='hive')
+    for batch in table.to_batches(batch_size=chunk_size):
+        yield _batch_columns(batch)
+
+
+def _batch_columns(batch):
+    return dict((name, column.to_numpy(zero_copy_only=False))
+                for name, column in zip(batch.schema.names, batch.columns))
@@ -0,0 +1,88 @@
+import calendar
+import datetime
+import logging
+
+import dateutil.parser
+import numpy
+
+logger = logging.getLogger(__name__)
+
+
+EPOCH = datetime.datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+SECONDS_PER_DAY = 86400
+
+# The day-fraction column of a .plt file counts days since 1899-12-30
+DAY_FRACTION_EPOCH_OFFSET = EPOCH_ORDINAL \
+                            - datetime.date(1899, 12, 30).toordinal()
+
+
+class TimestampDecoder(object):
+    '''Decode GeoLife's fixed 'YYYY-MM-DD', 'HH:MM:SS' fields into seconds
+    since the Unix epoch.
+
+    Dates are sliced and converted once, then looked up in a cache since a
+    file only spans a handful of days. Anything that does not fit the fixed
+    layout is handed to dateutil, and counted in fallback_count.
+    '''
+    def __init__(self):
+        self._epoch_days = {}
+        self.fallback_count = 0
+
+    def epoch_seconds(self, date, time):
+        try:
+            epoch_day = self._epoch_days[date]
+        except KeyError:
+            try:
+                epoch_day = self._epoch_day(date)
+            except ValueError:
+                return self._fallback(date, time)
+            self._epoch_days[date] = epoch_day
+
+        if len(time) != 8 or time[2] != ':' or time[5] != ':':
+            return self._fallback(date, time)
+
+        try:
+            hours = int(time[0:2])
+            minutes = int(time[3:5])
+            seconds = int(time[6:8])
+        except ValueError:
+            return self._fallback(date, time)
+
+        if hours > 23 or minutes > 59 or seconds > 59:
+            return self._fallback(date, time)
+
+        return epoch_day * SECONDS_PER_DAY \
+               + hours * 3600 + minutes * 60 + seconds
+
+    def datetime(self, date, time):
+        return EPOCH + datetime.timedelta(
+            seconds=self.epoch_seconds(date, time)
+        )
+
+    @staticmethod
+    def _epoch_day(date):
+        if len(date) != 10 or date[4] != '-' or date[7] != '-':
+            raise ValueError('Unexpected date layout: {}'.format(date))
+
+        return datetime.date(
+            int(date[0:4]), int(date[5:7]), int(date[8:10])
+        ).toordinal() - EPOCH_ORDINAL
+
+    def _fallback(self, date, time):
+        self.fallback_count += 1
+        logger.debug('Falling back to dateutil for "{} {}"'.format(date, time))
+        timestamp = dateutil.parser.parse(' '.join([date, time]))
+        return calendar.timegm(timestamp.timetuple())
+
+
+def day_fractions_to_epoch(day_fractions):
+    '''Convert an array of the day-fraction column (days since 1899-12-30)
+    into int64 seconds since the Unix epoch.
+    '''
+    day_fractions = numpy.asarray(day_fractions, dtype=numpy.float64)
+    seconds = (day_fractions - DAY_FRACTION_EPOCH_OFFSET) * SECONDS_PER_DAY
+    return numpy.rint(seconds).astype(numpy.int64)
+
+
+decoder = TimestampDecoder()
@@ -0,0 +1,273 @@
+'''Similarity between users from the sequences of shared locations they
+visit, after Li et al.
+
+At each level of a clustering.LocationHierarchy, every user's staypoints
+become a sequence of location ids in order of arrival. Two users are
+similar at a level when their sequences share runs of the same locations,
+visited with similar travel times between them: every maximal shared run of
+m locations scores 2^(m - 1) times the sum of the inverse document
+frequency of its locations (so places everyone visits count for nothing),
+normalised by the product of the sequences' lengths. The levels' scores are
+combined with weights favouring the finer levels.
+
+Only pairs of users sharing at least one location that counts for
+something, and is visited by few enough users, are compared. They are found
+through an inverted index from locations to the users visiting them, one
+user at a time, and scored as they are found rather than collected first,
+since their number grows with the square of the number of users.
+'''
+import collections
+import functools
+import itertools
+import logging
+import math
+import multiprocessing
+
+import numpy
+from scipy import sparse
+
+from gps2staypoint import config
+from gps2staypoint import pipeline
+from gps2staypoint.clustering import NOISE
+
+logger = logging.getLogger(__name__)
+
+
+LocationSequence = collections.namedtuple('LocationSequence', [
+    'locations', 'arrivals', 'departures',
+])
+
+
+def location_sequences(hierarchy, level):
+    '''Each user's sequence of locations at a level of a hierarchy, in order
+    of arrival. Staypoints in no location are dropped, and consecutive
+    staypoints in the same location become a single visit.
+    '''
+    labels = hierarchy.levels[level]
+    located = numpy.flatnonzero(labels != NOISE)
+    order = located[numpy.lexsort((hierarchy.arrivals[located],
+                                   hierarchy.users[located]))]
+    users = hierarchy.users[order]
+    boundaries = numpy.flatnonzero(numpy.diff(users)) + 1
+
+    sequences = {}
+    for visits in numpy.split(order, boundaries):
+        if not len(visits):
+            continue
+        locations = labels[visits]
+        # First visit of each run of visits to the same location
+        firsts = numpy.flatnonzero(
+            numpy.append(True, locations[1:] != locations[:-1])
+        )
+        lasts = numpy.append(firsts[1:], len(visits)) - 1
+        sequences[int(hierarchy.users[visits[0]])] = LocationSequence(
+            locations=locations[firsts],
+            arrivals=hierarchy.arrivals[visits][firsts],
+            departures=hierarchy.departures[visits][lasts],
+        )
+    return sequences
+
+
+def inverse_document_frequencies(sequences, user_count):
+    '''log(users / users visiting the location) of every location.'''
+    visitors = collections.Counter()
+    for sequence in sequences.values():
+        visitors.update(numpy.unique(sequence.locations).tolist())
+    return dict((location, math.log(user_count / count))
+                for location, count in visitors.items())
+
+
+def inverted_index(sequences):
+    '''The users visiting each location.'''
+    index = collections.defaultdict(list)
+    for user, sequence in sequences.items():
+        for location in numpy.unique(sequence.locations).tolist():
+            index[location].append(user)
+    return index
+
+
+def candidate_pairs(sequences_by_level, idfs_by_level,
+                    max_location_users=None):
+    '''Lazily generate, in order, the pairs of users, smaller id first,
+    sharing a location at any level that scores above zero and is visited
+    by at most max_location_users.
+
+    Only the partners of one user at a time are held in memory, rather than
+    every pair.
+    '''
+    # The users of every location that counts, keyed by level and location,
+    # and the keys of those each user visits
+    location_users = {}
+    user_locations = collections.defaultdict(list)
+    for level, (sequences, idfs) in enumerate(zip(sequences_by_level,
+                                                  idfs_by_level)):
+        for location, users in inverted_index(sequences).items():
+            if idfs[location] <= 0:
+                continue
+            if max_location_users is not None \
+                    and len(users) > max_location_users:
+                continue
+            location_users[(level, location)] = users
+            for user in users:
+                user_locations[user].append((level, location))
+
+    for user in sorted(user_locations):
+        partners = set()
+        for key in user_locations[user]:
+            partners.update(location_users[key])
+        for partner in sorted(partners):
+            if partner > user:
+                yield user, partner
+
+
+def sequence_similarity(a, b, idfs, time_ratio):
+    '''Score of the maximal runs of locations shared by two sequences,
+    normalised by the product of their lengths.
+
+    Consecutive shared locations only extend a run if the times taken to
+    travel between them, from departing one to arriving at the next, differ
+    by at most time_ratio of the longer one.
+    '''
+    positions = collections.defaultdict(list)
+    for j, location in enumerate(b.locations.tolist()):
+        positions[location].append(j)
+
+    a_locations = a.locations.tolist()
+    a_arrivals = a.arrivals.tolist()
+    a_departures = a.departures.tolist()
+    b_arrivals = b.arrivals.tolist()
+    b_departures = b.departures.tolist()
+    # (length, idf sum) of the shared run ending at each matched pair of
+    # positions
+    runs = {}
+    for i, location in enumerate(a_locations):
+        for j in positions.get(location, ()):
+            length, weight = 1, idfs[location]
+            previous = runs.get((i - 1, j - 1))
+            if previous is not None and _similar_travel(
+                    a_arrivals[i] - a_departures[i - 1],
+                    b_arrivals[j] - b_departures[j - 1], time_ratio):
+                length += previous[0]
+                weight += previous[1]
+                # The previous pair is no longer the end of a maximal run
+                runs[(i - 1, j - 1)] = None
+            runs[(i, j)] = (length, weight)
+
+    score = sum(2 ** (run[0] - 1) * run[1]
+                for run in runs.values() if run is not None)
+    return score / (len(a.locations) * len(b.locations))
+
+
+def _similar_travel(a_seconds, b_seconds, time_ratio):
+    longest = max(a_seconds, b_seconds)
+    return longest <= 0 or abs(a_seconds - b_seconds) <= time_ratio * longest
+
+
+def level_weights(level_count):
+    '''Weight of each level, finest first: each level counts twice as much
+    as the coarser one above it, and the weights add up to one.
+    '''
+    weights = [2 ** (level_count - 1 - level) for level in range(level_count)]
+    return [weight / sum(weights) for weight in weights]
+
+
+# Sequences and settings shared with the worker processes by share()
+_shared = {}
+
+
+def share(sequences_by_level, idfs_by_level, weights, time_ratio):
+    _shared.update(sequences_by_level=sequences_by_level,
+                   idfs_by_level=idfs_by_level,
+                   weights=weights,
+                   time_ratio=time_ratio)
+
+
+def score_pairs(pairs):
+    '''(a, b, similarity over every level) of each pair of users scoring
+    above zero.
+    '''
+    scores = []
+    for a, b in pairs:
+        score = 0
+        for sequences, idfs, weight in zip(_shared['sequences_by_level'],
+                                           _shared['idfs_by_level'],
+                                           _shared['weights']):
+            if a in sequences and b in sequences:
+                score += weight * sequence_similarity(
+                    sequences[a], sequences[b], idfs, _shared['time_ratio']
+                )
+        if score > 0:
+            scores.append((a, b, score))
+    return scores
+
+
+def similarity_matrix(hierarchy, workers=1, time_ratio=None,
+                      max_location_users=None, chunk_size=1000):
+    '''Symmetric sparse matrix of the similarity of every pair of users,
+    indexed by user id, holding only the pairs scoring above zero.
+    '''
+    if time_ratio is None:
+        time_ratio = config.SIMILARITY_TRAVEL_TIME_RATIO
+    if max_location_users is None:
+        max_location_users = config.SIMILARITY_MAX_LOCATION_USERS
+
+    user_count = len(numpy.unique(hierarchy.users))
+    sequences_by_level = [location_sequences(hierarchy, level)
+                          for level in range(len(hierarchy.levels))]
+    idfs_by_level = [inverse_document_frequencies(sequences, user_count)
+                     for sequences in sequences_by_level]
+    settings = functools.partial(share,
+                                 sequences_by_level=sequences_by_level,
+                                 idfs_by_level=idfs_by_level,
+                                 weights=level_weights(len(hierarchy.levels)),
+                                 time_ratio=time_ratio)
+
+    pairs = candidate_pairs(sequences_by_level, idfs_by_level,
+                            max_location_users=max_location_users)
+    pair_count = 0
+
+    def chunks():
+        nonlocal pair_count
+        while True:
+            chunk = list(itertools.islice(pairs, chunk_size))
+            if not chunk:
+                return
+            pair_count += len(chunk)
+            yield chunk
+
+    # Only the pairs scoring above zero are kept
+    rows = []
+    columns = []
+    scores = []
+    if workers > 1:
+        with multiprocessing.Pool(processes=workers,
+                                  initializer=settings) as pool:
+            results = pipeline.imap_bounded(
+                pool, score_pairs, chunks(),
+                window=config.WORKER_QUEUE_DEPTH * workers
+            )
+            for scored in results:
+                _extend(scored, rows, columns, scores)
+    else:
+        settings()
+        for scored in map(score_pairs, chunks()):
+            _extend(scored, rows, columns, scores)
+    logger.info('Compared {} of {} pairs of users'.format(
+        pair_count, user_count * (user_count - 1) // 2
+    ))
+
+    size = int(hierarchy.users.max()) + 1 if len(hierarchy) else 0
+    upper = sparse.coo_matrix(
+        (numpy.array(scores, dtype=numpy.float64),
+         (numpy.array(rows, dtype=numpy.int64),
+          numpy.array(columns, dtype=numpy.int64))),
+        shape=(size, size)
+    )
+    return (upper + upper.T).tocsr()
+
+
+def _extend(scored, rows, columns, scores):
+    for a, b, score in scored:
+        rows.append(a)
+        columns.append(b)
+        scores.append(score)
@@ -0,0 +1,278 @@
+'''Spatial index over extracted staypoints.
+
+Staypoints are bucketed into geohash cells, kept sorted by cell so that the
+staypoints of any cell, or of any coarser cell named by a shorter geohash,
+are one contiguous slice. Radius and nearest neighbour queries go through a
+KD-tree over earth-centred (ECEF) coordinates, built on first use, so no
+projection origin has to be chosen and distances hold anywhere on earth.
+'''
+import logging
+import math
+
+import numpy
+from scipy import spatial
+
+from gps2staypoint import config
+from gps2staypoint.utils.projection import EARTH_RADIUS
+
+logger = logging.getLogger(__name__)
+
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+BITS_PER_CHARACTER = 5
+
+
+class StaypointIndex(object):
+    VERSION = 1
+
+    def __init__(self, users, trajectories, latitudes, longitudes, arrivals,
+                 departures, precision=None):
+        if precision is None:
+            precision = config.STAYPOINT_INDEX_GEOHASH_PRECISION
+        self.precision = precision
+
+        cells = geohash_cells(latitudes, longitudes, precision)
+        order = numpy.argsort(cells, kind='mergesort')
+        self.cells = cells[order]
+        self.users = numpy.asarray(users, dtype=numpy.int64)[order]
+        self.trajectories = numpy.asarray(trajectories, dtype=str)[order]
+        self.latitudes = numpy.asarray(latitudes, dtype=numpy.float64)[order]
+        self.longitudes = numpy.asarray(longitudes,
+                                        dtype=numpy.float64)[order]
+        self.arrivals = numpy.asarray(arrivals, dtype=numpy.int64)[order]
+        self.departures = numpy.asarray(departures, dtype=numpy.int64)[order]
+        self._tree = None
+
+    @classmethod
+    def from_rows(cls, rows, precision=None):
+        '''Index rows in the layout of writers.table.STAYPOINT_FIELDS.'''
+        rows = list(rows)
+        if not rows:
+            return cls([], [], [], [], [], [], precision=precision)
+        users, trajectories, latitudes, longitudes, arrivals, departures = \
+            list(zip(*rows))[:6]
+        return cls(users=[int(user) for user in users],
+                   trajectories=trajectories,
+                   latitudes=latitudes,
+                   longitudes=longitudes,
+                   arrivals=arrivals,
+                   departures=departures,
+                   precision=precision)
+
+    @classmethod
+    def load(cls, path):
+        with numpy.load(path) as saved:
+            if int(saved['version']) != cls.VERSION:
+                raise ValueError('{} was saved by an incompatible version of '
+                                 'StaypointIndex'.format(path))
+            # Already sorted by cell, so sorting again keeps the same order
+            return cls(users=saved['users'],
+                       trajectories=saved['trajectories'],
+                       latitudes=saved['latitudes'],
+                       longitudes=saved['longitudes'],
+                       arrivals=saved['arrivals'],
+                       departures=saved['departures'],
+                       precision=int(saved['precision']))
+
+    def save(self, path):
+        with open(path, 'wb') as index_file:
+            numpy.savez_compressed(index_file,
+                                   version=self.VERSION,
+                                   precision=self.precision,
+                                   users=self.users,
+                                   trajectories=self.trajectories,
+                                   latitudes=self.latitudes,
+                                   longitudes=self.longitudes,
+                                   arrivals=self.arrivals,
+                                   departures=self.departures)
+
+    @property
+    def tree(self):
+        '''KD-tree over the staypoints' ECEF coordinates.'''
+        if self._tree is None:
+            self._tree = spatial.cKDTree(ecef(self.latitudes,
+                                              self.longitudes))
+        return self._tree
+
+    def within(self, latitude, longitude, radius):
+        '''Indices of the staypoints within radius meters of a location,
+        nearest first.
+        '''
+        if not len(self):
+            return numpy.empty(0, dtype=numpy.int64)
+        origin = ecef(latitude, longitude)
+        indices = numpy.asarray(
+            self.tree.query_ball_point(origin, r=arc_to_chord(radius)),
+            dtype=numpy.int64
+        )
+        distances = numpy.linalg.norm(self.tree.data[indices] - origin,
+                                      axis=1)
+        return indices[numpy.argsort(distances, kind='mergesort')]
+
+    def nearest(self, latitude, longitude, k=1):
+        '''Distances in meters to, and indices of, the k staypoints nearest
+        to a location, nearest first.
+        '''
+        k = min(k, len(self))
+        if not k:
+            return numpy.empty(0), numpy.empty(0, dtype=numpy.int64)
+        chords, indices = self.tree.query(ecef(latitude, longitude), k=k)
+        return chord_to_arc(numpy.atleast_1d(chords)), \
+               numpy.atleast_1d(indices)
+
+    def in_bounds(self, min_latitude, min_longitude, max_latitude,
+                  max_longitude):
+        '''Indices of the staypoints inside a latitude/longitude box, found
+        through the geohash cells the box covers.
+
+        A box whose min_longitude is east of its max_longitude, as
+        StayPoint.bounds gives for staypoints across the antimeridian, spans
+        min_longitude to 180 and -180 to max_longitude.
+        '''
+        if min_longitude > max_longitude:
+            return numpy.concatenate([
+                self.in_bounds(min_latitude, min_longitude, max_latitude,
+                               180),
+                self.in_bounds(min_latitude, -180, max_latitude,
+                               max_longitude),
+            ])
+
+        latitude_bits, longitude_bits = _bit_counts(self.precision)
+        rows = numpy.arange(
+            _quantize(min_latitude, 90, latitude_bits),
+            _quantize(max_latitude, 90, latitude_bits) + 1
+        )
+        columns = numpy.arange(
+            _quantize(min_longitude, 180, longitude_bits),
+            _quantize(max_longitude, 180, longitude_bits) + 1
+        )
+
+        if len(rows) * len(columns) > len(self):
+            # Looking up every covered cell would cost more than checking
+            # every staypoint
+            candidates = numpy.arange(len(self))
+        else:
+            rows, columns = numpy.meshgrid(rows, columns)
+            cells = _interleave(rows.ravel(), columns.ravel(),
+                                latitude_bits, longitude_bits)
+            candidates = self._members(cells, cells + 1)
+
+        inside = (self.latitudes[candidates] >= min_latitude) \
+                 & (self.latitudes[candidates] <= max_latitude) \
+                 & (self.longitudes[candidates] >= min_longitude) \
+                 & (self.longitudes[candidates] <= max_longitude)
+        return candidates[inside]
+
+    def in_cell(self, geohash):
+        '''Indices of the staypoints inside a geohash cell, at most as long
+        as the index's precision.
+        '''
+        if len(geohash) > self.precision:
+            raise ValueError('geohash {} is finer than the index precision '
+                             'of {} characters'.format(geohash,
+                                                       self.precision))
+        shift = BITS_PER_CHARACTER * (self.precision - len(geohash))
+        first = decode_geohash(geohash) << shift
+        return self._members(numpy.array([first]),
+                             numpy.array([first + (1 << shift)]))
+
+    def users_in_cell(self, geohash):
+        '''Ids of the users with a staypoint inside a geohash cell.'''
+        return numpy.unique(self.users[self.in_cell(geohash)])
+
+    def geohash(self, index):
+        return encode_geohash(int(self.cells[index]), self.precision)
+
+    def _members(self, first_cells, stop_cells):
+        starts = numpy.searchsorted(self.cells, first_cells, side='left')
+        stops = numpy.searchsorted(self.cells, stop_cells, side='left')
+        if not len(starts):
+            return numpy.empty(0, dtype=numpy.int64)
+        return numpy.concatenate([numpy.arange(start, stop)
+                                  for start, stop in zip(starts, stops)])
+
+    def __len__(self):
+        return len(self.cells)
+
+
+def geohash_cells(latitudes, longitudes, precision):
+    '''Integer geohash of each location: the bits of the base32 geohash
+    string of that many characters.
+    '''
+    latitude_bits, longitude_bits = _bit_counts(precision)
+    return _interleave(
+        _quantize(numpy.asarray(latitudes, dtype=numpy.float64), 90,
+                  latitude_bits),
+        _quantize(numpy.asarray(longitudes, dtype=numpy.float64), 180,
+                  longitude_bits),
+        latitude_bits, longitude_bits
+    )
+
+
+def encode_geohash(cell, precision):
+    characters = []
+    for _ in range(precision):
+        characters.append(GEOHASH_ALPHABET[cell & 31])
+        cell >>= BITS_PER_CHARACTER
+    return ''.join(reversed(characters))
+
+
+def decode_geohash(geohash):
+    cell = 0
+    for character in geohash:
+        cell = (cell << BITS_PER_CHARACTER) | GEOHASH_ALPHABET.index(character)
+    return cell
+
+
+def ecef(latitudes, longitudes):
+    '''Earth-centred, earth-fixed coordinates of locations on a spherical
+    earth, in meters.
+    '''
+    latitudes = numpy.radians(latitudes)
+    longitudes = numpy.radians(longitudes)
+    cos_latitudes = numpy.cos(latitudes)
+    return EARTH_RADIUS * numpy.stack([cos_latitudes * numpy.cos(longitudes),
+                                       cos_latitudes * numpy.sin(longitudes),
+                                       numpy.sin(latitudes)], axis=-1)
+
+
+def arc_to_chord(meters):
+    '''Straight-line length through the earth of an arc along its surface.
+    '''
+    return 2 * EARTH_RADIUS * math.sin(min(meters / (2 * EARTH_RADIUS),
+                                           math.pi / 2))
+
+
+def chord_to_arc(chords):
+    return 2 * EARTH_RADIUS * numpy.arcsin(
+        numpy.minimum(chords / (2 * EARTH_RADIUS), 1)
+    )
+
+
+def _bit_counts(precision):
+    '''Latitude and longitude bits of a geohash; longitude gets the odd one.
+    '''
+    bits = BITS_PER_CHARACTER * precision
+    return bits // 2, bits - bits // 2
+
+
+def _quantize(degrees, limit, bits):
+    cells = numpy.floor((numpy.asarray(degrees) + limit) / (2 * limit)
+                        * (1 << bits)).astype(numpy.int64)
+    return numpy.clip(cells, 0, (1 << bits) - 1)
+
+
+def _interleave(rows, columns, latitude_bits, longitude_bits):
+    '''Interleave latitude and longitude cell numbers into geohash bits,
+    most significant first, starting with longitude.
+    '''
+    rows = numpy.asarray(rows, dtype=numpy.int64)
+    columns = numpy.asarray(columns, dtype=numpy.int64)
+    cells = numpy.zeros(numpy.broadcast(rows, columns).shape,
+                        dtype=numpy.int64)
+    offset = longitude_bits - latitude_bits
+    for bit in range(longitude_bits - 1, -1, -1):
+        cells = (cells << 1) | ((columns >> bit) & 1)
+        if bit >= offset:
+            cells = (cells << 1) | ((rows >> (bit - offset)) & 1)
+    return cells
@@ -1,36 +1,125 @@
+import collections
+import datetime
 import logging
+import math
+
+import numpy
 
 from gps2staypoint import config
+from gps2staypoint import extent
+from gps2staypoint.readers import timestamp
 
 logger = logging.getLogger(__name__)
 
 
 class StayPoint(config.StayPointConfiguration):
-    def __init__(self, initial_point=None):
-        self.points = []
+    '''A run of consecutive points of a source trajectory that stay within
+    DISTANCE_THRESHOLD of the first of them.
+
+    Rather than holding on to every member point, a staypoint keeps running
+    aggregates of them, the location of the first and the times of the
+    first and last as plain numbers, and the index range of its points
+    within the source trajectory. Its location, bounds and duration are
+    therefore O(1) to read, however many points it has, and it keeps no
+    reference to the points, so releasing a trajectory frees them.
+    '''
+    __slots__ = ('first_location', 'arrival_seconds', 'departure_seconds',
+                 'point_count',
+                 'latitude_sum', 'longitude_sum',
+                 'min_latitude', 'max_latitude',
+                 'min_longitude', 'max_longitude',
+                 'min_eastern_longitude', 'max_western_longitude',
+                 'x_sum', 'y_sum', 'z_sum',
+                 'start',
+                 '_enclosing_circle', '_centroid_radius')
+
+    def __init__(self, initial_point=None, start=0):
+        self.first_location = None
+        self.arrival_seconds = None
+        self.departure_seconds = None
+        self.point_count = 0
+        self.latitude_sum = 0
+        self.longitude_sum = 0
+        self.min_latitude = self.min_longitude = float('inf')
+        self.max_latitude = self.max_longitude = float('-inf')
+        # Extremes of the longitudes on either side of the prime meridian,
+        # from which the bounds across the antimeridian are found
+        self.min_eastern_longitude = float('inf')
+        self.max_western_longitude = float('-inf')
+        # Sum of the points as unit vectors, for the spherical centroid
+        self.x_sum = self.y_sum = self.z_sum = 0.0
+        self.start = start
+        self._enclosing_circle = None
+        self._centroid_radius = None
         if initial_point is not None:
-            self.points.append(initial_point)
+            self._append(initial_point)
+
+    @classmethod
+    def from_range(cls, points, start, stop):
+        '''The staypoint made of points[start:stop].'''
+        staypoint = cls(start=start)
+        for point in points[start:stop]:
+            staypoint._append(point)
+        return staypoint
 
     def add_point(self, point):
-        if not self.points:
-            self.points.append(point)
+        if self.first_location is None:
+            self._append(point)
             return True
 
         else:
-            first_point = self.points[0]
-            distance = first_point.distance_to(point)
+            distance = point.distance_from(self.first_location,
+                                           metric=self.DISTANCE_METRIC)
             # logger.debug('\tDistance: {}'.format(distance))
             if distance > self.DISTANCE_THRESHOLD:
                 return False
 
             else:
-                self.points.append(point)
+                self._append(point)
                 return True
 
+    def _append(self, point):
+        latitude = point.latitude
+        longitude = point.longitude
+        epoch_seconds = point.epoch_seconds
+        if self.first_location is None:
+            self.first_location = (latitude, longitude)
+            self.arrival_seconds = epoch_seconds
+        self.departure_seconds = epoch_seconds
+        self.point_count += 1
+
+        self.latitude_sum += latitude
+        self.longitude_sum += longitude
+
+        if latitude < self.min_latitude:
+            self.min_latitude = latitude
+        if latitude > self.max_latitude:
+            self.max_latitude = latitude
+        if longitude < self.min_longitude:
+            self.min_longitude = longitude
+        if longitude > self.max_longitude:
+            self.max_longitude = longitude
+        if longitude >= 0:
+            if longitude < self.min_eastern_longitude:
+                self.min_eastern_longitude = longitude
+        elif longitude > self.max_western_longitude:
+            self.max_western_longitude = longitude
+
+        latitude = math.radians(latitude)
+        longitude = math.radians(longitude)
+        cos_latitude = math.cos(latitude)
+        self.x_sum += cos_latitude * math.cos(longitude)
+        self.y_sum += cos_latitude * math.sin(longitude)
+        self.z_sum += math.sin(latitude)
+
+    @property
+    def stop(self):
+        return self.start + self.point_count
+
     def is_valid(self):
-        first_point = self.points[0]
-        last_point = self.points[-1]
-        time_difference = last_point.timestamp - first_point.timestamp
+        time_difference = datetime.timedelta(
+            seconds=self.departure_seconds - self.arrival_seconds
+        )
         # logger.debug('Time difference between first and last points: '
         #              '{}'.format(time_difference))
         # logger.debug(self.TIME_THRESHOLD)
@@ -45,27 +134,84 @@ class StayPoint(config.StayPointConfiguration):
 
     @property
     def average_latitude(self):
-        summed_latitudes = sum(map(
-            lambda p: p.latitude,
-            self.points
-        ))
-        return summed_latitudes / len(self.points)
+        return self.latitude_sum / self.point_count
 
     @property
     def average_longitude(self):
-        summed_longitudes = sum(map(
-            lambda p: p.longitude,
-            self.points
-        ))
-        return summed_longitudes / len(self.points)
+        return self.longitude_sum / self.point_count
+
+    @property
+    def spherical_centroid(self):
+        '''Centroid of the member points on the sphere, which unlike
+        location stays correct for staypoints straddling the antimeridian.
+        '''
+        x, y, z = self.x_sum, self.y_sum, self.z_sum
+        return (math.degrees(math.atan2(z, math.hypot(x, y))),
+                math.degrees(math.atan2(y, x)))
+
+    @property
+    def bounds(self):
+        '''(south, west, north, east) bounding box of the member points.
+
+        Member points more than 180 degrees of longitude apart are taken to
+        straddle the antimeridian, and the box then runs east from the
+        westernmost of them in the eastern hemisphere to the easternmost in
+        the western one, so that west is greater than east, as in GeoJSON.
+        '''
+        if self.max_longitude - self.min_longitude > 180:
+            return (self.min_latitude, self.min_eastern_longitude,
+                    self.max_latitude, self.max_western_longitude)
+        return (self.min_latitude, self.min_longitude,
+                self.max_latitude, self.max_longitude)
+
+    def measure(self, points):
+        '''Compute the extent of the staypoint from the points of its
+        source trajectory, so that it never needs them again.
+        '''
+        members = points[self.start:self.stop]
+        latitudes = numpy.fromiter((p.latitude for p in members),
+                                   dtype=numpy.float64, count=len(members))
+        longitudes = numpy.fromiter((p.longitude for p in members),
+                                    dtype=numpy.float64, count=len(members))
+        self._enclosing_circle = extent.enclosing_circle(latitudes,
+                                                         longitudes)
+        self._centroid_radius = extent.centroid_radius(
+            latitudes, longitudes, centroid=self.location
+        )
+
+    @property
+    def enclosing_circle(self):
+        '''(latitude, longitude, radius in meters) of the smallest circle
+        enclosing the member points, as computed by measure().
+        '''
+        if self._enclosing_circle is None:
+            raise ValueError('the staypoint has not been measured')
+        return self._enclosing_circle
+
+    @property
+    def radius(self):
+        return self.enclosing_circle[2]
+
+    @property
+    def centroid_radius(self):
+        '''Distance in meters from the location to the furthest member
+        point, as computed by measure().
+        '''
+        if self._centroid_radius is None:
+            raise ValueError('the staypoint has not been measured')
+        return self._centroid_radius
 
     @property
     def arrival(self):
-        return self.points[0].timestamp
+        return timestamp.EPOCH + datetime.timedelta(
+            seconds=self.arrival_seconds
+        )
 
     @property
     def departure(self):
-        return self.points[-1].timestamp
+        return timestamp.EPOCH + datetime.timedelta(
+            seconds=self.departure_seconds
+        )
 
     @property
     def duration(self):
@@ -89,7 +235,7 @@ class StaypointBuilder(object):
         staypoint = StayPoint()
         skipped_staypoints = 0
 
-        for point in self.trajectory:
+        for i, point in enumerate(self.trajectory):
             point_added = staypoint.add_point(point=point)
 
             if not point_added:
@@ -100,7 +246,7 @@ class StaypointBuilder(object):
                 else:
                     skipped_staypoints += 1
 
-                staypoint = StayPoint(initial_point=point)
+                staypoint = StayPoint(initial_point=point, start=i)
 
         if staypoints:
             logger.debug('{: >4} detected staypoints,'
@@ -127,7 +273,7 @@ class StaypointBuilder(object):
                 continue
 
             logger.debug('Building new point at #{}'.format(i))
-            staypoint = StayPoint(initial_point=starting_point)
+            staypoint = StayPoint(initial_point=starting_point, start=i)
 
             # Build up the staypoint starting from points immediately after
             # the starting point
@@ -227,6 +373,127 @@ class StaypointBuilder(object):
     #     }
 
 
+class StaypointRange(collections.namedtuple('StaypointRange', [
+        'start', 'stop', 'latitude', 'longitude', 'arrival', 'departure'])):
+    '''A staypoint as the slice [start, stop) of a trajectory's points,
+    with its average location and arrival/departure in epoch seconds.
+    '''
+    __slots__ = ()
+
+    @classmethod
+    def from_arrays(cls, latitudes, longitudes, timestamps, start, stop):
+        return cls(
+            start=start,
+            stop=stop,
+            latitude=float(latitudes[start:stop].mean()),
+            longitude=float(longitudes[start:stop].mean()),
+            arrival=int(timestamps[start]),
+            departure=int(timestamps[stop - 1]),
+        )
+
+    @property
+    def point_count(self):
+        return self.stop - self.start
+
+    @property
+    def duration(self):
+        return self.departure - self.arrival
+
+
+def extract_staypoint_ranges(latitudes, longitudes, timestamps,
+                             distance_threshold, time_threshold, metric,
+                             initial_window=32):
+    '''Extract staypoints from whole-trajectory arrays, with the same
+    result as StaypointBuilder.extract_staypoints().
+
+    Starting from an anchor point, the first later point beyond the
+    distance threshold is found by measuring distances over windows that
+    double in size, so that each anchor costs a handful of batched distance
+    computations. That point becomes the next anchor, and the points in
+    between form a staypoint if they span at least the time threshold.
+    '''
+    point_count = len(timestamps)
+    ranges = []
+    anchor = 0
+    while anchor < point_count:
+        stop = _find_departure(latitudes, longitudes, anchor,
+                               distance_threshold, metric, initial_window)
+        if stop is None:
+            # Like the iterative algorithm, the staypoint still being built
+            # at the end of the trajectory is never emitted
+            break
+
+        if timestamps[stop - 1] - timestamps[anchor] >= time_threshold:
+            ranges.append(StaypointRange.from_arrays(
+                latitudes, longitudes, timestamps, start=anchor, stop=stop
+            ))
+
+        anchor = stop
+
+    return ranges
+
+
+def _find_departure(latitudes, longitudes, anchor, distance_threshold,
+                    metric, window):
+    '''Index of the first point after the anchor that lies beyond the
+    distance threshold, or None if every remaining point is within it.
+    '''
+    point_count = len(latitudes)
+    start = anchor + 1
+    while start < point_count:
+        stop = min(start + window, point_count)
+        distances = metric.distances(latitudes[anchor], longitudes[anchor],
+                                     latitudes[start:stop],
+                                     longitudes[start:stop])
+        beyond = numpy.flatnonzero(distances > distance_threshold)
+        if len(beyond):
+            return start + int(beyond[0])
+
+        start = stop
+        window *= 2
+
+    return None
+
+
+class ArrayStaypointBuilder(StaypointBuilder):
+    '''Staypoint extraction over a trajectory's latitude, longitude and
+    timestamp arrays rather than point by point.
+    '''
+    def extract_staypoint_ranges(self):
+        # gps.py imports this module, so defer importing it until now
+        from gps2staypoint.gps import get_distance_metric
+
+        latitudes, longitudes, timestamps = self.trajectory.as_arrays()
+        return extract_staypoint_ranges(
+            latitudes=latitudes,
+            longitudes=longitudes,
+            timestamps=timestamps,
+            distance_threshold=StayPoint.DISTANCE_THRESHOLD,
+            time_threshold=StayPoint.TIME_THRESHOLD.total_seconds(),
+            metric=get_distance_metric(StayPoint.DISTANCE_METRIC),
+        )
+
+    def extract_staypoints(self):
+        staypoints = [
+            StayPoint.from_range(points=self.trajectory,
+                                 start=r.start, stop=r.stop)
+            for r in self.extract_staypoint_ranges()
+        ]
+
+        if staypoints:
+            logger.debug('{: >4} detected staypoints'.format(
+                len(staypoints)
+            ))
+
+        return staypoints
+
+
+STAYPOINT_BUILDERS = {
+    'iterative': StaypointBuilder,
+    'array': ArrayStaypointBuilder,
+}
+
+
 # class StayPointExtractor(object):
 #     # Extract stay points from a GPS log file
 #     # Default values of distance_threshold and time_threshold are 200m and
@@ -0,0 +1,147 @@
+import datetime
+import logging
+
+import numpy
+
+from gps2staypoint.staypoint import StaypointRange
+
+logger = logging.getLogger(__name__)
+
+
+DURATION_UNITS = {
+    's': 'seconds',
+    'm': 'minutes',
+    'h': 'hours',
+}
+
+
+def parse_distances(text):
+    '''Parse comma-separated distance thresholds in meters, e.g. '50,100'.'''
+    return [float(value) for value in text.split(',')]
+
+
+def parse_durations(text):
+    '''Parse comma-separated time thresholds such as '30s,3m,1h'. Values
+    without a unit are taken as seconds.
+    '''
+    durations = []
+    for value in text.split(','):
+        value = value.strip()
+        unit = DURATION_UNITS.get(value[-1:])
+        if unit is None:
+            unit = 'seconds'
+        else:
+            value = value[:-1]
+        durations.append(datetime.timedelta(**{unit: float(value)}))
+    return durations
+
+
+class AnchorDistances(object):
+    '''Distances from anchor points to the points that follow them.
+
+    Distances are computed in windows that double in size, as in
+    extract_staypoint_ranges(), but are kept so that every distance
+    threshold starting a staypoint at the same anchor reuses them.
+    '''
+    def __init__(self, latitudes, longitudes, metric, initial_window=32):
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        self.metric = metric
+        self.initial_window = initial_window
+        self._distances = {}
+
+    def departure(self, anchor, distance_threshold):
+        '''Index of the first point after the anchor that lies beyond the
+        distance threshold, or None if every remaining point is within it.
+        '''
+        distances = self._distances.get(anchor)
+        if distances is None:
+            distances = numpy.empty(0)
+
+        beyond = numpy.flatnonzero(distances > distance_threshold)
+        point_count = len(self.latitudes)
+        while not len(beyond):
+            start = anchor + 1 + len(distances)
+            if start >= point_count:
+                break
+
+            window = max(self.initial_window, len(distances))
+            stop = min(start + window, point_count)
+            extension = self.metric.distances(
+                self.latitudes[anchor], self.longitudes[anchor],
+                self.latitudes[start:stop], self.longitudes[start:stop]
+            )
+            beyond = numpy.flatnonzero(extension > distance_threshold) \
+                     + len(distances)
+            distances = numpy.concatenate([distances, extension])
+
+        self._distances[anchor] = distances
+        if len(beyond):
+            return anchor + 1 + int(beyond[0])
+        return None
+
+
+def sweep_staypoint_ranges(latitudes, longitudes, timestamps,
+                           distance_thresholds, time_thresholds, metric):
+    '''Extract staypoints from whole-trajectory arrays for every pair of
+    distance and time thresholds.
+
+    The split of a trajectory into candidate staypoints depends only on the
+    distance threshold, so it is computed once per distance and filtered
+    for each time threshold. Distances from each anchor are shared across
+    distance thresholds.
+
+    Returns a dictionary of lists of StaypointRanges, keyed by the
+    (distance threshold, time threshold) pair that produced them.
+    '''
+    anchor_distances = AnchorDistances(latitudes, longitudes, metric)
+    point_count = len(timestamps)
+    sweep = {}
+    for distance_threshold in distance_thresholds:
+        starts = []
+        stops = []
+        anchor = 0
+        while anchor < point_count:
+            stop = anchor_distances.departure(anchor, distance_threshold)
+            if stop is None:
+                break
+
+            starts.append(anchor)
+            stops.append(stop)
+            anchor = stop
+
+        starts = numpy.array(starts, dtype=numpy.int64)
+        stops = numpy.array(stops, dtype=numpy.int64)
+        dwell_times = timestamps[stops - 1] - timestamps[starts] \
+            if len(starts) else numpy.empty(0)
+
+        for time_threshold in time_thresholds:
+            valid = dwell_times >= time_threshold.total_seconds()
+            sweep[(distance_threshold, time_threshold)] = [
+                StaypointRange.from_arrays(latitudes, longitudes, timestamps,
+                                           start=int(start), stop=int(stop))
+                for start, stop in zip(starts[valid], stops[valid])
+            ]
+
+    return sweep
+
+
+SWEEP_FIELDS = [
+    'distance_threshold', 'time_threshold', 'user', 'trajectory',
+    'start', 'stop', 'point_count', 'latitude', 'longitude',
+    'arrival', 'departure', 'duration',
+]
+
+
+def sweep_rows(user, trajectory, sweep):
+    '''Flatten the result of sweep_staypoint_ranges() into rows of
+    SWEEP_FIELDS.
+    '''
+    for (distance_threshold, time_threshold), ranges in sorted(
+            sweep.items()):
+        parameters = (distance_threshold, time_threshold.total_seconds(),
+                      user, trajectory)
+        for r in ranges:
+            yield parameters + (r.start, r.stop, r.point_count, r.latitude,
+                                r.longitude, r.arrival, r.departure,
+                                r.duration)
@@ -1,8 +1,13 @@
+import collections
+import itertools
 import logging
 import progressbar
 from geopy.distance import vincenty
 
+from gps2staypoint import config
 from gps2staypoint.gps import GPSTrajectory
+from gps2staypoint.readers.plt import PLTColumnPoint
+from gps2staypoint.readers.plt import PLTColumns
 from gps2staypoint.utils import colorize
 
 logger = logging.getLogger(__name__)
@@ -13,27 +18,54 @@ class GPSUser(object):
         self.id = id
         self.gps_logs = []
         self._trajectories = None
+        self.show_progress = True
 
     def add_plt_file(self, plt):
         self.gps_logs.append(plt)
+        self._trajectories = None
 
     def sort_trajectories_by_time(self):
         self.gps_logs.sort(key=lambda p: p.start_time)
+        self._trajectories = None
 
     @property
     def trajectories(self):
         '''Split GPS logs into trajectories, determined by the time 
         difference between two consecutive GPS records exceeding the defined 
         threshold.
+
+        The logs are only read as far as the trajectories are asked for, and
+        only once; see TrajectorySequence.
         '''
-        if self._trajectories is not None:
-            return self._trajectories
+        if self._trajectories is None:
+            self._trajectories = TrajectorySequence(
+                user=self,
+                max_cached=config.TRAJECTORY_CACHE_SIZE
+            )
+        return self._trajectories
 
-        self._trajectories = []
+    def __getstate__(self):
+        # A partly split sequence holds a generator, which cannot be sent to
+        # another process
+        state = self.__dict__.copy()
+        state['_trajectories'] = None
+        return state
+
+    def iter_trajectories(self):
+        '''Split GPS logs into trajectories like the trajectories property,
+        without keeping any of them, so that each trajectory can be released
+        as soon as the caller is done with it.
+        '''
         trajectory = GPSTrajectory(user=self)
-        for log in self.gps_logs:
+        for log_index, log in enumerate(self.gps_logs):
             logger.debug('Reading {}'.format(log.path))
-            with progressbar.ProgressBar(max_value=len(log)) as progress:
+            if self.show_progress:
+                progress = progressbar.ProgressBar(max_value=len(log))
+            else:
+                progress = progressbar.NullBar()
+            span_start = 0
+            i = 0
+            with progress:
                 for i, gps_record in enumerate(log, start=1):
                     progress.update(i)
 
@@ -69,8 +101,11 @@ class GPSUser(object):
                         ))
 
                         # Yield the previous trajectory and create a new one
-                        self._trajectories.append(trajectory)
                         # trajectory.summarize()
+                        if i - 1 > span_start:
+                            trajectory.spans.append(
+                                (log_index, span_start, i - 1)
+                            )
                         yield trajectory
 
                         logger.debug('')
@@ -78,6 +113,118 @@ class GPSUser(object):
                             initial_point=gps_record,
                             user=self,
                         )
+                        span_start = i - 1
+
+            if i > span_start:
+                trajectory.spans.append((log_index, span_start, i))
 
-        self._trajectories.append(trajectory)
         yield trajectory
+
+
+class TrajectorySequence(object):
+    '''The trajectories of a user, split from the user's GPS logs as they are
+    first asked for and kept as compact coordinate arrays, so that iterating
+    again, len() and indexing never re-read a file.
+
+    If max_cached is given, only that many of the most recently used
+    trajectories are kept. Each trajectory remembers which records of which
+    logs it was made from, so an evicted one is re-read from just those
+    files. Every access builds a new GPSTrajectory.
+    '''
+    def __init__(self, user, max_cached=None):
+        self.user = user
+        self.max_cached = max_cached
+        self._spans = []
+        # PLTColumns of each cached trajectory, least recently used first
+        self._columns = collections.OrderedDict()
+        self._splitter = user.iter_trajectories()
+
+    def _split_until(self, index):
+        '''Split off trajectories until there are more than index of them,
+        or the logs run out.
+        '''
+        while self._splitter is not None and len(self._spans) <= index:
+            try:
+                trajectory = next(self._splitter)
+            except StopIteration:
+                self._splitter = None
+                break
+
+            # A user without any records still yields one empty trajectory
+            if trajectory.points:
+                self._spans.append(trajectory.spans)
+                self._cache(len(self._spans) - 1, _compact(trajectory))
+
+    def _cache(self, index, columns):
+        self._columns[index] = columns
+        self._columns.move_to_end(index)
+        if self.max_cached is not None:
+            while len(self._columns) > self.max_cached:
+                self._columns.popitem(last=False)
+
+    def columns(self, index):
+        '''The PLTColumns of a split trajectory, re-read if evicted.'''
+        columns = self._columns.get(index)
+        if columns is None:
+            points = []
+            for log_index, start, stop in self._spans[index]:
+                log = self.user.gps_logs[log_index]
+                points.extend(itertools.islice(log, start, stop))
+            columns = PLTColumns.from_points(points)
+        self._cache(index, columns)
+        return columns
+
+    def evict(self):
+        '''Drop every cached trajectory, keeping only where each came from.
+        '''
+        self._columns.clear()
+
+    def _trajectory(self, index):
+        return GPSTrajectory.from_columns(user=self.user,
+                                          columns=self.columns(index),
+                                          spans=self._spans[index])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._trajectory(i)
+                    for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+        self._split_until(index)
+        if not 0 <= index < len(self._spans):
+            raise IndexError('trajectory index out of range')
+        return self._trajectory(index)
+
+    def __iter__(self):
+        index = 0
+        while True:
+            self._split_until(index)
+            if index >= len(self._spans):
+                return
+            yield self._trajectory(index)
+            index += 1
+
+    def __len__(self):
+        while self._splitter is not None:
+            self._split_until(len(self._spans))
+        return len(self._spans)
+
+
+def _compact(trajectory):
+    '''The points of a trajectory as PLTColumns of its own. Points read by a
+    columnar reader are sliced straight out of their file's arrays, a span at
+    a time, and copied so that the cache does not keep the whole file alive.
+    '''
+    parts = []
+    offset = 0
+    for _, start, stop in trajectory.spans:
+        first = trajectory.points[offset]
+        if not isinstance(first, PLTColumnPoint):
+            return PLTColumns.from_points(trajectory.points)
+        parts.append(first.columns.slice(first.index,
+                                         first.index + stop - start))
+        offset += stop - start
+    if len(parts) == 1:
+        return parts[0].copy()
+    return PLTColumns.concatenate(parts)
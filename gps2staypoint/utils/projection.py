@@ -0,0 +1,41 @@
+import numpy
+
+
+EARTH_RADIUS = 6371009  # meters, as used by geopy
+
+
+def local_projection(latitudes, longitudes, origin=None):
+    '''Project points onto a plane tangent to the earth at an origin,
+    returning their x (east) and y (north) coordinates in meters.
+
+    The origin defaults to the mean of the points. Distortion is negligible
+    over the few kilometers spanned by a staypoint or a stretch of
+    trajectory.
+    '''
+    latitudes = numpy.asarray(latitudes, dtype=numpy.float64)
+    longitudes = numpy.asarray(longitudes, dtype=numpy.float64)
+    if origin is None:
+        origin = (latitudes.mean(), longitudes.mean())
+    origin_latitude, origin_longitude = origin
+
+    # Wrap longitude differences so points across the antimeridian stay
+    # next to each other
+    delta_longitudes = (longitudes - origin_longitude + 180) % 360 - 180
+    x = EARTH_RADIUS * numpy.radians(delta_longitudes) \
+        * numpy.cos(numpy.radians(origin_latitude))
+    y = EARTH_RADIUS * numpy.radians(latitudes - origin_latitude)
+    return x, y
+
+
+def inverse_local_projection(x, y, origin):
+    '''Latitude and longitude of points projected by local_projection().'''
+    origin_latitude, origin_longitude = origin
+    latitudes = origin_latitude + numpy.degrees(
+        numpy.asarray(y, dtype=numpy.float64) / EARTH_RADIUS
+    )
+    longitudes = origin_longitude + numpy.degrees(
+        numpy.asarray(x, dtype=numpy.float64)
+        / (EARTH_RADIUS * numpy.cos(numpy.radians(origin_latitude)))
+    )
+    longitudes = (longitudes + 180) % 360 - 180
+    return latitudes, longitudes
@@ -0,0 +1,125 @@
+import heapq
+import logging
+
+import numpy
+
+from gps2staypoint.utils.projection import local_projection
+
+logger = logging.getLogger(__name__)
+
+
+def simplify(latitudes, longitudes, tolerance, method='douglas-peucker',
+             keep=None):
+    '''Simplify a line of GPS points, returning a boolean mask of the points
+    to keep.
+
+    The tolerance is in meters. Points flagged in keep, such as the members
+    of staypoints, are always kept, as are the first and last points.
+    '''
+    point_count = len(latitudes)
+    if keep is None:
+        keep = numpy.zeros(point_count, dtype=bool)
+    else:
+        keep = numpy.array(keep, dtype=bool)
+
+    if point_count < 3:
+        return numpy.ones(point_count, dtype=bool)
+
+    x, y = local_projection(latitudes, longitudes)
+    return SIMPLIFICATIONS[method](x, y, tolerance, keep)
+
+
+def douglas_peucker(x, y, tolerance, keep):
+    '''Keep the point furthest from the segment between two kept points
+    whenever it lies more than the tolerance away, recursively.
+    '''
+    keep[0] = keep[-1] = True
+    anchors = numpy.flatnonzero(keep)
+    segments = [(start, stop) for start, stop in zip(anchors[:-1], anchors[1:])
+                if stop - start > 1]
+
+    while segments:
+        start, stop = segments.pop()
+        segment_x = x[stop] - x[start]
+        segment_y = y[stop] - y[start]
+        point_x = x[start + 1:stop] - x[start]
+        point_y = y[start + 1:stop] - y[start]
+
+        # Distance to the closest point on the segment, which unlike the
+        # distance to the line through it also handles trajectories that
+        # loop back to where they started
+        squared_length = segment_x ** 2 + segment_y ** 2
+        if squared_length:
+            t = numpy.clip(
+                (point_x * segment_x + point_y * segment_y) / squared_length,
+                0, 1
+            )
+        else:
+            t = 0
+        distances = numpy.hypot(point_x - t * segment_x,
+                                point_y - t * segment_y)
+
+        furthest = int(numpy.argmax(distances))
+        if distances[furthest] > tolerance:
+            split = start + 1 + furthest
+            keep[split] = True
+            if split - start > 1:
+                segments.append((start, split))
+            if stop - split > 1:
+                segments.append((split, stop))
+
+    return keep
+
+
+def visvalingam_whyatt(x, y, tolerance, keep):
+    '''Repeatedly remove the point forming the smallest triangle with its
+    neighbours, until every remaining triangle has an area of at least the
+    square of the tolerance.
+    '''
+    point_count = len(x)
+    threshold = tolerance ** 2
+    previous = numpy.arange(-1, point_count - 1)
+    following = numpy.arange(1, point_count + 1)
+
+    def area(i):
+        a, c = previous[i], following[i]
+        return abs((x[a] - x[c]) * (y[i] - y[a])
+                   - (x[a] - x[i]) * (y[c] - y[a])) / 2
+
+    areas = numpy.full(point_count, numpy.inf)
+    areas[1:-1] = numpy.abs(
+        (x[:-2] - x[2:]) * (y[1:-1] - y[:-2])
+        - (x[:-2] - x[1:-1]) * (y[2:] - y[:-2])
+    ) / 2
+    areas[keep] = numpy.inf
+
+    heap = [(a, i) for i, a in enumerate(areas.tolist())
+            if a < threshold]
+    heapq.heapify(heap)
+    removed = numpy.zeros(point_count, dtype=bool)
+    while heap:
+        smallest, i = heapq.heappop(heap)
+        if removed[i] or smallest != areas[i]:
+            # Superseded by a later update of the point's area
+            continue
+
+        removed[i] = True
+        a, c = previous[i], following[i]
+        following[a] = c
+        previous[c] = a
+        for neighbour in (a, c):
+            if numpy.isinf(areas[neighbour]):
+                continue
+            # Never let a neighbour's area drop below that of the point
+            # just removed, so points are removed in a consistent order
+            areas[neighbour] = max(area(neighbour), smallest)
+            if areas[neighbour] < threshold:
+                heapq.heappush(heap, (areas[neighbour], neighbour))
+
+    return ~removed
+
+
+SIMPLIFICATIONS = {
+    'douglas-peucker': douglas_peucker,
+    'visvalingam-whyatt': visvalingam_whyatt,
+}
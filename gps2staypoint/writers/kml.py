@@ -1,23 +1,36 @@
+import gzip
+import io
 import logging
+import os
+import zipfile
+from xml.sax.saxutils import escape
+
+import numpy
 import simplekml
-from geopy import distance
 from polycircles import polycircles
 
-from gps2staypoint.utils import smallestenclosingcircle
+from gps2staypoint import config
+from gps2staypoint.utils import simplify
 
 logger = logging.getLogger(__name__)
 
 
+EXTENSIONS = {
+    None: '.kml',
+    'gzip': '.kml.gz',
+    'kmz': '.kmz',
+}
+
+
 class StaypointKML(object):
-    def __init__(self, path):
+    def __init__(self, path, compression=None):
         self.path = path
+        self.compression = compression
         self.kml = simplekml.Kml()
 
     def add_trajectory(self, trajectory):
-        points = map(
-            lambda p: tuple(reversed(p.location)),
-            trajectory
-        )
+        latitudes, longitudes = trajectory_coordinates(trajectory)
+        points = zip(longitudes.tolist(), latitudes.tolist())
         # for p in trajectory:
         #     point = self.kml.newpoint(name=str(p.timestamp))
         #     point.coords = [tuple(reversed(p.location))]
@@ -30,22 +43,7 @@ class StaypointKML(object):
 
     def add_staypoints(self, staypoints):
         for staypoint in staypoints:
-            staypoint_points = map(
-                lambda p: p.location,
-                staypoint.points
-            )
-            lat, long, radius = smallestenclosingcircle.make_circle(
-                staypoint_points
-            )
-            western_most_point_on_circle = (lat, long-radius)
-            radius_in_meters = distance.vincenty(
-                western_most_point_on_circle,
-                staypoint.location
-            ).meters
-            polycircle = polycircles.Polycircle(latitude=lat,
-                                                longitude=long,
-                                                radius=radius_in_meters,
-                                                number_of_vertices=36)
+            polycircle = staypoint_polycircle(staypoint)
             pol = self.kml.newpolygon(name="Staypoint vicinity",
                                       outerboundaryis=polycircle.to_kml())
             pol.style.polystyle.color = \
@@ -56,4 +54,150 @@ class StaypointKML(object):
 
     def save(self):
         logger.info('Saving KML to {}'.format(self.path))
-        self.kml.save(self.path)
\ No newline at end of file
+        if self.compression == 'kmz':
+            self.kml.savekmz(self.path)
+        elif self.compression == 'gzip':
+            with gzip.open(self.path, 'wt', encoding='utf-8') as kml_file:
+                kml_file.write(self.kml.kml())
+        else:
+            self.kml.save(self.path)
+
+
+class StreamingStaypointKML(object):
+    '''Writes the same document as StaypointKML, but straight to a buffered
+    file as trajectories and staypoints are added, instead of building up a
+    simplekml object tree first.
+
+    Trajectories may be grouped into folders, e.g. to save every trajectory
+    of a user into a single file, and the file may be gzipped or saved as a
+    KMZ archive. The document is written to a temporary file, which only
+    replaces path once saved, so that a document left unfinished by an error
+    can be discarded instead.
+    '''
+    STAYPOINT_STYLE = 'staypoint-vicinity'
+    # simplekml.Color.changealphaint(30, simplekml.Color.green)
+    STAYPOINT_COLOR = '1e008000'
+    # Number of points formatted per write of a trajectory's coordinates
+    CHUNK_SIZE = 8192
+
+    def __init__(self, path, compression=None):
+        self.path = path
+        self.compression = compression
+        self.temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+        self._archive = None
+        if compression == 'kmz':
+            self._archive = zipfile.ZipFile(self.temporary_path, 'w',
+                                            zipfile.ZIP_DEFLATED)
+            self.file = io.TextIOWrapper(
+                io.BufferedWriter(self._archive.open('doc.kml', 'w')),
+                encoding='utf-8'
+            )
+        elif compression == 'gzip':
+            self.file = gzip.open(self.temporary_path, 'wt', encoding='utf-8')
+        else:
+            self.file = open(self.temporary_path, 'w', encoding='utf-8')
+
+        self.file.write(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<kml xmlns="http://www.opengis.net/kml/2.2">\n'
+            '<Document>\n'
+            '<Style id="{}"><PolyStyle><color>{}</color></PolyStyle></Style>\n'
+            .format(self.STAYPOINT_STYLE, self.STAYPOINT_COLOR)
+        )
+
+    def begin_folder(self, name):
+        self.file.write('<Folder><name>{}</name>\n'.format(escape(name)))
+
+    def end_folder(self):
+        self.file.write('</Folder>\n')
+
+    def add_trajectory(self, trajectory):
+        latitudes, longitudes = trajectory_coordinates(trajectory)
+        self.file.write('<Placemark><name>Trajectory</name>'
+                        '<description>Raw GPS trajectory</description>'
+                        '<LineString><coordinates>')
+        for start in range(0, len(latitudes), self.CHUNK_SIZE):
+            stop = start + self.CHUNK_SIZE
+            if start:
+                self.file.write(' ')
+            self.file.write(' '.join(
+                '{!r},{!r},0.0'.format(longitude, latitude)
+                for longitude, latitude in zip(
+                    longitudes[start:stop].tolist(),
+                    latitudes[start:stop].tolist()
+                )
+            ))
+        self.file.write('</coordinates></LineString></Placemark>\n')
+
+    def add_staypoints(self, staypoints):
+        for staypoint in staypoints:
+            polycircle = staypoint_polycircle(staypoint)
+            self.file.write(
+                '<Placemark><name>Staypoint vicinity</name>'
+                '<styleUrl>#{}</styleUrl><Polygon><outerBoundaryIs>'
+                '<LinearRing><coordinates>{}</coordinates></LinearRing>'
+                '</outerBoundaryIs></Polygon></Placemark>\n'
+                '<Placemark><name>Staypoint</name><Point><coordinates>'
+                '{!r},{!r},0.0</coordinates></Point></Placemark>\n'.format(
+                    self.STAYPOINT_STYLE,
+                    ' '.join('{!r},{!r},0.0'.format(longitude, latitude)
+                             for longitude, latitude in polycircle.to_kml()),
+                    staypoint.average_longitude,
+                    staypoint.average_latitude,
+                )
+            )
+
+    def save(self):
+        logger.info('Saving KML to {}'.format(self.path))
+        self.file.write('</Document>\n</kml>\n')
+        self._close()
+        os.replace(self.temporary_path, self.path)
+
+    def discard(self):
+        '''Close the unfinished document and delete it, leaving whatever
+        was at path before untouched.
+        '''
+        logger.info('Discarding unfinished KML for {}'.format(self.path))
+        try:
+            self._close()
+        finally:
+            os.remove(self.temporary_path)
+
+    def _close(self):
+        self.file.close()
+        if self._archive is not None:
+            self._archive.close()
+
+
+KML_WRITERS = {
+    'simplekml': StaypointKML,
+    'stream': StreamingStaypointKML,
+}
+
+
+def trajectory_coordinates(trajectory):
+    '''Latitudes and longitudes of a trajectory's line, simplified as set in
+    the configuration. Every member point of a staypoint is kept.
+    '''
+    latitudes, longitudes, _ = trajectory.as_arrays()
+    if config.KML_SIMPLIFY_TOLERANCE:
+        staypoint_members = numpy.zeros(len(latitudes), dtype=bool)
+        for staypoint in trajectory.staypoints:
+            staypoint_members[staypoint.start:staypoint.stop] = True
+
+        kept = simplify.simplify(latitudes, longitudes,
+                                 tolerance=config.KML_SIMPLIFY_TOLERANCE,
+                                 method=config.KML_SIMPLIFY_METHOD,
+                                 keep=staypoint_members)
+        latitudes = latitudes[kept]
+        longitudes = longitudes[kept]
+    return latitudes, longitudes
+
+
+def staypoint_polycircle(staypoint):
+    '''36-sided polygon around the smallest circle enclosing a staypoint.'''
+    latitude, longitude, radius = staypoint.enclosing_circle
+    return polycircles.Polycircle(latitude=latitude,
+                                  longitude=longitude,
+                                  radius=radius,
+                                  number_of_vertices=36)
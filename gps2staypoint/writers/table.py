@@ -0,0 +1,205 @@
+'''Tabular staypoint output, one row per staypoint.
+
+Rows are buffered and written in batches: CSV through csv.writer.writerows,
+Parquet and Arrow IPC through one pyarrow table per batch. pyarrow is only
+needed for the latter two formats.
+'''
+import csv
+import logging
+import os
+import shutil
+
+try:
+    import pyarrow
+    from pyarrow import ipc
+    from pyarrow import parquet
+except ImportError:
+    pyarrow = None
+
+logger = logging.getLogger(__name__)
+
+
+STAYPOINT_FIELDS = (
+    'user', 'trajectory', 'latitude', 'longitude', 'arrival', 'departure',
+    'duration', 'point_count', 'radius',
+)
+
+
+def staypoint_rows(trajectory, staypoints):
+    '''One row per staypoint, in the order of STAYPOINT_FIELDS. Arrival and
+    departure are in seconds since the epoch, the radius in meters.
+    '''
+    user = '{:0>3}'.format(trajectory.user.id)
+    trajectory_id = trajectory.id
+    for staypoint in staypoints:
+        latitude, longitude = staypoint.location
+        arrival = staypoint.arrival_seconds
+        departure = staypoint.departure_seconds
+        yield (user, trajectory_id, latitude, longitude, arrival, departure,
+               departure - arrival, staypoint.point_count, staypoint.radius)
+
+
+class StaypointTableWriter(object):
+    '''Buffer staypoint rows, handing them to flush() BATCH_SIZE at a time.
+    '''
+    BATCH_SIZE = 65536
+
+    def __init__(self, path):
+        self.path = path
+        self.rows = []
+        self.row_count = 0
+
+    def write(self, rows):
+        self.rows.extend(rows)
+        if len(self.rows) >= self.BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.write_batch(self.rows)
+            self.row_count += len(self.rows)
+            self.rows = []
+
+    def write_batch(self, rows):
+        raise NotImplementedError
+
+    def close(self):
+        self.flush()
+        logger.info('Wrote {} staypoints to {}'.format(self.row_count,
+                                                       self.path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+
+class CSVStaypointWriter(StaypointTableWriter):
+    def __init__(self, path):
+        super(CSVStaypointWriter, self).__init__(path)
+        _make_parent_directory(path)
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(STAYPOINT_FIELDS)
+
+    def write_batch(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        super(CSVStaypointWriter, self).close()
+        self.file.close()
+
+
+class ArrowStaypointWriter(StaypointTableWriter):
+    '''A single Arrow IPC file, one record batch per flush.'''
+    def __init__(self, path):
+        super(ArrowStaypointWriter, self).__init__(path)
+        _make_parent_directory(path)
+        self.schema = staypoint_schema()
+        self.sink = pyarrow.OSFile(path, 'wb')
+        self.writer = ipc.new_file(self.sink, self.schema)
+
+    def write_batch(self, rows):
+        self.writer.write_table(rows_to_table(rows, self.schema))
+
+    def close(self):
+        super(ArrowStaypointWriter, self).close()
+        self.writer.close()
+        self.sink.close()
+
+
+class ParquetStaypointWriter(StaypointTableWriter):
+    '''A Parquet dataset partitioned by user, laid out as
+    <path>/user=<id>/part-<n>.parquet.
+
+    Like the CSV and Arrow files, the dataset holds the rows of one run
+    only: it is written to a temporary directory, which replaces path once
+    closed, so no user's rows from an earlier run are left behind.
+    '''
+    @staticmethod
+    def partition(path, user):
+        '''Directory of a user's rows within the dataset.'''
+        return os.path.join(path, 'user={:0>3}'.format(user))
+
+    def __init__(self, path):
+        super(ParquetStaypointWriter, self).__init__(path)
+        self.temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+        shutil.rmtree(self.temporary_path, ignore_errors=True)
+        os.makedirs(self.temporary_path)
+        self.schema = staypoint_schema()
+        self.part_counts = {}
+
+    def write_batch(self, rows):
+        partitions = {}
+        for row in rows:
+            partitions.setdefault(row[0], []).append(row)
+
+        for user, user_rows in partitions.items():
+            directory = self.partition(self.temporary_path, user)
+            if user not in self.part_counts:
+                os.makedirs(directory)
+                self.part_counts[user] = 0
+
+            part = os.path.join(directory, 'part-{:0>5}.parquet'.format(
+                self.part_counts[user]
+            ))
+            self.part_counts[user] += 1
+            # The user is recovered from the directory name when the dataset
+            # is read back
+            table = rows_to_table(user_rows, self.schema).drop(['user'])
+            parquet.write_table(table, part)
+
+    def close(self):
+        super(ParquetStaypointWriter, self).close()
+        # A directory cannot be renamed over another, so the previous
+        # dataset is moved aside first
+        previous_path = '{}.{}.old'.format(self.path, os.getpid())
+        if os.path.exists(self.path):
+            os.rename(self.path, previous_path)
+        os.rename(self.temporary_path, self.path)
+        shutil.rmtree(previous_path, ignore_errors=True)
+
+
+def staypoint_schema():
+    return pyarrow.schema([
+        ('user', pyarrow.string()),
+        ('trajectory', pyarrow.string()),
+        ('latitude', pyarrow.float64()),
+        ('longitude', pyarrow.float64()),
+        ('arrival', pyarrow.int64()),
+        ('departure', pyarrow.int64()),
+        ('duration', pyarrow.int64()),
+        ('point_count', pyarrow.int64()),
+        ('radius', pyarrow.float64()),
+    ])
+
+
+def rows_to_table(rows, schema):
+    columns = zip(*rows)
+    return pyarrow.Table.from_arrays(
+        [pyarrow.array(column, type=field.type)
+         for column, field in zip(columns, schema)],
+        schema=schema
+    )
+
+
+def _make_parent_directory(path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+
+TABLE_WRITERS = {
+    'csv': CSVStaypointWriter,
+    'arrow': ArrowStaypointWriter,
+    'parquet': ParquetStaypointWriter,
+}
+
+
+def get_table_writer(format, path):
+    '''Open a writer for staypoint rows in the given format.'''
+    if format != 'csv' and pyarrow is None:
+        raise ImportError('pyarrow is required to write {} '
+                          'files'.format(format))
+    return TABLE_WRITERS[format](path)
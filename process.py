@@ -39,7 +39,6 @@ LICENSE
 #       pp. 34:1--34:10.
 #       https://doi.org/10.1145/1463434.1463477
 from gps2staypoint import config
-from gps2staypoint.user import GPSUser
 
 __appname__ = "gps2staypoint"
 __author__ = "Doug McGeehan"
@@ -53,144 +52,446 @@ import logging
 logger = logging.getLogger(__appname__)
 
 import argparse
+import functools
+import json
+import multiprocessing
 import sys
 import os
-import datetime
-
+import time
+
+from gps2staypoint import cli
+from gps2staypoint import discovery
+from gps2staypoint import gps
+from gps2staypoint import pipeline
+from gps2staypoint import profiling
+from gps2staypoint import spatial
+from gps2staypoint import staypoint
+from gps2staypoint.manifest import ProcessingManifest
+from gps2staypoint.manifest import ShardManifest
+from gps2staypoint.manifest import fingerprint
+from gps2staypoint.manifest import in_shard
+from gps2staypoint.manifest import merge_shards
+from gps2staypoint.manifest import parse_shard
+from gps2staypoint.manifest import shard_manifest_path
+from gps2staypoint.readers import timestamp
+from gps2staypoint.readers.cache import PLTCache
+from gps2staypoint.readers.index import PLTIndex
 from gps2staypoint.readers.plt import PLTFileReader
+from gps2staypoint.readers.prefetch import PLTPrefetcher
+from gps2staypoint.readers.prefetch import prefetch_users
+from gps2staypoint.utils import simplify
+from gps2staypoint.writers import kml
+from gps2staypoint.writers import table
 
 
 def main(args):
-    # Find raw GPS trajectory files
-    logger.info('Locating GPS Files')
-    plt_files = []
-    for directory, subdirectories, filenames in os.walk(args.input_directory):
-        if 'StayPoint' in directory:
-            # Skip any files within the previously created StayPoint directory
-            continue
+    settings = functools.partial(configure,
+                                 distance_metric=args.distance_metric,
+                                 engine=args.engine,
+                                 cache_directory=args.cache_directory,
+                                 prefetch=args.prefetch,
+                                 prefetch_memory=args.prefetch_memory,
+                                 kml_writer=args.kml_writer,
+                                 kml_compression=args.kml_compression,
+                                 kml_per_user=args.kml_per_user,
+                                 simplify=args.simplify,
+                                 simplify_method=args.simplify_method,
+                                 profile_stages=(args.profile_report
+                                                 is not None),
+                                 profile_user=args.profile_user,
+                                 profile_user_path=args.profile_user_output,
+                                 profiler=args.profiler)
+    settings()
+
+    if args.merge is not None:
+        merge(args)
+        return
+
+    started = time.perf_counter()
+    run_profile = None
+    if args.profile_report is not None:
+        run_profile = profiling.push()
+
+    index = None
+    if args.index is not None:
+        index = PLTIndex(path=args.index)
+
+    if args.stream:
+        # Discover users one at a time as they are processed, only using
+        # the index for files it already knows about
+        logger.info('Streaming GPS Files by User')
+        users = profiling.profile.timed(
+            'discovery',
+            discovery.iter_users(args.input_directory, index=index)
+        )
+        user_count = progressbar.UnknownLength
 
-        # Only consider .plt files
-        plt_files_within_directory = filter(lambda p: p.endswith('.plt'),
-                                            filenames)
+    else:
+        logger.info('Locating GPS Files')
+        with profiling.profile.stage('discovery'):
+            plt_files = discovery.find_plt_files(args.input_directory)
+
+        if index is not None:
+            logger.info('Updating GPS File Index')
+            with profiling.profile.stage('probe'):
+                probed = index.update(plt_files, workers=args.workers)
+                index.save()
+            profiling.profile.count('probe', files=probed)
+            logger.info('Probed {} new or modified GPS Files'.format(probed))
+
+        logger.info('Grouping GPS Files by User')
+        with profiling.profile.stage('discovery'):
+            users = discovery.group_by_user(plt_files, index=index).values()
+        user_count = len(users)
+
+    manifest = None
+    discovered_users = []
+    fingerprints = {}
+    if args.incremental:
+        # Only process users whose inputs or settings changed since the
+        # outputs recorded in the manifest were written
+        manifest = ProcessingManifest(
+            path=os.path.join(args.output_directory, 'manifest.json')
+        )
+        users = changed_users(users, manifest, discovered_users, fingerprints)
+        if not args.stream:
+            users = list(users)
+            logger.info('{} of {} users changed since the last run'.format(
+                len(users), user_count
+            ))
+            user_count = len(users)
+
+    shard_manifest = None
+    if args.shard is not None:
+        # Only process this shard's users, skipping those already recorded
+        # as finished by an earlier run of the shard
+        shard_index, shard_count = args.shard
+        shard_manifest = ShardManifest(path=shard_manifest_path(
+            args.output_directory, shard_index, shard_count
+        ))
+        shard_manifest.start()
+        users = (user for user in users
+                 if in_shard(user.id, shard_index, shard_count))
+        users = changed_users(users, shard_manifest, discovered_users,
+                              fingerprints)
+        if not args.stream:
+            users = list(users)
+            logger.info('{} of the {} users of shard {}/{} left to '
+                        'process'.format(len(users), len(discovered_users),
+                                         shard_index, shard_count))
+            user_count = len(users)
 
-        # Prepend a file's directory to each filename
-        plt_file_paths = map(lambda p: os.path.join(directory, p),
-                             plt_files_within_directory)
+    # Iterate over trajectories for each user
+    # Extract staypoints on each trajectory
+    # Save each trajectory to a KML for inspection
+    logger.info('Iterating over Trajectories')
+    work = functools.partial(process_user,
+                             kml_directory=args.output_directory,
+                             tabulate=args.table is not None
+                                      or args.staypoint_index is not None
+                                      or args.incremental
+                                      or args.shard is not None)
+    table_writer = None
+    if args.table is not None:
+        table_writer = table.get_table_writer(args.table_format, args.table)
+    index_rows = []
+    failed_users = []
+    with progressbar.ProgressBar(max_value=user_count) as progress:
+        if args.workers > 1:
+            pool = multiprocessing.Pool(processes=args.workers,
+                                        initializer=settings)
+            # Only keep a few users per worker discovered ahead of those
+            # being processed
+            results = pipeline.imap_bounded(
+                pool, work, users,
+                window=config.WORKER_QUEUE_DEPTH * args.workers
+            )
+        else:
+            pool = None
+            if PLTFileReader.PREFETCHER is not None:
+                # Read the files of the next users while this one is
+                # processed
+                users = prefetch_users(users, PLTFileReader.PREFETCHER)
+            results = map(work, users)
+
+        # Results arrive in user order, regardless of which worker finished
+        # first
+        fallback_count = timestamp.decoder.fallback_count
+        for i, result in enumerate(results, start=1):
+            user_id, outputs, rows, fallbacks, error, user_profile = result
+            if user_profile is not None:
+                run_profile.add_user(user_id, *user_profile)
+            fallback_count += fallbacks
+            if error is None:
+                logger.debug('User #{}: {} trajectories'.format(
+                    user_id, len(outputs)
+                ))
+                if manifest is not None:
+                    # The table and index are written from the manifest once
+                    # every user is, since unchanged users are never
+                    # processed
+                    manifest.record(user_id, fingerprints.pop(user_id),
+                                    outputs, rows)
+                    manifest.save()
+                else:
+                    if table_writer is not None:
+                        with profiling.profile.stage('write'):
+                            table_writer.write(rows)
+                    if args.staypoint_index is not None:
+                        index_rows.extend(rows)
+                if shard_manifest is not None:
+                    shard_manifest.record(user_id, fingerprints.pop(user_id),
+                                          outputs, rows)
+            else:
+                failed_users.append(user_id)
+                if shard_manifest is not None:
+                    shard_manifest.record(user_id, fingerprints.pop(user_id),
+                                          outputs, [], error=error)
+            progress.update(i)
+
+        if pool is not None:
+            pool.close()
+            pool.join()
+        if PLTFileReader.PREFETCHER is not None:
+            PLTFileReader.PREFETCHER.close()
+
+    if manifest is not None:
+        removed_users = manifest.collect_garbage(discovered_users)
+        manifest.save()
+        if removed_users:
+            logger.info('Removed outputs of {} users no longer in the '
+                        'input: {}'.format(len(removed_users),
+                                           ', '.join(removed_users)))
+
+        for user in manifest.user_ids():
+            rows = manifest.rows(user)
+            if table_writer is not None:
+                with profiling.profile.stage('write'):
+                    table_writer.write(rows)
+            if args.staypoint_index is not None:
+                index_rows.extend(rows)
+
+    if table_writer is not None:
+        with profiling.profile.stage('write'):
+            table_writer.close()
+        profiling.profile.count('write', files=1)
+
+    if args.staypoint_index is not None:
+        logger.info('Indexing {} staypoints'.format(len(index_rows)))
+        with profiling.profile.stage('write'):
+            spatial.StaypointIndex.from_rows(index_rows).save(
+                args.staypoint_index
+            )
+        profiling.profile.count('write', files=1)
+
+    if shard_manifest is not None:
+        removed_users = shard_manifest.collect_garbage(discovered_users)
+        shard_manifest.finish()
+        shard_manifest.close()
+        if removed_users:
+            logger.info('Removed outputs of {} users no longer in the '
+                        'input: {}'.format(len(removed_users),
+                                           ', '.join(map(str, removed_users))))
+        logger.info('Finished shard {}/{}; once every shard is, combine '
+                    'them with --merge {}'.format(shard_index, shard_count,
+                                                  shard_count))
+
+    if failed_users:
+        logger.error('{} users could not be processed: {}'.format(
+            len(failed_users), ', '.join(map(str, failed_users))
+        ))
 
-        plt_files.extend(plt_file_paths)
+    if fallback_count:
+        logger.warning('{} malformed timestamps were parsed with '
+                       'dateutil'.format(fallback_count))
 
-    # Partition GPS trajectory files by the user that created them
-    logger.info('Grouping GPS Files by User')
-    plt_files.sort()
-    users = {}
-    for plt_file_path in plt_files:
-        logger.debug(plt_file_path)
-        plt = PLTFileReader(path=plt_file_path)
-        user_id = plt.user
+    if run_profile is not None:
+        report = profiling.pop()
+        report['seconds'] = time.perf_counter() - started
+        report['workers'] = args.workers
+        save_profile_report(report, path=args.profile_report)
 
-        if user_id not in users:
-            user = GPSUser(id=user_id)
-            users[user_id] = user
-        else:
-            user = users[user_id]
 
-        user.add_plt_file(plt=plt)
+def merge(args):
+    '''Combine the staypoints recorded by every shard of a batch run into
+    one table and/or spatial index.
+    '''
+    logger.info('Merging {} shards in {}'.format(args.merge,
+                                                 args.output_directory))
+    try:
+        rows, failed_users = merge_shards(args.output_directory, args.merge)
+    except ValueError as e:
+        logger.error(str(e))
+        sys.exit(1)
 
-    # Sort each user's PLT files by the time each file was created
-    logger.info('Sorting GPS Files by Starttime')
-    for user in users.values():
-        user.sort_trajectories_by_time()
+    table_writer = None
+    if args.table is not None:
+        table_writer = table.get_table_writer(args.table_format, args.table)
+    index_rows = []
+    row_count = 0
+    for row in rows:
+        if table_writer is not None:
+            table_writer.write([row])
+        if args.staypoint_index is not None:
+            index_rows.append(row)
+        row_count += 1
+
+    if table_writer is not None:
+        table_writer.close()
+        logger.info('Wrote {} staypoints to {}'.format(row_count, args.table))
+    if args.staypoint_index is not None:
+        spatial.StaypointIndex.from_rows(index_rows).save(
+            args.staypoint_index
+        )
+        logger.info('Indexed {} staypoints in {}'.format(
+            row_count, args.staypoint_index
+        ))
 
-        logger.debug('User: #{}'.format(user.id))
-        for plt in user.gps_logs:
-            logger.debug('{0.start_time}: {0.path}'.format(plt))
-        logger.debug('')
+    if failed_users:
+        logger.error('{} users could not be processed, and are missing from '
+                     'the merged output: {}'.format(
+            len(failed_users), ', '.join(map(str, failed_users))
+        ))
 
-    # Iterate over trajectories for each user
-    # Extract staypoints on each trajectory
-    # Save each trajectory to a KML for inspection
-    logger.info('Iterating over Trajectories')
-    staypoints_and_source_trajectory = []
-    for user in users.values():
-        logger.debug('User: #{}'.format(user.id))
-
-        trajectories = user.trajectories
-        for trajectory in trajectories:
-            trajectory.summarize()
-            trajectory.write_to_kml(directory='/tmp/kmls')
-        logger.debug('')
-
-    # for staypoint_info in staypoints_and_source_trajectory:
-    #     logger.debug('User:       #{}'.format(staypoint_info['user'].id))
-    #     logger.debug('Trajectory: {}'.format(staypoint_info['trajectory']))
-    #     logger.debug('Staypoints: {}'.format(staypoint_info['staypoints']))
-    #     logger.debug('')
-
-    # # Extract staypoints from each .plt file
-    # plt_file_count = len(plt_files)
-    # with progressbar.ProgressBar(max_value=plt_file_count) as progress:
-    #     # Iterate over each plt file
-    #     for i, plt_file_path in enumerate(plt_files, start=1):
-    #         logger.info(plt_file_path)
-    #         plt = PLTFileReader(path=plt_file_path)
-    #
-    #         # Extract the staypoints from the GPS trajectory of this file
-    #         staypoints = StayPointExtractor(trajectory=plt)
-    #
-    #         if staypoints:
-    #
-    #             # Write out staypoints to a new file
-    #             staypoint_file_path = plt_file_path.replace('Data', 'StayPoint')
-    #             os.makedirs(os.path.dirname(staypoint_file_path), exist_ok=True)
-    #
-    #             with open(staypoint_file_path, 'w+') as staypoint_file:
-    #                 staypoint_file_writer = csv.DictWriter(
-    #                     staypoint_file,
-    #                     fieldnames=staypoints.keys()
-    #                 )
-    #                 staypoint_file_writer.writeheader()
-    #                 staypoint_file_writer.writerows(staypoints.dict())
-    #
-    #             if args.kml:
-    #                 kml_file_path = staypoint_file_path.replace('.plt', '.kml')
-    #                 kml = StaypointKML(staypoints=staypoints,
-    #                                    raw_plt_file=plt_file_path)
-    #                 kml.save_to(path=kml_file_path)
-    #
-    #         logger.info('')
-    #         progress.update(i)
-
-
-def setup_logger(args):
-    logger.setLevel(logging.DEBUG)
-    # create file handler which logs even debug messages
-    # filename, or append to pre-existing log
-    log_file = os.path.join('/tmp', __appname__ + '.log')
-    fh = logging.FileHandler(log_file)
-    fh.setLevel(logging.DEBUG)
-    # create console handler with a higher log level
-    ch = logging.StreamHandler()
-
-    if args.verbose:
-        ch.setLevel(logging.DEBUG)
+
+def configure(distance_metric, engine, cache_directory, prefetch,
+              prefetch_memory, kml_writer, kml_compression, kml_per_user,
+              simplify, simplify_method, profile_stages, profile_user,
+              profile_user_path, profiler):
+    '''Apply command-line settings to the configuration, in this process
+    and in every worker process.
+    '''
+    config.StayPointConfiguration.DISTANCE_METRIC = distance_metric
+    config.StayPointConfiguration.ENGINE = engine
+    if cache_directory is not None:
+        PLTFileReader.CACHE = PLTCache(directory=cache_directory)
+    if prefetch:
+        PLTFileReader.PREFETCHER = PLTPrefetcher(
+            depth=prefetch, memory_limit=prefetch_memory * 1024 * 1024
+        )
+    config.KML_WRITER = kml_writer
+    config.KML_COMPRESSION = kml_compression
+    config.KML_PER_USER = kml_per_user
+    config.KML_SIMPLIFY_TOLERANCE = simplify
+    config.KML_SIMPLIFY_METHOD = simplify_method
+    config.PROFILE_STAGES = profile_stages
+    config.PROFILE_USER = profile_user
+    config.PROFILE_USER_PATH = profile_user_path
+    config.PROFILER = profiler
+
+
+def save_profile_report(report, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as report_file:
+        json.dump(report, report_file, indent=2)
+
+    stages = report['stages']
+    logger.info('Time per stage, summed over all workers:')
+    for name, statistics in stages.items():
+        if statistics['calls']:
+            logger.info('\t{: <12} {: >9.3f}s {: >9} points {: >6} '
+                        'files'.format(name, statistics['seconds'],
+                                       statistics['points'],
+                                       statistics['files']))
+    logger.info('Profile report saved to {}'.format(path))
+
+
+def changed_users(users, manifest, discovered_users, fingerprints):
+    '''Skip users whose outputs in the manifest are up to date, noting the
+    id of every user and the fingerprint of every changed user.
+    '''
+    for user in users:
+        discovered_users.append(user.id)
+        user_fingerprint = fingerprint(user)
+        if manifest.is_current(user.id, user_fingerprint):
+            logger.debug('User #{} is unchanged'.format(user.id))
+            continue
+
+        fingerprints[user.id] = user_fingerprint
+        yield user
+
+
+def process_user(user, kml_directory, tabulate=False):
+    '''Process a user with extract_user(), timing each stage if a profile
+    report was requested. The last element of the result is the user's
+    processing time and stage profile, or None.
+    '''
+    if config.PROFILE_STAGES:
+        profiling.push()
+    started = time.perf_counter()
+
+    if user.id == config.PROFILE_USER:
+        logger.info('Profiling user #{} into {}'.format(
+            user.id, config.PROFILE_USER_PATH
+        ))
+        with profiling.capture(config.PROFILE_USER_PATH,
+                               profiler=config.PROFILER):
+            result = extract_user(user, kml_directory, tabulate)
     else:
-        ch.setLevel(logging.INFO)
+        result = extract_user(user, kml_directory, tabulate)
+
+    user_profile = None
+    if config.PROFILE_STAGES:
+        user_profile = (time.perf_counter() - started, profiling.pop())
+    return result + (user_profile,)
+
+
+def extract_user(user, kml_directory, tabulate=False):
+    '''Extract staypoints on each of a user's trajectories and save each
+    trajectory to a KML for inspection, returning the KML files' paths and,
+    if asked to tabulate, a row for each staypoint.
+
+    Trajectories are streamed through extraction and writing one at a time
+    and released afterwards, so memory does not grow with the user's size.
+    Any failure is logged and reported back rather than raised, so that one
+    corrupt .plt file does not abort the processing of every other user.
+    '''
+    logger.debug('User: #{}'.format(user.id))
+    # Per-file progress bars would fight over the terminal with the per-user
+    # progress bar
+    user.show_progress = False
+    if PLTFileReader.PREFETCHER is not None:
+        # Only queues the files not already queued by prefetch_users()
+        PLTFileReader.PREFETCHER.add(user.gps_logs)
+
+    outputs = []
+    rows = []
+    fallback_count = timestamp.decoder.fallback_count
+    try:
+        trajectories = profiling.profile.timed('segmentation',
+                                               user.iter_trajectories())
+        staypoints = pipeline.summarize(pipeline.staypoints(trajectories))
+        if tabulate:
+            staypoints = pipeline.tabulate(staypoints, rows=rows)
+        if config.KML_PER_USER:
+            path = os.path.join(kml_directory, 'User{:0>3}{}'.format(
+                user.id, kml.EXTENSIONS[config.KML_COMPRESSION]
+            ))
+            results = pipeline.write_user_kml(staypoints, path=path)
+        else:
+            results = pipeline.write_kml(staypoints, directory=kml_directory)
 
-    # create formatter and add it to the handlers
-    line_numbers_and_function_name = logging.Formatter(
-        "%(levelname)s [%(filename)s:%(lineno)s - %(funcName)20s() ]"
-        " %(message)s")
-    fh.setFormatter(line_numbers_and_function_name)
-    ch.setFormatter(line_numbers_and_function_name)
-    # add the handlers to the logger
-    logger.addHandler(fh)
-    logger.addHandler(ch)
+        for path, _ in results:
+            if path not in outputs:
+                outputs.append(path)
 
+    except Exception as e:
+        logger.exception('Failed to process user #{}'.format(user.id))
+        fallback_count = timestamp.decoder.fallback_count - fallback_count
+        return user.id, outputs, [], fallback_count, repr(e)
+
+    logger.debug('')
+    fallback_count = timestamp.decoder.fallback_count - fallback_count
+    return user.id, outputs, rows, fallback_count, None
 
-def existing_directory(path):
-    assert os.path.isdir(path), 'The directory {} does not exist. ' \
-                                'Aborting.'.format(path)
-    return os.path.abspath(path)
+
+def shard(value):
+    try:
+        return parse_shard(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
 
 
 def get_arguments():
@@ -202,50 +503,162 @@ def get_arguments():
     # calling this with -v
     parser.add_argument('-v', '--verbose', action='store_true',
                         default=True, help='verbose output')
-    parser.add_argument('-i', '--input-directory', type=existing_directory,
+    parser.add_argument('-i', '--input-directory', type=cli.existing_directory,
                         help='directory containing .plt files',
-                        default=existing_directory(
+                        default=cli.existing_directory(
                             config.DEFAULT_GEOLIFE_DIRECTORY
                         ))
     parser.add_argument('--kml', action='store_true',
                         help='also create .kml files (default: False)',
                         default=True)
+    parser.add_argument('-o', '--output-directory',
+                        help='directory to save .kml files to '
+                             '(default: %(default)s)',
+                        default=os.path.join('/tmp', 'kmls'))
+    parser.add_argument('--kml-writer', choices=sorted(kml.KML_WRITERS),
+                        help='build each .kml file in memory with simplekml, '
+                             'or stream it straight to disk '
+                             '(default: %(default)s)',
+                        default=config.KML_WRITER)
+    parser.add_argument('--kml-compression',
+                        choices=sorted(c for c in kml.EXTENSIONS if c),
+                        help='save .kml.gz or .kmz files instead of .kml '
+                             '(default: no compression)',
+                        default=config.KML_COMPRESSION)
+    parser.add_argument('--kml-per-user', action='store_true',
+                        help='stream all trajectories of a user into one '
+                             '.kml file, one folder per trajectory '
+                             '(default: False)',
+                        default=config.KML_PER_USER)
+    parser.add_argument('--simplify', type=float, metavar='METERS',
+                        help='simplify trajectory lines in .kml files to '
+                             'within this many meters, keeping every '
+                             'staypoint member (default: no simplification)',
+                        default=config.KML_SIMPLIFY_TOLERANCE)
+    parser.add_argument('--simplify-method',
+                        choices=sorted(simplify.SIMPLIFICATIONS),
+                        help='line simplification algorithm '
+                             '(default: %(default)s)',
+                        default=config.KML_SIMPLIFY_METHOD)
+    parser.add_argument('-t', '--table',
+                        help='also write every staypoint to this .csv or '
+                             '.arrow file, or .parquet dataset directory '
+                             '(default: no table)',
+                        default=None)
+    parser.add_argument('--table-format',
+                        choices=sorted(table.TABLE_WRITERS),
+                        help='format of the staypoint table '
+                             '(default: %(default)s)',
+                        default=config.TABLE_FORMAT)
+    parser.add_argument('--staypoint-index', metavar='PATH',
+                        help='also save a spatial index of every staypoint '
+                             'to this .npz file (default: no index)',
+                        default=None)
+    parser.add_argument('--incremental', action='store_true',
+                        help='only reprocess users whose .plt files or '
+                             'settings changed since the last run, and '
+                             'remove outputs of users no longer present '
+                             '(default: False)',
+                        default=False)
+    parser.add_argument('--shard', type=shard, metavar='i/N',
+                        help='only process the i-th of N shards of the users '
+                             '(counting from 0), checkpointing each user in '
+                             'a manifest under the output directory so that '
+                             'a restarted run skips finished users; shards '
+                             'may run on separate nodes sharing the output '
+                             'directory (default: every user)',
+                        default=None)
+    parser.add_argument('--merge', type=cli.positive_integer, metavar='N',
+                        help='instead of processing, combine the '
+                             'staypoints of all N finished shards in the '
+                             'output directory into the --table and/or '
+                             '--staypoint-index',
+                        default=None)
+    parser.add_argument('-w', '--workers', type=cli.positive_integer,
+                        help='number of users to process in parallel '
+                             '(default: 1)',
+                        default=1)
+    parser.add_argument('-d', '--distance-metric',
+                        choices=sorted(gps.DISTANCE_METRICS),
+                        help='distance between GPS points (default: '
+                             '{})'.format(
+                            config.StayPointConfiguration.DISTANCE_METRIC
+                        ),
+                        default=config.StayPointConfiguration.DISTANCE_METRIC)
+    parser.add_argument('-e', '--engine',
+                        choices=sorted(staypoint.STAYPOINT_BUILDERS),
+                        help='staypoint extraction algorithm '
+                             '(default: %(default)s)',
+                        default=config.StayPointConfiguration.ENGINE)
+    parser.add_argument('-c', '--cache-directory',
+                        help='reuse parsed .plt files cached in this '
+                             'directory (default: {})'.format(
+                            config.PLT_CACHE_DIRECTORY
+                        ),
+                        default=config.PLT_CACHE_DIRECTORY)
+    parser.add_argument('--prefetch', type=cli.non_negative_integer,
+                        metavar='FILES',
+                        help='read and parse up to this many upcoming .plt '
+                             'files on background threads while earlier '
+                             'ones are processed (default: {})'.format(
+                            config.PLT_PREFETCH_DEPTH
+                        ),
+                        default=config.PLT_PREFETCH_DEPTH)
+    parser.add_argument('--prefetch-memory', type=cli.positive_integer,
+                        metavar='MB',
+                        help='most megabytes of .plt files to prefetch at '
+                             'once (default: {})'.format(
+                            config.PLT_PREFETCH_MEMORY // (1024 * 1024)
+                        ),
+                        default=config.PLT_PREFETCH_MEMORY // (1024 * 1024))
+    parser.add_argument('--index',
+                        help='JSON index of .plt file metadata, created or '
+                             'updated before grouping files by user',
+                        default=None)
+    parser.add_argument('--profile-report', metavar='PATH',
+                        help='time every stage and user, saving the '
+                             'throughput of each as JSON to this path '
+                             '(default: no report)',
+                        default=None)
+    parser.add_argument('--profile-user', type=int, metavar='ID',
+                        help='capture a full profile of processing this one '
+                             'user (default: no profile)',
+                        default=config.PROFILE_USER)
+    parser.add_argument('--profiler', choices=sorted(profiling.PROFILERS),
+                        help='profiler to capture --profile-user with; '
+                             'pyinstrument must be installed separately '
+                             '(default: %(default)s)',
+                        default=config.PROFILER)
+    parser.add_argument('--profile-user-output', metavar='PATH',
+                        help='where to save the --profile-user profile '
+                             '(default: /tmp/gps2staypoint_userID.prof or '
+                             '.html)',
+                        default=None)
+    parser.add_argument('-s', '--stream', action='store_true',
+                        help='discover and process users one at a time '
+                             'instead of grouping every file up front '
+                             '(default: False)',
+                        default=False)
 
     args = parser.parse_args()
+    if args.shard is not None and (args.incremental
+                                   or args.table is not None
+                                   or args.staypoint_index is not None):
+        parser.error('--shard records its own progress and staypoints; '
+                     'write the --table and --staypoint-index with --merge')
+    if args.merge is not None and args.table is None \
+            and args.staypoint_index is None:
+        parser.error('--merge needs a --table or --staypoint-index to write')
+    if args.profiler == 'pyinstrument' and profiling.pyinstrument is None:
+        parser.error('--profiler pyinstrument needs pyinstrument installed')
+    if args.profile_user is not None and args.profile_user_output is None:
+        args.profile_user_output = os.path.join(
+            '/tmp', 'gps2staypoint_user{:0>3}{}'.format(
+                args.profile_user, profiling.PROFILERS[args.profiler]
+            )
+        )
     return args
 
 
 if __name__ == '__main__':
-    try:
-        start_time = datetime.datetime.now()
-
-        args = get_arguments()
-        setup_logger(args)
-        logger.debug('Command-line arguments:')
-        for arg in vars(args):
-            value = getattr(args, arg)
-            logger.debug('\t{argument_key}:\t{value}'.format(argument_key=arg,
-                                                             value=value))
-
-        logger.debug(start_time)
-
-        main(args)
-
-        finish_time = datetime.datetime.now()
-        logger.debug(finish_time)
-        logger.debug('Execution time: {time}'.format(
-            time=(finish_time - start_time)
-        ))
-        logger.debug("#" * 20 + " END EXECUTION " + "#" * 20)
-
-        sys.exit(0)
-
-    except KeyboardInterrupt as e:  # Ctrl-C
-        raise e
-
-    except SystemExit as e:  # sys.exit()
-        raise e
-
-    except Exception as e:
-        logger.exception("Something happened and I don't know what to do D:")
-        sys.exit(1)
+    cli.run(main, get_arguments, logger)
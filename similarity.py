@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SYNOPSIS
+
+	python similarity.py [-h,--help] [-v,--verbose] [-i,--input NPZ]
+	                     [-w,--workers W] [-o,--output NPZ]
+
+
+DESCRIPTION
+
+	Compute the similarity of every pair of users from the sequences of
+	shared locations in a location hierarchy written by cluster.py, and
+	save it as a sparse matrix indexed by user id.
+
+
+ARGUMENTS
+
+	-h, --help          show this help message and exit
+	-v, --verbose       verbose output
+	-i, --input         .npz location hierarchy written by cluster.py
+	-o, --output        path of the .npz sparse similarity matrix to write
+	-w, --workers       number of processes comparing users in parallel
+	--time-ratio        largest relative difference between travel times
+	--max-location-users  ignore locations visited by more users than this
+
+
+AUTHOR
+
+	Doug McGeehan <djmvfb@mst.edu>
+
+
+LICENSE
+
+	Copyright 2017 Doug McGeehan - GNU GPLv3
+
+"""
+from gps2staypoint import config
+
+__appname__ = "gps2staypoint"
+__author__ = "Doug McGeehan"
+__version__ = "0.0pre0"
+__license__ = "GNU GPLv3"
+
+import logging
+logger = logging.getLogger(__appname__)
+
+import argparse
+import os
+
+from scipy import sparse
+
+from gps2staypoint import cli
+from gps2staypoint import similarity
+from gps2staypoint.clustering import LocationHierarchy
+
+
+def main(args):
+    logger.info('Reading locations from {}'.format(args.input))
+    hierarchy = LocationHierarchy.load(args.input)
+
+    matrix = similarity.similarity_matrix(
+        hierarchy,
+        workers=args.workers,
+        time_ratio=args.time_ratio,
+        max_location_users=args.max_location_users
+    )
+
+    directory = os.path.dirname(args.output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    sparse.save_npz(args.output, matrix)
+    logger.info('Saved {} similar pairs of users to {}'.format(
+        matrix.nnz // 2, args.output
+    ))
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(
+        description="Compute the similarity of every pair of users from "
+                    "their sequences of shared locations."
+    )
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        default=False, help='verbose output')
+    parser.add_argument('-i', '--input',
+                        help='location hierarchy written by cluster.py '
+                             '(default: %(default)s)',
+                        default=os.path.join('/tmp', 'locations.npz'))
+    parser.add_argument('-o', '--output',
+                        help='.npz file to write the sparse similarity '
+                             'matrix to (default: %(default)s)',
+                        default=os.path.join('/tmp', 'similarity.npz'))
+    parser.add_argument('-w', '--workers', type=cli.positive_integer,
+                        help='number of processes comparing users '
+                             '(default: 1)',
+                        default=1)
+    parser.add_argument('--time-ratio', type=float,
+                        help='largest difference between two users\' '
+                             'travel times, as a fraction of the longer, for '
+                             'their trips to match (default: %(default)s)',
+                        default=config.SIMILARITY_TRAVEL_TIME_RATIO)
+    parser.add_argument('--max-location-users', type=cli.positive_integer,
+                        help='ignore locations visited by more users than '
+                             'this when looking for similar pairs '
+                             '(default: %(default)s)',
+                        default=config.SIMILARITY_MAX_LOCATION_USERS)
+
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == '__main__':
+    cli.run(main, get_arguments, logger)
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SYNOPSIS
+
+	python sweep.py [-h,--help] [-v,--verbose] [--distance D1,D2,...]
+	                [--time T1,T2,...] [-o,--output CSV]
+
+
+DESCRIPTION
+
+	Extract staypoints for every pair of distance and time thresholds,
+	reading each GPS trajectory only once, into a single CSV table keyed
+	by the threshold pair.
+
+
+ARGUMENTS
+
+	-h, --help          show this help message and exit
+	-v, --verbose       verbose output
+	--distance          comma-separated distance thresholds in meters
+	--time              comma-separated time thresholds, e.g. 3m,20m,30m
+	-o, --output        path of the CSV table to write
+
+
+AUTHOR
+
+	Doug McGeehan <djmvfb@mst.edu>
+
+
+LICENSE
+
+	Copyright 2017 Doug McGeehan - GNU GPLv3
+
+"""
+from gps2staypoint import config
+
+__appname__ = "gps2staypoint"
+__author__ = "Doug McGeehan"
+__version__ = "0.0pre0"
+__license__ = "GNU GPLv3"
+
+import progressbar
+progressbar.streams.wrap_stderr()
+
+import logging
+logger = logging.getLogger(__appname__)
+
+import argparse
+import csv
+import functools
+import multiprocessing
+import os
+
+from gps2staypoint import cli
+from gps2staypoint import discovery
+from gps2staypoint import gps
+from gps2staypoint import sweep
+from gps2staypoint.readers.cache import PLTCache
+from gps2staypoint.readers.plt import PLTFileReader
+
+
+def main(args):
+    settings = functools.partial(configure,
+                                 distance_metric=args.distance_metric,
+                                 cache_directory=args.cache_directory)
+    settings()
+
+    logger.info('Locating GPS Files')
+    plt_files = discovery.find_plt_files(args.input_directory)
+
+    logger.info('Grouping GPS Files by User')
+    users = discovery.group_by_user(plt_files)
+    for user in users.values():
+        user.show_progress = False
+
+    logger.info('Sweeping {} distance and {} time thresholds'.format(
+        len(args.distance), len(args.time)
+    ))
+    work = functools.partial(sweep_user,
+                             distance_thresholds=args.distance,
+                             time_thresholds=args.time)
+    failed_users = []
+    with open(args.output, 'w', newline='') as output_file, \
+            progressbar.ProgressBar(max_value=len(users)) as progress:
+        writer = csv.writer(output_file)
+        writer.writerow(sweep.SWEEP_FIELDS)
+
+        if args.workers > 1:
+            pool = multiprocessing.Pool(processes=args.workers,
+                                        initializer=settings)
+            results = pool.imap(work, users.values())
+        else:
+            pool = None
+            results = map(work, users.values())
+
+        for i, (user_id, rows, error) in enumerate(results, start=1):
+            if error is None:
+                writer.writerows(rows)
+            else:
+                failed_users.append(user_id)
+            progress.update(i)
+
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    logger.info('Saved sweep to {}'.format(args.output))
+    if failed_users:
+        logger.error('{} users could not be processed: {}'.format(
+            len(failed_users), ', '.join(map(str, failed_users))
+        ))
+
+
+def configure(distance_metric, cache_directory):
+    config.StayPointConfiguration.DISTANCE_METRIC = distance_metric
+    if cache_directory is not None:
+        PLTFileReader.CACHE = PLTCache(directory=cache_directory)
+
+
+def sweep_user(user, distance_thresholds, time_thresholds):
+    '''Sweep every threshold pair over each of a user's trajectories,
+    returning the resulting table rows.
+    '''
+    metric = gps.get_distance_metric()
+    rows = []
+    try:
+        for trajectory in user.iter_trajectories():
+            latitudes, longitudes, timestamps = trajectory.as_arrays()
+            ranges = sweep.sweep_staypoint_ranges(
+                latitudes=latitudes,
+                longitudes=longitudes,
+                timestamps=timestamps,
+                distance_thresholds=distance_thresholds,
+                time_thresholds=time_thresholds,
+                metric=metric,
+            )
+            rows.extend(sweep.sweep_rows(user=user.id,
+                                         trajectory=trajectory.id,
+                                         sweep=ranges))
+
+    except Exception as e:
+        logger.exception('Failed to process user #{}'.format(user.id))
+        return user.id, rows, repr(e)
+
+    return user.id, rows, None
+
+
+def get_arguments():
+    parser = argparse.ArgumentParser(
+        description="Extract staypoints from a collection of .plt "
+                    "GPS trajectory files for a grid of thresholds."
+    )
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        default=False, help='verbose output')
+    parser.add_argument('-i', '--input-directory', type=cli.existing_directory,
+                        help='directory containing .plt files',
+                        default=config.DEFAULT_GEOLIFE_DIRECTORY)
+    parser.add_argument('--distance', type=sweep.parse_distances,
+                        help='comma-separated distance thresholds in meters '
+                             '(default: {})'.format(
+                            config.StayPointConfiguration.DISTANCE_THRESHOLD
+                        ),
+                        default=[float(
+                            config.StayPointConfiguration.DISTANCE_THRESHOLD
+                        )])
+    parser.add_argument('--time', type=sweep.parse_durations,
+                        help='comma-separated time thresholds, suffixed with '
+                             's, m or h (default: {})'.format(
+                            config.StayPointConfiguration.TIME_THRESHOLD
+                        ),
+                        default=[config.StayPointConfiguration.TIME_THRESHOLD])
+    parser.add_argument('-o', '--output',
+                        help='CSV file to write the staypoint table to',
+                        default=os.path.join('/tmp', 'staypoint_sweep.csv'))
+    parser.add_argument('-w', '--workers', type=cli.positive_integer,
+                        help='number of users to process in parallel '
+                             '(default: 1)',
+                        default=1)
+    parser.add_argument('-d', '--distance-metric',
+                        choices=sorted(gps.DISTANCE_METRICS),
+                        help='distance between GPS points (default: '
+                             '{})'.format(
+                            config.StayPointConfiguration.DISTANCE_METRIC
+                        ),
+                        default=config.StayPointConfiguration.DISTANCE_METRIC)
+    parser.add_argument('-c', '--cache-directory',
+                        help='reuse parsed .plt files cached in this '
+                             'directory (default: {})'.format(
+                            config.PLT_CACHE_DIRECTORY
+                        ),
+                        default=config.PLT_CACHE_DIRECTORY)
+
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == '__main__':
+    cli.run(main, get_arguments, logger)
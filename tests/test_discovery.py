@@ -0,0 +1,90 @@
+import datetime
+import os
+
+import numpy
+
+from benchmarks import synthetic
+from gps2staypoint import discovery
+from gps2staypoint.readers import timestamp
+from gps2staypoint.readers.index import PLTIndex
+from tests.trajectories import START
+
+
+def write_plt(path, point_count, start):
+    timestamps = start + 5 * numpy.arange(point_count)
+    synthetic.write_plt(path, numpy.full(point_count, 39.9),
+                        numpy.full(point_count, 116.4),
+                        numpy.zeros(point_count), timestamps)
+
+
+def test_streaming_re_probes_files_modified_since_indexing(tmp_path):
+    directory = tmp_path / 'Data' / '000' / 'Trajectory'
+    directory.mkdir(parents=True)
+    path = str(directory / '20081023025304.plt')
+    write_plt(path, point_count=10, start=START)
+
+    index = PLTIndex(path=str(tmp_path / 'index.json'))
+    index.update(discovery.find_plt_files(str(tmp_path)))
+
+    write_plt(path, point_count=25, start=START + 3600)
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    user, = discovery.iter_users(str(tmp_path), index=index)
+    reader, = user.gps_logs
+    assert len(reader) == 25
+    assert reader.start_time == timestamp.EPOCH + datetime.timedelta(
+        seconds=START + 3600
+    )
+    assert index.is_current(path)
+
+
+def write_corrupt_tree(root):
+    '''User 000 with a good, a header-only and a garbage file, and user 001
+    with only a garbage file.
+    '''
+    for user in ('000', '001'):
+        (root / 'Data' / user / 'Trajectory').mkdir(parents=True)
+    trajectories = root / 'Data' / '000' / 'Trajectory'
+    write_plt(str(trajectories / '20081023025304.plt'), point_count=10,
+              start=START)
+    (trajectories / '20081024000000.plt').write_text(synthetic.HEADER)
+    (trajectories / '20081025000000.plt').write_text(
+        synthetic.HEADER + 'not,a,gps,record\r\n'
+    )
+    (root / 'Data' / '001' / 'Trajectory' / '20081023025304.plt').write_text(
+        'garbage'
+    )
+
+
+def test_group_by_user_skips_unreadable_files(tmp_path):
+    write_corrupt_tree(tmp_path)
+    users = discovery.group_by_user(discovery.find_plt_files(str(tmp_path)))
+    assert list(users) == [0]
+    reader, = users[0].gps_logs
+    assert reader.path.endswith('20081023025304.plt')
+
+
+def test_iter_users_skips_unreadable_files(tmp_path):
+    write_corrupt_tree(tmp_path)
+    user, = discovery.iter_users(str(tmp_path))
+    assert user.id == 0
+    assert len(user.gps_logs) == 1
+
+
+def test_index_records_unreadable_files(tmp_path):
+    write_corrupt_tree(tmp_path)
+    plt_files = discovery.find_plt_files(str(tmp_path))
+    index = PLTIndex(path=str(tmp_path / 'index.json'))
+    assert index.update(plt_files, workers=2) == 4
+
+    errors = [path for path in plt_files if index.error(path) is not None]
+    assert len(errors) == 3
+    users = discovery.group_by_user(plt_files, index=index)
+    assert list(users) == [0]
+    assert len(users[0].gps_logs) == 1
+
+    # Unreadable files are not probed again until they change
+    assert index.update(plt_files) == 0
+    user, = discovery.iter_users(str(tmp_path), index=index)
+    assert len(user.gps_logs) == 1
@@ -0,0 +1,82 @@
+'''The array engine must find exactly the staypoints the iterative builder
+finds.
+'''
+import datetime
+
+import numpy
+import pytest
+
+from benchmarks import synthetic
+from gps2staypoint import config
+from gps2staypoint import gps
+from gps2staypoint.staypoint import ArrayStaypointBuilder
+from gps2staypoint.staypoint import StaypointBuilder
+from tests.trajectories import START
+from tests.trajectories import dwell_then_leave
+from tests.trajectories import make_trajectory
+
+
+@pytest.fixture(params=sorted(gps.DISTANCE_METRICS))
+def metric(request, monkeypatch):
+    monkeypatch.setattr(config.StayPointConfiguration, 'DISTANCE_METRIC',
+                        request.param)
+    return request.param
+
+
+def summary(staypoints):
+    return [(s.start, s.stop, s.location, s.arrival_seconds,
+             s.departure_seconds) for s in staypoints]
+
+
+def assert_engines_agree(trajectory):
+    iterative = StaypointBuilder(trajectory).extract_staypoints()
+    array = ArrayStaypointBuilder(trajectory).extract_staypoints()
+    assert summary(array) == summary(iterative)
+    return iterative
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_synthetic_trajectories(metric, seed):
+    random = numpy.random.RandomState(seed)
+    latitudes, longitudes, _, timestamps = synthetic.generate_points(
+        random, 3000, START, synthetic.ORIGIN
+    )
+    staypoints = assert_engines_agree(
+        make_trajectory(latitudes, longitudes, timestamps)
+    )
+    assert staypoints
+
+
+def test_staypoint_closed_by_the_last_point(metric):
+    assert len(assert_engines_agree(dwell_then_leave())) == 1
+
+
+def test_staypoint_still_open_at_the_end(metric):
+    # Neither engine emits the staypoint being built when the points run
+    # out
+    trajectory = dwell_then_leave()
+    trajectory.points = trajectory.points[:20]
+    assert assert_engines_agree(trajectory) == []
+
+
+def test_single_point(metric):
+    trajectory = make_trajectory([39.9], [116.4], [START])
+    assert assert_engines_agree(trajectory) == []
+
+
+def test_empty_trajectory(metric):
+    assert assert_engines_agree(make_trajectory([], [], [])) == []
+
+
+def test_identical_timestamps(metric, monkeypatch):
+    monkeypatch.setattr(config.StayPointConfiguration, 'TIME_THRESHOLD',
+                        datetime.timedelta(0))
+    # Two dwells of repeated timestamps, each left by a 500 meter jump
+    latitudes = [39.9] * 4 + [39.9045] * 3 + [39.909]
+    longitudes = [116.4] * 8
+    timestamps = [START] * 4 + [START + 60] * 3 + [START + 60]
+    staypoints = assert_engines_agree(
+        make_trajectory(latitudes, longitudes, timestamps)
+    )
+    assert [(s.start, s.stop) for s in staypoints] == [(0, 4), (4, 7)]
+    assert all(s.duration.total_seconds() == 0 for s in staypoints)
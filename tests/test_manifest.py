@@ -0,0 +1,48 @@
+import pytest
+
+from gps2staypoint import config
+from gps2staypoint.manifest import ShardManifest
+from gps2staypoint.manifest import merge_shards
+from gps2staypoint.manifest import shard_manifest_path
+
+ROW = ('000', '000_1-2', 39.9, 116.4, 1, 2, 1, 2, 3.0)
+
+
+def run_shard(directory, index, count, user):
+    manifest = ShardManifest(shard_manifest_path(directory, index, count))
+    manifest.start()
+    manifest.record(user, 'fingerprint', outputs=[],
+                    rows=[('{:0>3}'.format(user),) + ROW[1:]])
+    manifest.finish()
+    manifest.close()
+
+
+def test_merge_shards(tmpdir):
+    directory = str(tmpdir)
+    run_shard(directory, 0, 2, user=0)
+    run_shard(directory, 1, 2, user=1)
+
+    rows, failed_users = merge_shards(directory, 2)
+    assert [row[0] for row in rows] == ['000', '001']
+    assert failed_users == []
+
+
+def test_merge_shards_refuses_unfinished_shards(tmpdir):
+    directory = str(tmpdir)
+    run_shard(directory, 0, 2, user=0)
+
+    with pytest.raises(ValueError, match='1/2'):
+        merge_shards(directory, 2)
+
+
+def test_merge_shards_refuses_differing_settings(tmpdir, monkeypatch):
+    directory = str(tmpdir)
+    run_shard(directory, 0, 3, user=0)
+    run_shard(directory, 1, 3, user=1)
+    monkeypatch.setattr(config.StayPointConfiguration, 'DISTANCE_THRESHOLD',
+                        config.StayPointConfiguration.DISTANCE_THRESHOLD * 2)
+    run_shard(directory, 2, 3, user=2)
+
+    with pytest.raises(ValueError, match='different settings') as error:
+        merge_shards(directory, 3)
+    assert str(error.value).endswith(': 2/3')
@@ -0,0 +1,102 @@
+import multiprocessing
+import os
+import tracemalloc
+from xml.etree import ElementTree
+
+import pytest
+
+from gps2staypoint import pipeline
+from tests.trajectories import dwell_then_leave
+
+PAYLOAD_SIZE = 1024 * 1024
+
+
+class Payload(object):
+    '''Like a discovered user, large in memory but small once pickled.'''
+    def __init__(self):
+        self.data = bytearray(PAYLOAD_SIZE)
+
+    def __reduce__(self):
+        return int, (len(self.data),)
+
+
+def payload_size(size):
+    return size
+
+
+@pytest.fixture(scope='module')
+def pool():
+    with multiprocessing.Pool(processes=2) as pool:
+        yield pool
+
+
+def test_imap_bounded_keeps_order(pool):
+    results = pipeline.imap_bounded(pool, abs, range(0, -50, -1), window=4)
+    assert list(results) == list(range(50))
+
+
+def test_imap_bounded_reads_ahead_at_most_window_items(pool):
+    pulled = []
+
+    def items():
+        for i in range(50):
+            pulled.append(i)
+            yield i
+
+    for i, _ in enumerate(pipeline.imap_bounded(pool, abs, items(),
+                                                window=4)):
+        assert len(pulled) <= i + 4
+
+
+def test_peak_memory_stays_flat_however_many_items(pool):
+    '''Like users streamed from discovery, each item takes memory until a
+    worker is done with it; peak memory must depend on the window, not on
+    how many items there are.
+    '''
+    def items(count):
+        for _ in range(count):
+            yield Payload()
+
+    peaks = []
+    for count in (20, 80):
+        tracemalloc.start()
+        try:
+            for size in pipeline.imap_bounded(pool, payload_size,
+                                              items(count), window=4):
+                assert size == PAYLOAD_SIZE
+            peaks.append(tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+
+    assert max(peaks) < 8 * PAYLOAD_SIZE
+    assert peaks[1] < 1.5 * peaks[0]
+
+
+def test_write_user_kml_saves_a_complete_document(tmpdir):
+    path = str(tmpdir.join('000', 'user.kml'))
+    trajectories = [dwell_then_leave(), dwell_then_leave()]
+    results = ((trajectory, []) for trajectory in trajectories)
+    written = list(pipeline.write_user_kml(results, path))
+
+    assert len(written) == 2
+    document = ElementTree.parse(path).getroot()
+    assert len(document.findall('.//{*}Folder')) == 2
+    assert os.listdir(os.path.dirname(path)) == ['user.kml']
+
+
+def test_write_user_kml_discards_the_file_on_error(tmpdir):
+    path = str(tmpdir.join('000', 'user.kml'))
+    os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as previous:
+        previous.write('previous run')
+
+    def results():
+        yield dwell_then_leave(), []
+        raise ValueError('unreadable trajectory')
+
+    with pytest.raises(ValueError):
+        list(pipeline.write_user_kml(results(), path))
+
+    with open(path) as kml_file:
+        assert kml_file.read() == 'previous run'
+    assert os.listdir(os.path.dirname(path)) == ['user.kml']
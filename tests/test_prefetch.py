@@ -0,0 +1,102 @@
+import os
+
+import numpy
+import pytest
+
+from gps2staypoint.readers.plt import PLTColumns
+from gps2staypoint.readers.plt import PLTFileReader
+from gps2staypoint.readers.prefetch import PLTPrefetcher
+from tests.test_discovery import write_plt
+from tests.trajectories import START
+
+
+@pytest.fixture
+def readers(tmp_path):
+    directory = tmp_path / 'Data' / '000' / 'Trajectory'
+    directory.mkdir(parents=True)
+    readers = []
+    for i in range(4):
+        path = str(directory / '2008102{}000000.plt'.format(i))
+        write_plt(path, point_count=10 + i, start=START + 86400 * i)
+        readers.append(PLTFileReader(path))
+    return readers
+
+
+@pytest.fixture
+def prefetcher():
+    prefetcher = PLTPrefetcher(depth=2, memory_limit=10 ** 9, threads=2)
+    yield prefetcher
+    prefetcher.close()
+
+
+def assert_same_columns(columns, other):
+    for field in ('latitude', 'longitude', 'altitude', 'timestamp'):
+        numpy.testing.assert_array_equal(getattr(columns, field),
+                                         getattr(other, field))
+
+
+def test_take_returns_the_columns_of_a_direct_read(readers, prefetcher):
+    prefetcher.add(readers)
+    for reader in readers:
+        assert_same_columns(
+            prefetcher.take(reader),
+            PLTColumns.from_file(reader.path, reader.HEADER_LINE_COUNT)
+        )
+    assert len(prefetcher) == 0
+    assert prefetcher.memory == 0
+
+
+def test_depth_limit(readers, prefetcher):
+    prefetcher.add(readers)
+    assert list(prefetcher.pending) == readers[:2]
+    assert list(prefetcher.waiting) == readers[2:]
+
+    prefetcher.take(readers[0])
+    assert list(prefetcher.pending) == readers[1:3]
+    assert prefetcher.memory == sum(os.path.getsize(r.path)
+                                    for r in readers[1:3])
+
+
+def test_memory_limit_allows_one_file(readers):
+    size = os.path.getsize(readers[0].path)
+    for memory_limit in (0, size):
+        prefetcher = PLTPrefetcher(depth=4, memory_limit=memory_limit,
+                                   threads=1)
+        try:
+            prefetcher.add(readers)
+            assert list(prefetcher.pending) == readers[:1]
+            assert prefetcher.memory == size
+
+            prefetcher.take(readers[0])
+            assert list(prefetcher.pending) == readers[1:2]
+        finally:
+            prefetcher.close()
+        assert prefetcher.memory == 0
+
+
+def test_skipped_files_are_discarded(readers, prefetcher):
+    prefetcher.add(readers)
+    assert prefetcher.take(readers[1]) is not None
+    assert readers[0] not in prefetcher.pending
+    assert list(prefetcher.pending) == readers[2:]
+    # A discarded file is read by its reader itself
+    assert prefetcher.take(readers[0]) is None
+
+    # Taking a file still waiting to be submitted drops everything before
+    # it, and leaves reading it to the caller
+    prefetcher.take(readers[2])
+    assert list(prefetcher.pending) == readers[3:]
+    prefetcher.add(readers[:3])
+    assert list(prefetcher.pending) == [readers[3], readers[0]]
+    assert prefetcher.take(readers[1]) is None
+    assert list(prefetcher.pending) == readers[2:3]
+    assert len(prefetcher) == 1
+    assert prefetcher.memory == os.path.getsize(readers[2].path)
+
+
+def test_close_forgets_every_file(readers, prefetcher):
+    prefetcher.add(readers)
+    prefetcher.close()
+    assert len(prefetcher) == 0
+    assert prefetcher.memory == 0
+    assert prefetcher.take(readers[0]) is None
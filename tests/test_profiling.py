@@ -0,0 +1,54 @@
+import threading
+import time
+
+import numpy
+import pytest
+
+from gps2staypoint import profiling
+
+
+def test_threads_keep_their_own_stages():
+    profile = profiling.Profile()
+    entered = threading.Event()
+    exited = threading.Event()
+
+    def parse():
+        with profile.stage('parse'):
+            entered.set()
+            exited.wait()
+            time.sleep(0.05)
+
+    thread = threading.Thread(target=parse)
+    profile.enter('segmentation')
+    thread.start()
+    entered.wait()
+    # Leaves the main thread's stage while the other thread's is open
+    profile.exit()
+    exited.set()
+    thread.join()
+
+    stages = profile.report()['stages']
+    assert stages['segmentation']['calls'] == 1
+    assert stages['parse']['calls'] == 1
+    assert stages['segmentation']['seconds'] < 0.05
+    assert stages['parse']['seconds'] >= 0.05
+
+
+def test_each_stage_reports_its_own_peak_rss():
+    profile = profiling.Profile()
+    if profile.peak_rss_scope != 'stage':
+        pytest.skip('the peak resident set size cannot be reset here')
+    size = 256 * 1024 * 1024
+
+    with profile.stage('parse'):
+        numpy.ones(size // 8)
+    with profile.stage('write'):
+        with profile.stage('extraction'):
+            numpy.ones(size // 16)
+
+    # Each peak is above whatever the process held before by about as much
+    # as the stage allocated
+    peaks = dict((name, statistics['peak_rss'])
+                 for name, statistics in profile.report()['stages'].items())
+    assert peaks['parse'] - peaks['extraction'] > size // 4
+    assert peaks['extraction'] - peaks['write'] > size // 4
@@ -0,0 +1,73 @@
+import numpy
+import pytest
+
+from gps2staypoint.similarity import LocationSequence
+from gps2staypoint.similarity import candidate_pairs
+from gps2staypoint.similarity import sequence_similarity
+
+IDFS = {1: 1.0, 2: 2.0, 3: 0.5}
+
+
+def sequence(visits):
+    '''A sequence of (location, arrival, departure) visits.'''
+    locations, arrivals, departures = zip(*visits)
+    return LocationSequence(locations=numpy.array(locations),
+                            arrivals=numpy.array(arrivals),
+                            departures=numpy.array(departures))
+
+
+def test_shared_run_scores_twice_its_locations():
+    a = sequence([(1, 0, 100), (2, 200, 300)])
+    assert sequence_similarity(a, a, IDFS, time_ratio=0.2) \
+        == pytest.approx(2 * (1.0 + 2.0) / 4)
+
+
+def test_travel_time_excludes_the_dwell():
+    # Both take 100 seconds to get from location 1 to 2, however long they
+    # stayed at 1
+    a = sequence([(1, 0, 1000), (2, 1100, 1200)])
+    b = sequence([(1, 0, 100), (2, 200, 300)])
+    assert sequence_similarity(a, b, IDFS, time_ratio=0.2) \
+        == pytest.approx(2 * (1.0 + 2.0) / 4)
+
+
+def test_dissimilar_travel_times_break_the_run():
+    a = sequence([(1, 0, 100), (2, 1100, 1200)])
+    b = sequence([(1, 0, 100), (2, 200, 300)])
+    assert sequence_similarity(a, b, IDFS, time_ratio=0.2) \
+        == pytest.approx((1.0 + 2.0) / 4)
+
+
+def test_unshared_locations_score_nothing():
+    a = sequence([(1, 0, 100)])
+    b = sequence([(2, 0, 100), (3, 200, 300)])
+    assert sequence_similarity(a, b, IDFS, time_ratio=0.2) == 0
+
+
+def test_candidate_pairs():
+    fine = {
+        0: sequence([(1, 0, 1), (2, 2, 3)]),
+        1: sequence([(1, 0, 1)]),
+        2: sequence([(2, 0, 1), (3, 2, 3)]),
+        3: sequence([(3, 0, 1)]),
+        4: sequence([(4, 0, 1)]),
+    }
+    # Users 0 and 1 share a location again at the coarser level
+    coarse = {0: sequence([(1, 0, 3)]), 1: sequence([(1, 0, 1)])}
+    idfs = {1: 1.0, 2: 1.0, 3: 1.0, 4: 0.0}
+
+    pairs = candidate_pairs([fine, coarse], [idfs, idfs])
+    assert list(pairs) == [(0, 1), (0, 2), (2, 3)]
+
+
+def test_candidate_pairs_leave_out_popular_and_worthless_locations():
+    sequences = dict((user, sequence([(1, 0, 1), (2, 2, 3)]))
+                     for user in range(3))
+    sequences[3] = sequence([(2, 0, 1)])
+
+    pairs = candidate_pairs([sequences], [{1: 1.0, 2: 1.0}],
+                            max_location_users=3)
+    assert list(pairs) == [(0, 1), (0, 2), (1, 2)]
+
+    pairs = candidate_pairs([sequences], [{1: 1.0, 2: 0.0}])
+    assert list(pairs) == [(0, 1), (0, 2), (1, 2)]
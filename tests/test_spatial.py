@@ -0,0 +1,25 @@
+from gps2staypoint.spatial import StaypointIndex
+
+
+def make_index(longitudes):
+    count = len(longitudes)
+    return StaypointIndex(users=range(count),
+                          trajectories=['t'] * count,
+                          latitudes=[-17.0] * count,
+                          longitudes=longitudes,
+                          arrivals=range(count),
+                          departures=range(count))
+
+
+def longitudes_in_bounds(index, *bounds):
+    return sorted(index.longitudes[index.in_bounds(*bounds)].tolist())
+
+
+def test_in_bounds_across_the_antimeridian():
+    index = make_index([179.5, 179.99, -179.99, -179.5, 0.0, 178.0, -178.0])
+
+    assert longitudes_in_bounds(index, -18, 179, -16, -179) == \
+        [-179.99, -179.5, 179.5, 179.99]
+    assert longitudes_in_bounds(index, -18, -179, -16, 179) == \
+        [-178.0, 0.0, 178.0]
+    assert longitudes_in_bounds(index, -16.5, 179, -16, -179) == []
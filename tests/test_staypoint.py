@@ -0,0 +1,51 @@
+import pytest
+
+from gps2staypoint.staypoint import StayPoint
+from tests.trajectories import START
+from tests.trajectories import dwell_then_leave
+from tests.trajectories import make_trajectory
+
+
+def test_extent_is_kept_after_release():
+    measured = dwell_then_leave().staypoints[0]
+
+    trajectory = dwell_then_leave()
+    staypoints = trajectory.release()
+    assert len(trajectory) == 0
+    assert len(staypoints) == 1
+
+    staypoint = staypoints[0]
+    assert staypoint.centroid_radius == measured.centroid_radius
+    assert staypoint.radius == pytest.approx(measured.radius)
+    assert 0 < staypoint.radius <= staypoint.centroid_radius < 5
+
+
+def test_staypoint_keeps_no_points():
+    staypoint = dwell_then_leave().release()[0]
+    for name in type(staypoint).__slots__:
+        assert isinstance(getattr(staypoint, name),
+                          (int, float, tuple, type(None)))
+
+
+def test_arrival_and_departure():
+    staypoint = dwell_then_leave(dwell_points=20, interval=30).staypoints[0]
+    assert staypoint.point_count == 20
+    assert staypoint.departure_seconds - staypoint.arrival_seconds == 570
+    assert staypoint.duration.total_seconds() == 570
+
+
+def test_bounds():
+    staypoint = dwell_then_leave().staypoints[0]
+    assert staypoint.bounds == pytest.approx((39.9, 116.4, 39.90002,
+                                              116.40001))
+
+
+def test_bounds_across_the_antimeridian():
+    longitudes = [179.9999, -179.9999, 179.9998, -179.9997]
+    trajectory = make_trajectory(
+        latitudes=[10.0] * 4,
+        longitudes=longitudes,
+        timestamps=[START + 600 * i for i in range(4)],
+    )
+    staypoint = StayPoint.from_range(trajectory.points, 0, 4)
+    assert staypoint.bounds == (10.0, 179.9998, 10.0, -179.9997)
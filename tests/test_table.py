@@ -0,0 +1,43 @@
+import os
+
+import pytest
+
+from gps2staypoint.readers.table import iter_column_chunks
+from gps2staypoint.writers import table
+
+pytest.importorskip('pyarrow')
+
+
+def row(user, latitude):
+    return ('{:0>3}'.format(user), '{:0>3}_1-2'.format(user), latitude,
+            116.4, 1, 2, 1, 2, 3.0)
+
+
+def read_users(path):
+    users = []
+    for chunk in iter_column_chunks(path, format='parquet'):
+        users.extend(int(user) for user in chunk['user'])
+    return sorted(users)
+
+
+def test_parquet_dataset_only_holds_the_last_run(tmpdir):
+    path = str(tmpdir.join('staypoints'))
+    with table.get_table_writer('parquet', path) as writer:
+        writer.write([row(0, 39.9), row(1, 39.9), row(1, 40.0)])
+    assert read_users(path) == [0, 1, 1]
+
+    # User 1 has no staypoints any more, and user 2 is new
+    with table.get_table_writer('parquet', path) as writer:
+        writer.write([row(0, 39.9), row(2, 39.9)])
+    assert read_users(path) == [0, 2]
+    assert sorted(os.listdir(path)) == ['user=000', 'user=002']
+    assert os.listdir(str(tmpdir)) == ['staypoints']
+
+
+def test_empty_parquet_dataset(tmpdir):
+    path = str(tmpdir.join('staypoints'))
+    with table.get_table_writer('parquet', path) as writer:
+        writer.write([row(0, 39.9)])
+    with table.get_table_writer('parquet', path):
+        pass
+    assert os.listdir(path) == []
@@ -0,0 +1,72 @@
+import numpy
+import pytest
+
+from benchmarks import synthetic
+from gps2staypoint.readers.plt import PLTFileReader
+from gps2staypoint.user import GPSUser
+from gps2staypoint.user import TrajectorySequence
+from tests.trajectories import START
+
+
+def write_split_plt(path, start):
+    '''Three runs of ten records, an hour apart, so three trajectories.'''
+    timestamps = numpy.concatenate([start + 3600 * run + 5 * numpy.arange(10)
+                                    for run in range(3)])
+    latitudes = 39.9 + 0.0001 * numpy.arange(len(timestamps))
+    synthetic.write_plt(path, latitudes, numpy.full(len(timestamps), 116.4),
+                        numpy.zeros(len(timestamps)), timestamps)
+
+
+def make_user(tmp_path):
+    directory = tmp_path / 'Data' / '000' / 'Trajectory'
+    directory.mkdir(parents=True)
+    user = GPSUser(id=0)
+    for i, start in enumerate((START, START + 86400)):
+        path = str(directory / '2008102{}000000.plt'.format(i))
+        write_split_plt(path, start)
+        user.add_plt_file(PLTFileReader(path))
+    return user
+
+
+def records(trajectory):
+    latitudes, _, timestamps = trajectory.as_arrays()
+    return latitudes.tolist(), timestamps.tolist()
+
+
+def test_len_and_indexing(tmp_path):
+    trajectories = TrajectorySequence(make_user(tmp_path))
+    assert len(trajectories) == 6
+
+    every = [records(t) for t in trajectories]
+    assert records(trajectories[-1]) == every[5]
+    assert records(trajectories[-6]) == every[0]
+    assert [records(t) for t in trajectories[1:5:2]] == [every[1], every[3]]
+    assert [records(t) for t in trajectories[-2:]] == every[4:]
+    with pytest.raises(IndexError):
+        trajectories[6]
+
+    trajectory = trajectories[2]
+    assert len(trajectory) == 10
+    assert trajectory[-1].epoch_seconds == START + 7200 + 45
+    assert [p.epoch_seconds for p in trajectory[1:3]] == \
+        [START + 7200 + 5, START + 7200 + 10]
+    assert [p.epoch_seconds for p in trajectory] == every[2][1]
+
+
+def test_evicted_trajectories_are_reread(tmp_path):
+    trajectories = TrajectorySequence(make_user(tmp_path), max_cached=1)
+    every = [records(t) for t in trajectories]
+
+    assert [records(trajectories[i]) for i in range(6)] == every
+    trajectories.evict()
+    assert [records(t) for t in trajectories] == every
+
+
+def test_cached_columns_own_their_arrays(tmp_path):
+    trajectories = TrajectorySequence(make_user(tmp_path))
+    for i in range(len(trajectories)):
+        columns = trajectories.columns(i)
+        assert len(columns) == 10
+        for array in (columns.latitude, columns.longitude, columns.altitude,
+                      columns.timestamp):
+            assert array.flags.owndata
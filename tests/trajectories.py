@@ -0,0 +1,35 @@
+'''Trajectories built straight from arrays, for the tests.'''
+import numpy
+
+from gps2staypoint.gps import GPSTrajectory
+from gps2staypoint.readers.plt import PLTColumnPoint
+from gps2staypoint.readers.plt import PLTColumns
+from gps2staypoint.user import GPSUser
+
+# 2008-10-23 02:53:04, the first record of GeoLife user 000
+START = 1224730384
+
+
+def make_trajectory(latitudes, longitudes, timestamps, user_id=0):
+    columns = PLTColumns(
+        latitude=numpy.asarray(latitudes, dtype=numpy.float64),
+        longitude=numpy.asarray(longitudes, dtype=numpy.float64),
+        altitude=numpy.zeros(len(timestamps)),
+        timestamp=numpy.asarray(timestamps, dtype=numpy.int64),
+    )
+    trajectory = GPSTrajectory(user=GPSUser(id=user_id))
+    trajectory.points = [PLTColumnPoint(columns=columns, index=i)
+                         for i in range(len(columns))]
+    return trajectory
+
+
+def dwell_then_leave(dwell_points=20, interval=30):
+    '''A trajectory that stays within a few meters for dwell_points records,
+    then walks away 200 meters per record for five more.
+    '''
+    latitudes = [39.9 + 0.00001 * (i % 3) for i in range(dwell_points)] \
+                + [39.9 + 0.0018 * (i + 1) for i in range(5)]
+    longitudes = [116.4 + 0.00001 * (i % 2) for i in range(dwell_points)] \
+                 + [116.4] * 5
+    timestamps = [START + interval * i for i in range(dwell_points + 5)]
+    return make_trajectory(latitudes, longitudes, timestamps)